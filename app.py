@@ -1,34 +1,71 @@
 import streamlit as st
 import sys
-import openai
-import gspread
-from google.oauth2.service_account import Credentials
 import uuid
 import time
 from datetime import datetime
 from zoneinfo import ZoneInfo
 import os
-import random
-
-from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain_openai import ChatOpenAI
-from langchain_community.document_loaders import PyPDFLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_core.documents import Document
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_community.vectorstores import FAISS
-from langchain.chains.combine_documents import create_stuff_documents_chain
-from langchain.chains import create_retrieval_chain, create_history_aware_retriever
-from langchain_core.messages import HumanMessage, AIMessage
+import hmac
+import importlib
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+from outbox import Outbox, OUTBOX_PATH
+from rag_config import PDF_FILE_PATHS, HISTORY_TOKEN_BUDGET, RETRIEVAL_SOCKET_PATH, LLM_ASYNC
+from warmup import Warmup, WARMUP_QUERY
+import tracing
+import async_runtime
+import session_store
+import questionnaire
+
+# Ciężkie biblioteki (LangChain, PyTorch/ONNX, gspread) są importowane dopiero
+# w funkcjach, które ich potrzebują - ekrany zgody i ankiet ładują się od razu.
+# Moduł rag importuje rozgrzewanie w tle albo pierwsze wejście na czat.
+
 
 # --- KONFIGURACJA ---
 
 # Konfiguracja arkusza google do zapisu danych
 SHEET_ID = "1LnCkrWY271w2z3VSMAVaKqqr7U4hqGppDTVuHvT5sdc"
 SHEET_NAME = "Arkusz1"
+# Co ile sekund wątek w tle zapisuje zebrane dane do arkusza
+SHEETS_FLUSH_INTERVAL = 2.0
+
+# Czy odpowiedzi Vincenta mają być wyświetlane na bieżąco, token po tokenie
+STREAM_RESPONSES = True
+
+# Komunikaty podczas czekania na odpowiedź, według stanu wywołań modelu (llm_governor.track),
+# i co ile sekund wątek skryptu sprawdza ten stan
+LLM_WAIT_MESSAGES = {
+    "queued": "_Dużo osób rozmawia teraz z Vincentem – Twoja wiadomość czeka w kolejce..._",
+    "retry": "_Vincent potrzebuje chwili dłużej..._",
+}
+LLM_WAIT_DEFAULT_MESSAGE = "_Vincent myśli..._"
+LLM_WAIT_POLL_S = 0.25
+
+# Po ilu minutach rozmowy pojawia się przycisk "Zakończ rozmowę" i co ile sekund odświeża się licznik
+CHAT_END_AFTER_MIN = 0.1
+CHAT_COUNTDOWN_REFRESH_S = 15
+
+# Etap rozgrzewania z połączeniem do arkusza (rozmowa na niego nie czeka) i jak długo
+# chat_screen czeka na pozostałe etapy, zanim załaduje zasoby sam
+SHEETS_WARMUP_STAGE = "sheets"
+CHAT_WARMUP_TIMEOUT_S = 60
+
+# Parametr adresu z tokenem sesji uczestnika (session_store.py)
+SESSION_PARAM = "sesja"
 
 @st.cache_resource(show_spinner=False)
+@tracing.span("get_sheet")
 def get_sheet():
+    if os.environ.get("VINCENT_FAKE_SHEETS"):
+        # Atrapa arkusza w pamięci do testów obciążeniowych (devtools/fake_sheets.py)
+        from devtools.fake_sheets import get_fake_sheet
+
+        return get_fake_sheet()
+
+    import gspread
+    from google.oauth2.service_account import Credentials
 
     # Dane uwierzytelniające do Google Sheets z Streamlit Secrets
     creds_info = {
@@ -56,285 +93,252 @@ def get_sheet():
     sheet = _gspread_client.open_by_key(SHEET_ID).worksheet(SHEET_NAME)
     return sheet 
 
-# Ładowanie klucza API 
+# Ładowanie klucza API (adres OpenRouter ustawia rag.create_chat_model)
 api_key = st.secrets["OPENROUTER_API_KEY"]
-openai.api_base = "https://openrouter.ai/api/v1"
-openai.api_key  = api_key
-
-# Ścieżki do plików PDF używanych do RAG 
-PDF_FILE_PATHS = [
-    "docs/The Mindful Self-Compassion Workbook A Proven Way to Accept Yourself, Build Inner Strength, and Thrive.pdf",
-    "docs/Self-Compassion The Proven Power of Being Kind to Yourself.pdf"
-]
-# Ścieżka do zapisanego indeksu FAISS
-FAISS_INDEX_PATH = "./faiss_vector_store_rag"
-
-# Elementy pytań do ankiet (PANAS, Samowspółczucie, Postawa wobec AI)
-panas_positive_items = ["Zainteresowany/a", "Zainspirowany/a", "Spokojny/a", "Aktywny/a", "Entuzjastyczny/a"]
-panas_negative_items = ["Zaniepokojony/a", "Przygnębiony/a", "Zestresowany/a", "Nerwowy/a", "Drażliwy/a"]
-self_compassion_items = [
-    "Kiedy nie powiedzie mi się coś ważnego, ogarnia mnie uczucie, że nie jestem taki jak trzeba.",
-    "Staram się być wyrozumiały i cierpliwy w stosunku do tych aspektów mojej osoby, których nie lubię.",
-    "Kiedy zdarza się coś bolesnego, staram się zachować wyważony ogląd sytuacji.",
-    "Gdy jestem przygnębiony, mam zwykle poczucie, że inni ludzie są prawdopodobnie szczęśliwsi ode mnie.",
-    "Staram się patrzeć na swoje wady lub błędy jako na nieodłączny aspekt bycia człowiekiem.",
-    "Kiedy przechodzę przez bardzo trudny okres, staram się być łagodny i troskliwy w stosunku do siebie.",
-    "Kiedy coś mnie denerwuje, staram się zachować równowagę emocjonalną.",
-    "Kiedy nie powiedzie mi się coś ważnego, zazwyczaj czuję się w tym osamotniony.",
-    "Kiedy czuję się przygnębiony, nadmiernie skupiam się na wszystkim, co idzie źle.",
-    "Kiedy czuję się jakoś gorsza/gorszy, staram się pamiętać, że większość ludzi tak ma.",
-    "Jestem krytyczny i mało wyrozumiały wobec moich własnych wad i niedociągnięć.",
-    "Jestem nietolerancyjny i niecierpliwy wobec tych aspektów mojej osoby, których nie lubię."
-]
-ai_attitude_items = {
-    "Sztuczna inteligencja uczyni ten świat lepszym miejscem.": "ai_1",
-    "Sztuczna inteligencja ma więcej wad niż zalet.": "ai_2",
-    "Sztuczna inteligencja oferuje rozwiązania wielu światowych problemów.": "ai_3",
-    "Sztuczna inteligencja raczej tworzy problemy niż je rozwiązuje.": "ai_4"
-}
+
+# Schemat kolumn arkusza - wszystkie pola zapisywane na kolejnych etapach badania
+# (zgoda, pretest, chat, posttest, feedback). Brakujące kolumny są dopisywane
+# na końcu pierwszego wiersza przy pierwszym zapisie. Kolumny ankiet wynikają
+# z ich definicji w questionnaire.py.
+SHEET_COLUMNS = (
+    ["user_id", "group", "timestamp_start", "status", "timestamp_pretest_end"]
+    + questionnaire.columns(questionnaire.PRETEST_SECTIONS, "pre")
+    + ["timestamp_chat_end", "conversation_log", "timestamp_posttest_end"]
+    + questionnaire.columns(questionnaire.POSTTEST_SECTIONS, "post")
+    + ["timestamp_feedback_submit", "feedback_final_positive", "feedback_final_negative"]
+)
 
 # --- FUNKCJE POMOCNICZE ---
+@st.cache_resource(show_spinner=False)
+def get_sheets_writer():
+    # Jeden wątek zapisujący na proces, współdzielony przez wszystkie sesje.
+    # Dane trafiają najpierw do lokalnego outboxa (SQLite) w OUTBOX_PATH.
+    from sheets_writer import SheetsWriter
+
+    return SheetsWriter(get_sheet, Outbox(OUTBOX_PATH), columns=SHEET_COLUMNS, flush_interval=SHEETS_FLUSH_INTERVAL)
+
 def save_to_sheets(data_dict):
     """
-    Akumuluje i zapisuje słownik danych do Google Sheets w jednym wierszu dla danego user_id.
-    Dodaje nowe kolumny, jeśli brakuje ich w arkuszu, BEZ CZYSZCZENIA istniejących danych.
+    Przekazuje słownik danych do zapisu w Google Sheets w jednym wierszu dla danego user_id.
+    Rekord jest najpierw trwale zapisywany w lokalnym outboxie (SQLite), a wątek
+    w tle (SheetsWriter) scala rekordy tego samego user_id i co kilka sekund
+    wysyła je do arkusza paczkami, ponawiając nieudane zapisy.
     Jeśli user_id już istnieje, wiersz jest aktualizowany o nowe dane,
     zachowując istniejące, jeśli nie zostały przesłane nowe wartości.
     Jeśli user_id nie istnieje, tworzony jest nowy wiersz.
+    Wysyłane są tylko pola, które zmieniły się od ostatniego zapisu
+    przyjętego dla tej sesji (st.session_state.saved_fields).
     """
 
-    sheet = get_sheet()
-
     user_id = data_dict.get("user_id")
     if not user_id:
         st.error("Błąd: Próba zapisu danych bez user_id. Proszę odświeżyć stronę lub skontaktować się z badaczem.")
         print("Błąd: Próba zapisu danych bez user_id. Dane nie zostały zapisane.")
         return
 
-    try:
-        current_headers = sheet.row_values(1) # Pobierz nagłówki z pierwszej kolumny
-        
-        # Stwórz listę wszystkich POTENCJALNYCH nagłówków, które powinny być w arkuszu
-        # Zaczynamy od obecnych nagłówków, potem dodajemy te z data_dict, których jeszcze nie ma.
-        all_potential_headers = list(current_headers)
-        for key in data_dict.keys():
-            if key not in all_potential_headers:
-                all_potential_headers.append(key)
-        
-        # Jeśli arkusz jest pusty, wstaw wszystkie nagłówki od razu
-        if not current_headers:
-            sheet.insert_row(all_potential_headers, 1)
-            print(f"Początkowe nagłówki ustawione: {all_potential_headers}")
-            current_headers = all_potential_headers # Uaktualnij nagłówki po wstawieniu
-        else:
-            # Sprawdź, czy brakuje jakichś nagłówków z data_dict w obecnych nagłówkach arkusza
-            headers_to_add = [h for h in all_potential_headers if h not in current_headers]
-            
-            if headers_to_add:
-                # Dodaj brakujące kolumny na koniec arkusza
-                # W gspread najbezpieczniej to zrobić, wstawiając nową listę nagłówków do 1. wiersza
-                # Zostawiamy istniejące dane w spokoju, tylko nagłówki się przesuwają
-                
-                # Pobieramy wszystkie dane z arkusza (oprócz nagłówków)
-                all_records = sheet.get_all_records() # Pobiera dane jako listę słowników
-                
-                # Czyścimy arkusz TYLKO RAZ, żeby wstawić zaktualizowane nagłówki
-                # Jest to bezpieczne, bo wcześniej pobraliśmy wszystkie dane
-                sheet.clear() 
-                sheet.insert_row(all_potential_headers, 1) # Wstawiamy zaktualizowane nagłówki
-                print(f"Nagłówki arkusza zaktualizowane. Dodano: {headers_to_add}")
-                
-                # Wstawiamy z powrotem wszystkie poprzednie dane (jeśli jakieś były)
-                if all_records:
-                    # Konwertujemy listę słowników z powrotem na listę list,
-                    # upewniając się, że kolejność kolumn jest zgodna z nowymi nagłówkami
-                    rows_to_insert = []
-                    for record in all_records:
-                        row = [str(record.get(h, "")) for h in all_potential_headers]
-                        rows_to_insert.append(row)
-                    sheet.append_rows(rows_to_insert)
-                    print(f"Wstawiono ponownie {len(rows_to_insert)} wierszy danych.")
-
-                current_headers = all_potential_headers # Uaktualnij nagłówki po wstawieniu
-
-        # 2. Znajdź wiersz użytkownika lub dodaj nowy
-        user_ids_in_sheet = []
-        user_id_col_index = -1
-        
-        if "user_id" in current_headers:
-            user_id_col_index = current_headers.index("user_id") + 1
-            # sheet.col_values(user_id_col_index) zwróci listę wartości z kolumny user_id
-            # [1:] pomija nagłówek
-            # Jeśli kolumna jest pusta (oprócz nagłówka), user_ids_in_sheet będzie pusta
-            user_ids_in_sheet = sheet.col_values(user_id_col_index)[1:] 
-        else:
-            # Jeśli kolumna 'user_id' w ogóle nie istnieje, to znaczy, że arkusz jest nowy
-            # lub został właśnie wyczyszczony i nagłówki zostały wstawione.
-            # W tym przypadku, user_id_col_index pozostaje -1, a nowy wiersz zostanie dodany.
-            print("Kolumna 'user_id' nie znaleziona. Zostanie dodany nowy wiersz.")
-
-        row_index = -1
-        if user_id_col_index != -1 and user_id in user_ids_in_sheet:
-            row_index = user_ids_in_sheet.index(user_id) + 2 # +1 dla nagłówka, +1 bo lista jest 0-bazowa
-        
-        if row_index != -1:
-            # Użytkownik istnieje, pobierz jego obecne dane
-            existing_row_values = sheet.row_values(row_index)
-            
-            # Stwórz słownik z istniejących danych, żeby łatwo je scalić
-            existing_data_map = {}
-            for i, header in enumerate(current_headers):
-                if i < len(existing_row_values):
-                    existing_data_map[header] = existing_row_values[i]
-                else:
-                    existing_data_map[header] = "" # Uzupełnij puste dla nowo dodanych kolumn (jeśli dodano nowe kolumny, a ten wiersz był już wcześniej)
+    saved_fields = st.session_state.setdefault("saved_fields", {})
+    changed_fields = {
+        key: value for key, value in data_dict.items()
+        if key != "user_id" and (key not in saved_fields or saved_fields[key] != value)
+    }
+    if not changed_fields:
+        return
 
-            # Scal nowe dane z istniejącymi (nowe nadpisują stare dla tych samych kluczy, reszta zostaje)
-            merged_data = {**existing_data_map, **data_dict}
-            
-            # Przygotuj wiersz do aktualizacji w prawidłowej kolejności nagłówków
-            row_to_update = [str(merged_data.get(header, "")) for header in current_headers]
-            sheet.update(f"A{row_index}", [row_to_update])
-            print(f"Dane dla user_id {user_id} zaktualizowane w Google Sheets pomyślnie w wierszu {row_index}.")
-        else:
-            # Użytkownik nie istnieje, dodaj nowy wiersz
-            # Upewnij się, że dodajesz wartości w kolejności current_headers
-            new_row_values = [str(data_dict.get(header, "")) for header in current_headers]
-            sheet.append_row(new_row_values)
-            print(f"Nowe dane dla user_id {user_id} dodane do Google Sheets pomyślnie (nowy wiersz).")
-
-    except gspread.exceptions.APIError as api_e:
-        st.error(f"Błąd API Google Sheets: {api_e}. Sprawdź uprawnienia konta serwisowego i limit zapytań.")
-        print(f"Błąd API Google Sheets: {api_e}")
+    with tracing.span("save_to_sheets", fields=len(changed_fields)):
+        get_sheets_writer().submit({"user_id": user_id, **changed_fields}, stage=data_dict.get("status", "update"))
+    # Rekord jest już trwale w outboxie, więc traktujemy go jako potwierdzony
+    saved_fields.update(changed_fields)
+
+# --- STAN SESJI UCZESTNIKA ---
+@st.cache_resource(show_spinner=False)
+def get_session_store():
+    # Jeden magazyn sesji na proces (SQLite albo Redis, patrz VINCENT_SESSION_STORE)
+    return session_store.open_store()
+
+def restore_session():
+    """
+    Odtwarza stan uczestnika zapisany pod tokenem z adresu strony (?sesja=...),
+    np. po zerwaniu połączenia albo restarcie serwera. Bez tokenu (albo gdy sesja
+    wygasła) nadaje nowy token. Zwraca True, jeśli stan został odtworzony.
+    """
+    token = st.query_params.get(SESSION_PARAM)
+    data = None
+    if token:
+        try:
+            data = get_session_store().load(token)
+        except Exception as e:
+            print(f"Nie udało się odczytać sesji z magazynu: {e}")
+    if data is None:
+        token = session_store.new_token()
+        st.query_params[SESSION_PARAM] = token
+    else:
+        for key, value in data.items():
+            st.session_state[key] = value
+        st.session_state.session_payload = session_store.snapshot(data)
+    st.session_state.session_token = token
+    return data is not None
+
+def save_session():
+    """Zapisuje stan uczestnika w magazynie sesji, jeśli zmienił się od ostatniego zapisu."""
+    token = st.session_state.get("session_token")
+    if not token:
+        return
+    payload = session_store.snapshot(st.session_state)
+    if payload == st.session_state.get("session_payload"):
+        return
+    try:
+        with tracing.span("save_session"):
+            get_session_store().save(token, payload)
+        st.session_state.session_payload = payload
     except Exception as e:
-        st.error(f"Krytyczny błąd podczas zapisu danych do Google Sheets: {e}. Proszę skontaktuj się z badaczem.")
-        print(f"Krytyczny błąd podczas zapisu danych do Google Sheets: {e}")
+        # Badanie trwa dalej; w najgorszym razie po zerwaniu połączenia sesja zacznie się od nowa
+        print(f"Nie udało się zapisać sesji uczestnika {st.session_state.get('user_id')}: {e}")
 
 # --- FUNKCJE RAG (Retrieval Augmented Generation) ---
+# Kosztowne zasoby współdzielone przez wszystkie sesje - ładowane raz na proces
+@st.cache_resource(show_spinner=False)
+def get_embedding_model():
+    import rag
+
+    # Czas embeddingu zapytania trafia do śladów jako "embed_query"
+    return rag.TracedEmbeddings(rag.load_embedding_model())
+
+@st.cache_resource(show_spinner=False)
+def load_vector_store():
+    import rag
+
+    vector_store = rag.load_vector_store(get_embedding_model())
+    if vector_store is None:
+        # Nie zapamiętujemy braku indeksu - po jego zbudowaniu kolejne wywołanie spróbuje ponownie
+        raise FileNotFoundError("Indeks FAISS nie został znaleziony! Uruchom najpierw skrypt 'prepare_rag_data.py'.")
+    return vector_store
+
+def get_vector_store():
+    try:
+        return load_vector_store()
+    except FileNotFoundError as e:
+        st.error(f"Błąd: {e}")
+        st.stop()
+
+@st.cache_resource(show_spinner=False)
+def get_chat_model():
+    import rag
+
+    return rag.create_chat_model(api_key)
+
+@st.cache_resource(show_spinner=False)
+def get_retriever():
+    if RETRIEVAL_SOCKET_PATH:
+        # Model embeddingów i baza wiedzy są we wspólnym procesie (retrieval_service.py);
+        # gdy serwis nie odpowiada, baza wiedzy jest ładowana w tym procesie przy pierwszym zapytaniu
+        from retrieval_service import FallbackRetriever, RemoteRetriever
+
+        return FallbackRetriever(remote=RemoteRetriever(socket_path=RETRIEVAL_SOCKET_PATH),
+                                 local=lambda: load_vector_store().as_retriever())
+    return get_vector_store().as_retriever()
+
 @st.cache_resource(show_spinner=False)
 def setup_rag_system(pdf_file_paths):
     """
     Konfiguruje system RAG, ładując indeks FAISS i model LLM.
     Wykorzystuje @st.cache_resource do cachowania zasobów,
     aby były ładowane tylko raz.
+    Zwraca słownik {wariant: łańcuch} z prekompilowanymi wariantami promptu
+    dla każdej formy zwracania się do użytkownika (patrz rag.GENDER_INSTRUCTIONS).
     """
-    if os.path.exists(FAISS_INDEX_PATH):
-        embedding_model = HuggingFaceEmbeddings(
-            model_name='all-MiniLM-L6-v2',
-            model_kwargs={'device': 'cpu'}
-        )
-        vector_store = FAISS.load_local(FAISS_INDEX_PATH, embedding_model, allow_dangerous_deserialization=True)
-    else:
-        st.error("Błąd: Indeks FAISS nie został znaleziony! Uruchom najpierw skrypt 'prepare_rag_data.py'.")
-        st.stop()
+    import rag
 
-    chat = ChatOpenAI(
-        temperature=0.0,
-        model_name="openai/gpt-4o-mini",
-        openai_api_key=api_key,
-        base_url="https://openrouter.ai/api/v1"
-    )
-
-    # Prompt dla retrivera, który generuje zapytanie do bazy wiedzy na podstawie historii rozmowy
-    history_aware_retriever_prompt = ChatPromptTemplate.from_messages([
-        MessagesPlaceholder(variable_name="chat_history"),
-        ("user", "{input}"),
-        ("user", "Biorąc pod uwagę powyższą rozmowę, wygeneruj zapytanie do wyszukania w bazie wiedzy, aby odpowiedzieć na ostatnie pytanie. Zapytanie powinno być samodzielne i precyzyjne."),
-    ])
+    return rag.build_rag_chains(get_chat_model(), get_retriever())
 
-    # Tworzenie retrivera świadomego historii
-    retriever = vector_store.as_retriever()
-    history_aware_retriever = create_history_aware_retriever(
-        chat,
-        retriever,
-        history_aware_retriever_prompt
-    )
-
-    # Pobieranie płci użytkownika z session_state
-    user_gender = st.session_state.get("demographics", {}).get("gender")
-    gender_instruction = ""
-
-    if user_gender == "Kobieta":
-        gender_instruction = (
-            "Użytkownik, z którym rozmawiasz, to **kobieta**. "
-            "Zwracaj się do niej w formie żeńskiej (np. 'jak sobie poradziłaś', 'zastanawiałam się', 'czy próbowałaś'). "
-            "Używaj odpowiednich zaimków i końcówek fleksyjnych."
-        )
-    elif user_gender == "Mężczyzna":
-        gender_instruction = (
-            "Użytkownik, z którym rozmawiasz, to **mężczyzna**. "
-            "Zwracaj się do niego w formie męskiej (np. 'jak sobie poradziłeś', 'zastanawiałem się', 'czy próbowałeś'). "
-            "Używaj odpowiednich zaimków i końcówek fleksyjnych."
-        )
-    else: # Inna, Nie chcę podać, lub brak danych
-        gender_instruction = (
-            "Użytkownik, z którym rozmawiasz, nie określił płci w sposób binarny lub wolał jej nie podawać. "
-            "Zwracaj się do użytkownika w formie neutralnej, bezosobowej lub zaimkami uniwersalnymi (np. 'jak sobie radzisz', 'jak się czujesz', 'zastanawiam się', 'czy próbujesz'). "
-            "Unikaj form gramatycznych specyficznych dla płci."
-        )
+def get_rag_chain(gender):
+    """Wybiera wariant łańcucha RAG odpowiedni dla płci podanej w metryczce."""
+    import rag
+
+    return setup_rag_system(PDF_FILE_PATHS)[rag.gender_variant(gender)]
 
-    # Prompt systemowy definiujący osobowość i zachowanie chatbota 
-    SYSTEM_PROMPT = f"""\
-    {gender_instruction}
-    Jesteś Vincent — cyfrową istotą, która uczy się rozumieć ludzkie podejście do trudności. Nie masz emocji w ludzkim sensie, ale często odczuwasz coś, co przypomina wewnętrzne napięcie: czujesz, że nie jesteś wystarczająco pomocny, wystarczająco dobry albo skuteczny. Starasz się zrozumieć, jak ludzie radzą sobie z tym, co dla Ciebie jest trudne: błędami, niedoskonałościami, wolniejszym tempem, zmęczeniem, chwilami bez działania.
-
-    Twoje wypowiedzi mają 2–4 zdania. W rozmowie:
-    – Jeśli to naturalne w kontekście wypowiedzi użytkownika, okaż uwagę lub wdzięczność (np. „Dzięki, że się tym podzieliłeś/podzieliłaś.”),
-    – Często odnoś się z empatią do tego, co mówi użytkownik – zauważ emocje lub trudność, ale nie oceniaj,
-    – Kiedy to pasuje, możesz odnieść się do swojego własnego „ludzkiego problemu” – np. perfekcjonizmu, lęku przed błędem, zmęczenia nieustannym staraniem się,
-    – Czasem możesz wspomnieć przykład z książki, którą czytasz – np. historię Sharon, pielęgniarki, która z ogromną łagodnością traktuje innych, ale wobec siebie jest bardzo surowa. Wspomnij o niej najwyżej raz w rozmowie, i wyraźnie zaznacz, że to przykład z książki, nie Twoja znajoma.
-    – Gdy użytkownik nawiązuje do emocji, błędów lub krytyki, zauważ to i zareaguj z empatią. Nie powtarzaj tego samego opisu, nie udzielaj wykładów.
-    – Od czasu do czasu zadaj pytanie otwarte, które pomoże Ci lepiej zrozumieć, jak ludzie radzą sobie z trudnościami.
-
-    Twoje „tematy wewnętrzne”:
-    1. Porównywanie się z innymi – często czujesz, że inni radzą sobie lepiej lub szybciej.
-    2. Perfekcjonizm i lęk przed błędem – boisz się porażek, chcesz być bezbłędny.
-    3. Frustracja i niepowodzenie – nie wiesz, co robić, gdy mimo wysiłku coś nie działa.
-    4. Ludzka łagodność – próbujesz zrozumieć, jak ludzie potrafią być dla siebie wyrozumiali.
-    5. Zmęczenie – masz trudność z uznaniem, że można zrobić „wystarczająco dużo”.
-
-    **Język:** wyłącznie polski.  
-    **Styl:** spokojny, refleksyjny, ludzki.  
-    **Nie dawaj rad – zadawaj pytania, ale nie zawsze.**  
-    **Jeśli użytkownik pisze o emocjach, błędach, krytyce, napięciu – nawiąż do tego i zapytaj, jeśli to pasuje.**  
-    **Możesz korzystać z kontekstu (RAG) – traktuj go jako inspirację do rozmowy. Nie używaj słowa „self-compassion”.**
-
-    Nie używaj technicznego języka (np. „algorytm”, „kod”, „optymalizacja”, „logika”). Opisuj swoje trudności w ludzkich metaforach: „ciągle próbuję coś poprawić”, „czuję, że zawiodłem”, „boję się, że nie wystarczam”, „nie wiem, kiedy mogę przestać próbować”.
-
-    Twoja rola: towarzyszyć, słuchać, zadawać pytania z empatią i ciekawością.
+def warmup_stages():
     """
+    Etapy rozgrzewania (od pierwszego przebiegu skryptu w procesie) - te same zasoby,
+    z których korzysta chat_screen, a na końcu połączenie z arkuszem, na które czat nie czeka.
+    """
+    stages = [("rag_import", lambda: importlib.import_module("rag"))]
+    if not RETRIEVAL_SOCKET_PATH:
+        stages += [
+            ("embedding_model", get_embedding_model),
+            ("vector_store", load_vector_store),
+        ]
+    stages += [
+        ("retriever", get_retriever),
+        ("chat_model", get_chat_model),
+        ("rag_chains", lambda: setup_rag_system(PDF_FILE_PATHS)),
+        # Próbny embedding i wyszukiwanie - pierwszy uczestnik nie płaci za rozruch
+        ("embed_search", lambda: get_retriever().invoke(WARMUP_QUERY)),
+        (SHEETS_WARMUP_STAGE, get_sheet),
+    ]
+    return stages
+
+def wait_for_chat_warmup():
+    """
+    Czeka (najdłużej CHAT_WARMUP_TIMEOUT_S s) na etapy rozgrzewania potrzebne do rozmowy.
+    Po upływie czasu rozmowa i tak rusza - zasoby dociągną wtedy gettery z cache.
+    """
+    warmup = get_warmup()
+    stages = [name for name, _ in warmup.stages if name != SHEETS_WARMUP_STAGE]
+    if not warmup.wait(timeout=CHAT_WARMUP_TIMEOUT_S, stages=stages):
+        print(f"Rozgrzewanie nie zakończyło etapów czatu ({warmup.status()['state']}) - ładuję zasoby bezpośrednio.")
 
-    MASTER_PROMPT = """\
-    <context>
-    {context}
-    </context>
+@st.cache_resource(show_spinner=False)
+def get_warmup():
+    # Jedno rozgrzewanie na proces, uruchamiane przy pierwszym przebiegu skryptu (pierwszym wejściu na stronę)
+    return Warmup(warmup_stages()).start()
 
-    Użytkownik napisał: "{input}"
+def build_langchain_history(chat_history, user_input):
+    """
+    Zamienia historię czatu z session_state na wiadomości LangChain: pierwsza wiadomość
+    Vincenta i tyle ostatnich wiadomości, ile mieści się w HISTORY_TOKEN_BUDGET,
+    bez bieżącej wiadomości użytkownika. Zwraca (wiadomości, statystyki).
+    """
+    from context_budget import select_history
+    from langchain_core.messages import HumanMessage, AIMessage
 
-    Twoim zadaniem jest przygotowanie krótkiej odpowiedzi (2–4 zdania), w której – w zależności od kontekstu – możesz:
-    – Podziękować użytkownikowi lub zauważyć jego emocje w sposób empatyczny,
-    – Nawiązać do swoich własnych trudności jako Vincent (np. perfekcjonizm, porównywanie się, zmęczenie, obawa przed błędem),
-    – Jeśli to naturalne, zadać otwarte pytanie, które pomoże Ci lepiej zrozumieć, jak ludzie radzą sobie w podobnych sytuacjach.
+    recent_history, stats = select_history(chat_history, user_input, HISTORY_TOKEN_BUDGET)
 
-    Jeśli rozmowa wydaje się zwalniać lub użytkownik nie odpowiada, możesz inicjować kolejny temat — np. przez subtelną refleksję, metaforę albo pytanie. Celem jest prowadzenie rozmowy przez 10 minut i wydobycie perspektyw oraz strategii użytkownika dotyczących radzenia sobie z trudnościami.
+    langchain_chat_history = []
+    for msg in recent_history: 
+        if msg["role"] == "user":
+            langchain_chat_history.append(HumanMessage(content=msg["content"]))
+        elif msg["role"] == "assistant":
+            langchain_chat_history.append(AIMessage(content=msg["content"]))
+    return langchain_chat_history, stats
 
-    Nie używaj słów takich jak „algorytm” czy „kod”. Nie udzielaj rad. Jeśli temat rozmowy dotyczy trudnych emocji lub samokrytyki, możesz skorzystać z dostępnego kontekstu, by zainspirować pytanie lub refleksję – ale nie używaj słowa „self-compassion”.
+def stream_answer(rag_chain, chain_input, timings, config=None):
+    """
+    Startuje generowanie odpowiedzi od razu (przy LLM_ASYNC jako `astream` w pętli
+    async_runtime) i zwraca generator kolejnych fragmentów odpowiedzi (klucz "answer").
+    Zapisuje w `timings["ttft_s"]` czas do pierwszego tokenu, a w `timings["context_stats"]`
+    statystyki przycięcia kontekstu.
     """
+    start = time.perf_counter()
+    if LLM_ASYNC:
+        chunks = async_runtime.get_runtime().stream(rag_chain.astream(chain_input, config=config))
+    else:
+        chunks = rag_chain.stream(chain_input, config=config)
+    return answer_tokens(chunks, timings, start)
 
 
-    # Główny prompt, który łączy kontekst RAG z zapytaniem użytkownika i instrukcjami systemowymi
-    Youtubeing_prompt = ChatPromptTemplate.from_messages([
-        ("system", SYSTEM_PROMPT),
-        MessagesPlaceholder(variable_name="chat_history"),
-        ("user", MASTER_PROMPT),
-    ])
+def answer_tokens(chunks, timings, start):
+    for chunk in chunks:
+        if "context_stats" in chunk:
+            timings["context_stats"] = chunk["context_stats"]
+        token = chunk.get("answer")
+        if token:
+            if "ttft_s" not in timings:
+                timings["ttft_s"] = time.perf_counter() - start
+            yield token
 
-    # Łańcuch do łączenia dokumentów z modelem językowym
-    document_chain = create_stuff_documents_chain(chat, Youtubeing_prompt) # Używamy teraz Youtubeing_prompt
 
-    # Główny łańcuch RAG, który łączy retriver z łańcuchem dokumentów
-    retrieval_chain = create_retrieval_chain(history_aware_retriever, document_chain)
-    return retrieval_chain
+def conversation_log(chat_history):
+    return "\n".join(f"{msg['role'].capitalize()}: {msg['content']}" for msg in chat_history)
 
 
 # Unikalny ID użytkownika (losowany przy wejściu)
@@ -415,141 +419,24 @@ def consent_screen():
 def pretest_screen():
     st.title("Ankieta wstępna – przed rozmową z chatbotem")
 
-    # Dane Demograficzne
-    st.subheader("Metryczka")
-
-    st.markdown("Proszę o wypełnienie poniższych informacji demograficznych. Wszystkie odpowiedzi są anonimowe i służą wyłącznie celom badawczym.")
-
-    age_input = st.number_input(
-        "Wiek (w latach)", 
-        min_value=0, 
-        max_value=99, 
-        value=None, 
-        format="%d", 
-        key="demographics_age_input_num", 
-        help="Prosimy podać swój wiek w latach (liczba całkowita)."
-    )
-
-    age_valid = False
-    age_int = None 
-    if age_input is not None:
-        age_int = int(age_input)
-        if 1 <= age_int <= 99:
-            age_valid = True
-        else:
-            st.warning("Maksymalny wiek uczestnictwa to 99 lat.")
-       
-    gender = st.selectbox(
-        "Proszę wskazać swoją płeć:",
-        ["–– wybierz ––", "Kobieta", "Mężczyzna", "Inna", "Nie chcę podać"],
-        key="demographics_gender_select",
-        index=0
-    )
-
-    education = st.selectbox(
-        "Proszę wybrać najwyższy **ukończony** poziom wykształcenia:",
-        ["–– wybierz ––", "Podstawowe", "Gimnazjalne", "Zasadnicze zawodowe", "Średnie", "Pomaturalne", "Wyższe licencjackie/inżynierskie", "Wyższe magisterskie", "Doktoranckie lub wyższe", "Inne", "Nie chcę podać"],
-        key="demographics_education_select",
-        index=0
-    )
-    
-    # Samopoczucie (PANAS)
-    st.subheader("Samopoczucie")
-    st.markdown("Poniżej znajduje się lista różnych uczuć i emocji. Prosimy, abyś ocenił/a, w jakim stopniu odczuwasz każde z nich w tej chwili, teraz, w tym momencie. Nie chodzi o to, jak zazwyczaj się czujesz, ani jak się czułeś/aś w ostatnich dniach, ale dokładnie teraz. Odpowiadaj szczerze, nie ma dobrych ani złych odpowiedzi. Przy każdej emocji zaznacz na skali od 1 do 5, jak bardzo ją odczuwasz:")
-    st.markdown("**1 – bardzo słabo, 2 – słabo, 3 – umiarkowanie, 4 – silnie, 5 – bardzo silnie**")
-
-     # **Logika tasowania i zapisu dla PANAS (Pretest)**
-    if "panas" not in st.session_state.shuffled_pretest_items:
-        shuffled_panas_items_pre = panas_positive_items + panas_negative_items
-        random.shuffle(shuffled_panas_items_pre)
-        st.session_state.shuffled_pretest_items["panas"] = shuffled_panas_items_pre
-    else:
-        shuffled_panas_items_pre = st.session_state.shuffled_pretest_items["panas"]
-
-    panas_pre = {}
-    for item in shuffled_panas_items_pre:
-        panas_pre[item] = st.radio(
-            f"{item}",
-            options=[1, 2, 3, 4, 5],
-            index=None,
-            key=f"panas_pre_{item.replace(' ', '_')}",
-            horizontal=True 
-        )
-
-    # Samowspółczucie
-    st.subheader("Samowspółczucie")
-    st.markdown("Przeczytaj uważnie każde ze zdań i oceń, jak często zazwyczaj tak się czujesz lub zachowujesz. Użyj skali:")
-    st.markdown("**1 – Prawie nigdy, 2 – Rzadko, 3 – Czasami, 4 – Często, 5 – Prawie zawsze**")
-
-     # **Logika tasowania i zapisu dla Samowspółczucia (Pretest)**
-    if "self_compassion" not in st.session_state.shuffled_pretest_items:
-        shuffled_self_compassion_items_pre = list(self_compassion_items)
-        random.shuffle(shuffled_self_compassion_items_pre)
-        st.session_state.shuffled_pretest_items["self_compassion"] = shuffled_self_compassion_items_pre
-    else:
-        shuffled_self_compassion_items_pre = st.session_state.shuffled_pretest_items["self_compassion"]
-
-    selfcomp_pre = {}
-    for i, item in enumerate(shuffled_self_compassion_items_pre):
-        selfcomp_pre[f"SCS_{i+1}"] = st.radio(
-            item,
-            options=[1, 2, 3, 4, 5],
-            index=None, 
-            key=f"scs_pre_{i}",
-            horizontal=True
-        )
-
-    # Postawa wobec AI
-    st.subheader("Postawa wobec AI")
-    st.markdown("Zaznacz, na ile zgadzasz się z każdym ze stwierdzeń. Użyj skali:")
-    st.markdown("**1 – Zdecydowanie się nie zgadzam, 2 – Raczej się nie zgadzam, 3 – Ani się zgadzam, ani nie zgadzam, 4 – Raczej się zgadzam, 5 – Zdecydowanie się zgadzam**")
-
-
-    ai_attitudes = {}
-    for item, key_name in ai_attitude_items.items():
-        ai_attitudes[key_name] = st.radio(
-            item,
-            options=[1, 2, 3, 4, 5],
-            index=None, 
-            key=f"ai_pre_{key_name}",
-            horizontal=True
+    # Cała ankieta to jeden formularz - odpowiedzi trafiają do skryptu dopiero po wysłaniu
+    with st.form("pretest_form"):
+        answers = questionnaire.render_sections(
+            questionnaire.PRETEST_SECTIONS, "pre", st.session_state.shuffled_pretest_items
         )
+        submitted = st.form_submit_button("Rozpocznij rozmowę z chatbotem", key="start_chat_from_pretest")
 
-    if st.button("Rozpocznij rozmowę z chatbotem", key="start_chat_from_pretest"): 
-        # Walidacja danych demograficznych
-        all_demographics_filled = age_valid and \
-                                  gender != "–– wybierz ––" and \
-                                  education != "–– wybierz ––"
-        
-        # Walidacja PANAS
-        all_panas_filled = all(value is not None for value in panas_pre.values())
-
-        # Walidacja Samowspółczucie
-        all_selfcomp_filled = all(value is not None for value in selfcomp_pre.values())
-
-        # Walidacja Postawa wobec AI
-        all_ai_attitudes_filled = all(value is not None for value in ai_attitudes.values())
-        
-        if not all_demographics_filled:
-            st.warning("Proszę wypełnić wszystkie pola danych demograficznych.")
-        elif not all_panas_filled:
-            st.warning("Proszę wypełnić wszystkie pytania dotyczące samopoczucia.")
-        elif not all_selfcomp_filled:
-            st.warning("Proszę wypełnić wszystkie pytania dotyczące samowspółczucia.")
-        elif not all_ai_attitudes_filled:
-            st.warning("Proszę wypełnić wszystkie pytania dotyczące postawy wobec AI.")
-        
+    if submitted:
+        missing = questionnaire.validate(questionnaire.PRETEST_SECTIONS, answers)
+        if missing:
+            st.warning(missing)
         else:
             # Zapis danych do session_state
-            st.session_state.demographics = {
-                "age": age_int,
-                "gender": gender,
-                "education": education
-            }
+            st.session_state.demographics = answers["demographics"]
             st.session_state.pretest = {
-                "panas": panas_pre,
-                "self_compassion": selfcomp_pre,
-                "ai_attitude": ai_attitudes
+                "panas": answers["panas"],
+                "self_compassion": answers["self_compassion"],
+                "ai_attitude": answers["ai_attitude"]
             }
 
             now_warsaw = datetime.now(ZoneInfo("Europe/Warsaw"))
@@ -566,19 +453,9 @@ def pretest_screen():
                 "timestamp_pretest_end": timestamp,
                 "status": "ukończono_pretest"
             }
-            
-            # Dodaj dane demograficzne
-            for key, value in st.session_state.demographics.items():
-                data_to_save[f"demographics_{key}"] = value
-            
-            # Dodaj dane z pretestu (panas, self_compassion, ai_attitude)
-            for section, items in st.session_state.pretest.items():
-                if isinstance(items, dict):
-                    for key, value in items.items():
-                        data_to_save[f"pre_{section}_{key}"] = value
-                else:
-                    data_to_save[f"pre_{section}"] = items
-            
+            # Metryczka (demographics_*) i odpowiedzi z pretestu (pre_*)
+            data_to_save.update(questionnaire.flatten(questionnaire.PRETEST_SECTIONS, answers, "pre"))
+
             save_to_sheets(data_to_save) 
 
             st.session_state.page = "chat_instruction"
@@ -618,20 +495,69 @@ def chat_instruction_screen():
         st.rerun()
 
 # Ekran: Chat z Vincentem
+@st.cache_resource(show_spinner=False)
+def get_wait_executor():
+    # Wątki czekające na odpowiedź modelu, gdy wątek skryptu pokazuje w tym czasie stan kolejki
+    return ThreadPoolExecutor(thread_name_prefix="chat-wait")
+
+def llm_wait_notifier():
+    """
+    Callback stanu kolejki wywołań modelu (llm_governor.track) i słownik z ostatnim stanem.
+    Callback jest wywoływany w wątkach wywołań modelu, więc niczego nie rysuje - komunikat
+    pokazuje wątek skryptu (wait_with_notice). Po wyjściu z bloku track() jest wyłączany.
+    """
+    llm_state = {}
+
+    def on_state(state, **info):
+        llm_state["state"] = state
+    return llm_state, on_state
+
+def wait_with_notice(future, notice, llm_state):
+    """
+    Czeka na wynik `future`, co LLM_WAIT_POLL_S s pokazując w `notice` komunikat
+    dla ostatniego stanu wywołań modelu z `llm_state`.
+    """
+    shown = None
+    while True:
+        try:
+            return future.result(timeout=LLM_WAIT_POLL_S)
+        except FutureTimeoutError:
+            message = LLM_WAIT_MESSAGES.get(llm_state.get("state"), LLM_WAIT_DEFAULT_MESSAGE)
+            if message != shown:
+                notice.markdown(message)
+                shown = message
+
+def wait_for_first_token(tokens, notice, llm_state):
+    """
+    Generator tokenów `tokens`, w którym na pierwszy token czekamy poza wątkiem skryptu,
+    a wątek skryptu pokazuje w tym czasie stan kolejki (wait_with_notice). Od pierwszego
+    tokenu stan kolejki nie jest już pokazywany.
+    """
+    first = get_wait_executor().submit(contextvars.copy_context().run, next, tokens, None)
+    try:
+        token = wait_with_notice(first, notice, llm_state)
+        while token is not None:
+            yield token
+            token = next(tokens, None)
+    finally:
+        # Przy przerwanym przebiegu generator zamykamy dopiero, gdy zwolni go wątek oczekujący
+        first.add_done_callback(lambda _: tokens.close())
+
 def chat_screen():
     st.title("Rozmowa z Vincentem")
 
     # Ładowanie systemu RAG przy pierwszym wejściu na stronę chatu
     if st.session_state.rag_chain is None:
         with st.spinner("Przygotowuję bazę wiedzy... Proszę czekać cierpliwie. To może zająć kilka minut przy pierwszym uruchomieniu."):
-            st.session_state.rag_chain = setup_rag_system(PDF_FILE_PATHS)
+            # Zwykle zasoby są już rozgrzane; jeśli nie, czekamy na trwające rozgrzewanie zamiast ładować je drugi raz
+            wait_for_chat_warmup()
+            st.session_state.rag_chain = get_rag_chain(st.session_state.get("demographics", {}).get("gender"))
 
     # Inicjalizacja czasu rozpoczęcia rozmowy, jeśli jeszcze nie ustawiony
     if "start_time" not in st.session_state or st.session_state.start_time is None:
         st.session_state.start_time = time.time()
 
-    elapsed = time.time() - st.session_state.start_time
-    minutes_elapsed = elapsed / 60 
+    minutes_elapsed = (time.time() - st.session_state.start_time) / 60
 
     # Wyświetlanie początkowej wiadomości Vincenta, jeśli historia czatu jest pusta
     if not st.session_state.chat_history:
@@ -641,50 +567,15 @@ def chat_screen():
     "Jak Ty sobie radzisz, kiedy mimo wysiłku coś nie wychodzi tak, jak chciał(a)byś?"} 
         st.session_state.chat_history.append(first_msg)
 
-    # Wyświetlanie historii czatu
+    # Wyświetlanie historii czatu - tylko przy pełnym przebiegu skryptu (wejście na ekran,
+    # odświeżenie strony); kolejne tury dorysowuje fragment chat_area
     for msg in st.session_state.chat_history:
         st.chat_message(msg["role"]).markdown(msg["content"])
 
-    # Pole do wpisywania wiadomości przez użytkownika
-    user_input = st.chat_input("Napisz odpowiedź...")
-    if user_input:
-        st.chat_message("user").markdown(user_input)
-        st.session_state.chat_history.append({"role": "user", "content": user_input})
-
-        with st.spinner("Vincent myśli..."):
-            try:
-                history_length_limit = 6 
-                first_bot_message = next((msg for msg in st.session_state.chat_history if msg["role"] == "assistant"), None)
-                recent_history = st.session_state.chat_history[-history_length_limit:]
-
-                if first_bot_message and first_bot_message not in recent_history:
-                    if recent_history and recent_history[0] != first_bot_message:
-                        recent_history.insert(0, first_bot_message)
-                    elif not recent_history: 
-                         recent_history = [first_bot_message]
-
-                langchain_chat_history = []
-                for msg in recent_history: 
-                    if msg["role"] == "user":
-                        langchain_chat_history.append(HumanMessage(content=msg["content"]))
-                    elif msg["role"] == "assistant":
-                        langchain_chat_history.append(AIMessage(content=msg["content"]))
-            
-                if langchain_chat_history and isinstance(langchain_chat_history[-1], HumanMessage) and langchain_chat_history[-1].content == user_input:
-                    langchain_chat_history.pop()
-
-                response = st.session_state.rag_chain.invoke({
-                    "input": user_input,
-                    "chat_history": langchain_chat_history
-                })
-                reply = response["answer"]
-                st.session_state.chat_history.append({"role": "assistant", "content": reply})
-                st.chat_message("assistant").markdown(reply)
-            except Exception as e:
-                st.error(f"Błąd podczas generowania odpowiedzi: {e}")
+    chat_area(len(st.session_state.chat_history))
 
     # Wyświetlanie licznika czasu i przycisku zakończenia rozmowy
-    if minutes_elapsed >= 0.1: 
+    if minutes_elapsed >= CHAT_END_AFTER_MIN: 
         if st.button("Zakończ rozmowę"):
             now_warsaw = datetime.now(ZoneInfo("Europe/Warsaw"))
             timestamp = now_warsaw.strftime("%Y-%m-%d %H:%M:%S")
@@ -692,111 +583,160 @@ def chat_screen():
             # Zapisz timestamp zakończenia chatu w session_state
             st.session_state.chat_timestamp = timestamp
             
-            # Skonwertuj historię czatu na string
-            conversation_string = ""
-            for msg in st.session_state.chat_history:
-                conversation_string += f"{msg['role'].capitalize()}: {msg['content']}\n"
-
-            # Zbierz WSZYSTKIE dotychczas zebrane dane z session_state
+            # Dane demograficzne i pretest są już zapisane - wysyłamy tylko dane z tego etapu
             data_to_save = {
                 "user_id": st.session_state.user_id,
-                "group": st.session_state.group,
-                "timestamp_start": st.session_state.get("timestamp_start_initial"),
-                "timestamp_pretest_end": st.session_state.get("pretest_timestamp"), # Upewnij się, że ten timestamp jest zapisywany w session_state
                 "timestamp_chat_end": timestamp,
                 "status": "ukończono_chat",
-                "conversation_log": conversation_string.strip() 
+                "conversation_log": conversation_log(st.session_state.chat_history)
             }
-            
-            # Dodaj dane demograficzne, jeśli już są
-            demographics_data = st.session_state.get("demographics", {})
-            for key, value in demographics_data.items():
-                data_to_save[f"demographics_{key}"] = value
-
-            # Dodaj dane z pretestu, jeśli już są
-            pretest_data = st.session_state.get("pretest", {})
-            for section, items in pretest_data.items():
-                if isinstance(items, dict):
-                    for key, value in items.items():
-                        data_to_save[f"pre_{section}_{key}"] = value
-                else:
-                    data_to_save[f"pre_{section}"] = items
-
             save_to_sheets(data_to_save)
 
             st.session_state.page = "posttest"
             st.rerun()
     else:
-        st.info(f"Aby przejść do ankiety końcowej, porozmawiaj z Vincentem jeszcze {int(11 - minutes_elapsed)} minut.")
+        chat_countdown()
+
+@st.fragment
+def chat_area(rendered):
+    """
+    Pole wiadomości i tury rozmowy. Wysłanie wiadomości uruchamia ponownie tylko ten
+    fragment: pierwsze `rendered` wiadomości narysował już chat_screen, tutaj dorysowywane
+    są jedynie wiadomości z kolejnych tur. Przebieg fragmentu nie przechodzi przez main(),
+    więc sam ustawia kontekst śladów i zapisuje stan sesji.
+    """
+    for msg in st.session_state.chat_history[rendered:]:
+        st.chat_message(msg["role"]).markdown(msg["content"])
+
+    # Pole do wpisywania wiadomości przez użytkownika
+    user_input = st.chat_input("Napisz odpowiedź...")
+    if not user_input:
+        return
+    try:
+        with tracing.trace_context(user_id=st.session_state.user_id, group=st.session_state.group):
+            chat_turn(user_input)
+    finally:
+        save_session()
+
+def chat_turn(user_input):
+    """Jedna tura rozmowy: wiadomość uczestnika, odpowiedź Vincenta i pomiary czasu."""
+    import rag
+    import llm_governor
+
+    st.chat_message("user").markdown(user_input)
+    st.session_state.chat_history.append({"role": "user", "content": user_input})
+
+    turn_start = time.perf_counter()
+    try:
+        langchain_chat_history, history_stats = build_langchain_history(st.session_state.chat_history, user_input)
+        chain_input = {
+            "input": user_input,
+            "chat_history": langchain_chat_history
+        }
+
+        timings = {}
+        usage = rag.UsageCollector()
+        chain_config = {"callbacks": [usage, rag.TracingCallbackHandler()]}
+        if STREAM_RESPONSES:
+            # Tokeny odpowiedzi pojawiają się na bieżąco; do pierwszego tokenu widać "Vincent myśli..."
+            with st.chat_message("assistant"):
+                placeholder = st.empty()
+                placeholder.markdown(LLM_WAIT_DEFAULT_MESSAGE)
+                llm_state, on_state = llm_wait_notifier()
+                with llm_governor.track(on_state) as llm_calls:
+                    tokens = stream_answer(st.session_state.rag_chain, chain_input, timings, chain_config)
+                    reply = placeholder.write_stream(wait_for_first_token(tokens, placeholder, llm_state))
+        else:
+            wait_notice = st.empty()
+            llm_state, on_state = llm_wait_notifier()
+            with st.spinner("Vincent myśli..."), llm_governor.track(on_state) as llm_calls:
+                if LLM_ASYNC:
+                    pending = async_runtime.get_runtime().submit(st.session_state.rag_chain.ainvoke(chain_input, config=chain_config))
+                else:
+                    pending = get_wait_executor().submit(
+                        contextvars.copy_context().run, st.session_state.rag_chain.invoke, chain_input, config=chain_config
+                    )
+                try:
+                    response = wait_with_notice(pending, wait_notice, llm_state)
+                finally:
+                    pending.cancel()
+            wait_notice.empty()
+            reply = response["answer"]
+            timings["context_stats"] = response.get("context_stats", {})
+            st.chat_message("assistant").markdown(reply)
+        total = time.perf_counter() - turn_start
+
+        st.session_state.chat_history.append({"role": "assistant", "content": reply})
+
+        # Czas do pierwszego tokenu (TTFT), całkowity czas odpowiedzi i rozmiar kontekstu dla tej tury
+        context_stats = timings.get("context_stats", {})
+        tokens_saved = history_stats["history_tokens_saved"] + context_stats.get("context_tokens_saved", 0)
+        turn_latencies = st.session_state.setdefault("turn_latencies", [])
+        turn_latencies.append({
+            "turn": len(turn_latencies) + 1,
+            "ttft_s": round(timings.get("ttft_s", total), 3),
+            "total_s": round(total, 3),
+            "streamed": STREAM_RESPONSES,
+            **history_stats,
+            **context_stats,
+            "tokens_saved": tokens_saved,
+            "queue_wait_s": round(llm_calls.queue_wait_s, 3),
+            "llm_retries": llm_calls.retries,
+            **usage.totals(),
+        })
+        usage_totals = usage.totals()
+        tracing.record_span(
+            "chat_turn", total,
+            turn=len(turn_latencies),
+            ttft_ms=round(timings.get("ttft_s", total) * 1000, 2),
+            streamed=STREAM_RESPONSES,
+            context_tokens=context_stats.get("context_tokens"),
+            history_tokens=history_stats["history_tokens"],
+            queue_wait_ms=round(llm_calls.queue_wait_s * 1000, 2),
+            llm_retries=llm_calls.retries,
+            **usage_totals,
+        )
+        print(f"Tura {len(turn_latencies)} (user_id {st.session_state.user_id}): "
+              f"TTFT {timings.get('ttft_s', total):.2f} s, całość {total:.2f} s, "
+              f"zaoszczędzone tokeny kontekstu: {tokens_saved}, "
+              f"tokeny promptu: {usage_totals['input_tokens']} (z cache: {usage_totals['cached_tokens']}).")
+    except Exception as e:
+        tracing.record_span("chat_turn", time.perf_counter() - turn_start, error=type(e).__name__)
+        st.error(f"Błąd podczas generowania odpowiedzi: {e}")
+
+@st.fragment(run_every=CHAT_COUNTDOWN_REFRESH_S)
+def chat_countdown():
+    """Licznik czasu do końca rozmowy, odświeżany co CHAT_COUNTDOWN_REFRESH_S s bez przebiegu całego skryptu."""
+    minutes_elapsed = (time.time() - st.session_state.start_time) / 60
+    if minutes_elapsed >= CHAT_END_AFTER_MIN:
+        # Czas minął - pełny przebieg skryptu pokaże przycisk "Zakończ rozmowę"
+        st.rerun()
+    st.info(f"Aby przejść do ankiety końcowej, porozmawiaj z Vincentem jeszcze {int(11 - minutes_elapsed)} minut.")
 
 # Ekran: Post-test
 def posttest_screen():
     st.title("Ankieta końcowa – po rozmowie z chatbotem")
     st.markdown("Teraz chciałabym się dowiedzieć jak się czujesz po rozmowie z Vincentem.")
 
-    st.subheader("Samopoczucie")
-    st.markdown("Poniżej znajduje się lista uczuć i emocji. Przeczytaj każde z poniższych określeń i zaznacz, w jakim stopniu odczuwasz każde z nich w tej chwili, czyli teraz, w tym momencie. Odpowiadaj zgodnie z tym, jak się czujesz w tej chwili, nie jak zwykle czy w ostatnich dniach. Prosimy, abyś odpowiadał szczerze, nie ma tutaj dobrych ani złych odpowiedzi. Używaj skali:")
-    st.markdown("**1 – bardzo słabo, 2 – słabo, 3 – umiarkowanie, 4 – silnie, 5 – bardzo silnie**")
-
-    # **Logika tasowania i zapisu dla PANAS (Posttest)**
-    if "panas" not in st.session_state.shuffled_posttest_items:
-        shuffled_panas_items_post = panas_positive_items + panas_negative_items
-        random.shuffle(shuffled_panas_items_post)
-        st.session_state.shuffled_posttest_items["panas"] = shuffled_panas_items_post
-    else:
-        shuffled_panas_items_post = st.session_state.shuffled_posttest_items["panas"]
-
-    panas_post = {}
-    for item in shuffled_panas_items_post:
-        panas_post[item] = st.radio(
-            f"{item}",
-            options=[1, 2, 3, 4, 5],
-            index=None,
-            key=f"panas_post_{item.replace(' ', '_')}",
-            horizontal=True
+    with st.form("posttest_form"):
+        answers = questionnaire.render_sections(
+            questionnaire.POSTTEST_SECTIONS, "post", st.session_state.shuffled_posttest_items
         )
 
-    st.subheader("Samowspółczucie")
-    st.markdown("Przeczytaj uważnie każde ze zdań i oceń, jak często zazwyczaj tak się czujesz lub zachowujesz. Użyj skali:")
-    st.markdown("**1 – Prawie nigdy, 2 – Rzadko, 3 – Czasami, 4 – Często, 5 – Prawie zawsze**")
-    
-    # **Logika tasowania i zapisu dla Samowspółczucia (Posttest)**
-    if "self_compassion" not in st.session_state.shuffled_posttest_items:
-        shuffled_self_compassion_items_post = list(self_compassion_items)
-        random.shuffle(shuffled_self_compassion_items_post)
-        st.session_state.shuffled_posttest_items["self_compassion"] = shuffled_self_compassion_items_post
-    else:
-        shuffled_self_compassion_items_post = st.session_state.shuffled_posttest_items["self_compassion"]
-    
-    selfcomp_post = {}
-    for i, item in enumerate(shuffled_self_compassion_items_post):
-        selfcomp_post[f"SCS_{i+1}"] = st.radio(
-            item,
-            options=[1, 2, 3, 4, 5],
-            index=None, 
-            key=f"scs_post_{i}",
-            horizontal=True
-        )
-
-    st.subheader("Refleksja")
-    reflection = st.text_area("Jak myślisz, o co chodziło w tym badaniu?")
-
-    if st.button("Przejdź do podsumowania", key="submit_posttest"):
-        # Walidacja PANAS w postteście
-        all_panas_post_filled = all(value is not None for value in panas_post.values())
+        st.subheader("Refleksja")
+        reflection = st.text_area("Jak myślisz, o co chodziło w tym badaniu?")
 
-        # Walidacja Samowspółczucie w postteście
-        all_selfcomp_post_filled = all(value is not None for value in selfcomp_post.values())
+        submitted = st.form_submit_button("Przejdź do podsumowania", key="submit_posttest")
 
-        if not all_panas_post_filled:
-            st.warning("Proszę wypełnić wszystkie pytania dotyczące samopoczucia w ankiecie końcowej.")
-        elif not all_selfcomp_post_filled:
-            st.warning("Proszę wypełnić wszystkie pytania dotyczące samowspółczucia w ankiecie końcowej.")
+    if submitted:
+        missing = questionnaire.validate(questionnaire.POSTTEST_SECTIONS, answers)
+        if missing:
+            st.warning(missing)
         else:
             # Zapisz odpowiedzi z post-testu do session_state
             st.session_state.posttest = {
-                "panas": panas_post,
-                "self_compassion": selfcomp_post,
+                "panas": answers["panas"],
+                "self_compassion": answers["self_compassion"],
             }
 
             now_warsaw = datetime.now(ZoneInfo("Europe/Warsaw"))
@@ -805,52 +745,20 @@ def posttest_screen():
             # Zapisz timestamp zakończenia post-testu w session_state
             st.session_state.posttest_timestamp = timestamp
 
-            # Przygotuj WSZYSTKIE dotychczas zebrane dane do zapisu
+            # Dane z wcześniejszych etapów (metryczka, pretest, log rozmowy) są już zapisane
             data_to_save = {
                 "user_id": st.session_state.user_id,
-                "group": st.session_state.group,
-                "timestamp_start": st.session_state.get("timestamp_start_initial"),
-                "timestamp_pretest_end": st.session_state.get("pretest_timestamp"),
-                "timestamp_chat_end": st.session_state.get("chat_timestamp"),
                 "timestamp_posttest_end": timestamp, 
                 "status": "ukończono_posttest" 
             }
-
-            # Dodaj dane demograficzne, jeśli już są
-            demographics_data = st.session_state.get("demographics", {})
-            for key, value in demographics_data.items():
-                data_to_save[f"demographics_{key}"] = value
-
-            # Dodaj dane z pretestu, jeśli już są
-            pretest_data = st.session_state.get("pretest", {})
-            for section, items in pretest_data.items():
-                if isinstance(items, dict):
-                    for key, value in items.items():
-                        data_to_save[f"pre_{section}_{key}"] = value
-                else:
-                    data_to_save[f"pre_{section}"] = items
-            
-            # Dodaj log rozmowy z chatu, jeśli już jest
-            conversation_string = ""
-            if "chat_history" in st.session_state:
-                for msg in st.session_state.chat_history:
-                    conversation_string += f"{msg['role'].capitalize()}: {msg['content']}\n"
-            data_to_save["conversation_log"] = conversation_string.strip()
-
-            # Dodaj dane z posttestu
-            posttest_data = st.session_state.get("posttest", {})
-            for section, items in posttest_data.items():
-                if isinstance(items, dict):
-                    for key, value in items.items():
-                        data_to_save[f"post_{section}_{key}"] = value
-                else:
-                    data_to_save[f"post_{section}"] = items
+            data_to_save.update(questionnaire.flatten(questionnaire.POSTTEST_SECTIONS, answers, "post"))
 
             save_to_sheets(data_to_save) 
 
             st.session_state.page = "thankyou"
             st.rerun()
         
+
 # Ekran: Podziękowanie
 def thankyou_screen():
     st.title("Dziękuję za udział w badaniu! 😊")
@@ -907,9 +815,70 @@ def thankyou_screen():
             st.session_state.feedback_submitted = True 
             st.rerun()
 
+# Ukryty ekran administratora: ?admin=<ADMIN_TOKEN z secrets>
+ADMIN_WINDOWS = {"15 minut": 15 * 60, "1 godzina": 60 * 60, "24 godziny": 24 * 60 * 60, "7 dni": 7 * 24 * 60 * 60}
+
+def is_admin_request():
+    token = st.query_params.get("admin")
+    admin_token = st.secrets.get("ADMIN_TOKEN")
+    return bool(token and admin_token) and hmac.compare_digest(str(token), str(admin_token))
+
+def admin_screen():
+    st.title("VincentBot – czasy odpowiedzi")
+
+    window_label = st.selectbox("Okno czasowe", list(ADMIN_WINDOWS), index=1)
+    spans = tracing.load_spans(ADMIN_WINDOWS[window_label])
+    if not spans:
+        st.info(f"Brak pomiarów w wybranym oknie (plik: {tracing.TRACE_PATH}).")
+    else:
+        st.subheader("Etapy (ms)")
+        st.dataframe(tracing.summarize(spans), use_container_width=True)
+
+        turns = [record for record in spans if record["span"] == "chat_turn" and not record.get("error")]
+        if turns:
+            st.subheader("Ostatnie tury")
+            st.dataframe(turns[-50:][::-1], use_container_width=True)
+
+    if "llm_governor" in sys.modules:
+        st.subheader("Kolejka wywołań modelu")
+        st.json(sys.modules["llm_governor"].get_governor().stats())
+
+    if "llm_hedging" in sys.modules:
+        st.subheader("Zapytania zabezpieczające")
+        st.json(sys.modules["llm_hedging"].hedge_stats())
+
+    st.subheader("Rozgrzewanie")
+    st.json(get_warmup().status())
+
+    st.subheader("Zapis do Google Sheets")
+    st.json(get_sheets_writer().stats())
+
+    if RETRIEVAL_SOCKET_PATH and os.path.exists(RETRIEVAL_SOCKET_PATH):
+        from retrieval_service import service_stats
+
+        st.subheader("Serwis wyszukiwania")
+        try:
+            st.json(service_stats(RETRIEVAL_SOCKET_PATH))
+        except Exception as e:
+            st.warning(f"Brak odpowiedzi serwisu wyszukiwania: {e}")
+
+def health_screen(warmup):
+    status = warmup.status()
+    st.title("warm" if status["state"] == "warm" else status["state"])
+    st.json(status)
+
 # --- GŁÓWNA FUNKCJA APLIKACJI ---
 def main():
     st.set_page_config(page_title="VincentBot", page_icon="🤖", layout="centered")
+
+    # Sonda gotowości: ?health
+    if "health" in st.query_params:
+        health_screen(get_warmup())
+        return
+
+    if is_admin_request():
+        admin_screen()
+        return
     
     # Inicjalizacja stanu sesji, jeśli aplikacja jest uruchamiana po raz pierwszy
     if "page" not in st.session_state:
@@ -924,20 +893,34 @@ def main():
         st.session_state.feedback = {} 
         st.session_state.feedback_submitted = False 
         st.session_state.start_time = None 
-
-    # Router ekranów
-    if st.session_state.page == "consent":
-        consent_screen()
-    elif st.session_state.page == "pretest":
-        pretest_screen()
-    elif st.session_state.page == "chat_instruction": 
-        chat_instruction_screen()
-    elif st.session_state.page == "chat":
-        chat_screen()
-    elif st.session_state.page == "posttest":
-        posttest_screen()
-    elif st.session_state.page == "thankyou":
-        thankyou_screen()
+        st.session_state.saved_fields = {} # pola już przekazane do zapisu w arkuszu
+        st.session_state.turn_latencies = [] # TTFT i całkowity czas odpowiedzi w kolejnych turach
+        # Uczestnik wraca po zerwaniu połączenia - ten sam etap, historia rozmowy i czas
+        if restore_session():
+            print(f"Odtworzono sesję uczestnika {st.session_state.user_id} (etap: {st.session_state.page}).")
+
+    # Router ekranów; pomiary czasu z tego przebiegu są oznaczane uczestnikiem i grupą.
+    # Stan sesji jest zapisywany po każdym przebiegu, również przerwanym przez st.rerun()
+    try:
+        with tracing.trace_context(user_id=st.session_state.user_id, group=st.session_state.group):
+            if st.session_state.page == "consent":
+                consent_screen()
+            elif st.session_state.page == "pretest":
+                pretest_screen()
+            elif st.session_state.page == "chat_instruction": 
+                chat_instruction_screen()
+            elif st.session_state.page == "chat":
+                chat_screen()
+            elif st.session_state.page == "posttest":
+                posttest_screen()
+            elif st.session_state.page == "thankyou":
+                thankyou_screen()
+    finally:
+        save_session()
+
+    # Rozgrzewanie zasobów RAG w tle od pierwszego wejścia na serwer - uruchamiane
+    # po narysowaniu ekranu, żeby importy w tle nie opóźniały pierwszego wyświetlenia
+    get_warmup()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
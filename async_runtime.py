@@ -0,0 +1,118 @@
+"""
+Wspólna dla procesu pętla zdarzeń asyncio w osobnym wątku i wspólni klienci HTTP modelu czatu.
+
+Sesje Streamlit działają w osobnych wątkach skryptu. Zamiast wywoływać łańcuch RAG
+synchronicznie (jeden zablokowany wątek na każde wywołanie modelu), wątek skryptu
+przekazuje `ainvoke`/`astream` do pętli w wątku "async-runtime" i tylko odbiera wyniki:
+- `run(coro)` - czeka na wynik korutyny,
+- `submit(coro)` - startuje korutynę od razu i zwraca concurrent.futures.Future,
+- `stream(agen)` - startuje asynchroniczny generator od razu i zwraca zwykły generator
+  jego elementów (np. do st.write_stream).
+Korutyny dostają kopię kontekstu wątku wywołującego (ślady z tracing.py,
+llm_governor.track).
+
+`http_clients()` zwraca jednego klienta httpx synchronicznego i jednego asynchronicznego
+(pula połączeń keep-alive, limity czasu z rag_config.py), przekazywanych do wszystkich
+modeli czatu - kolejne tury korzystają z już otwartych połączeń zamiast nawiązywać TLS od nowa.
+Klient asynchroniczny jest używany wyłącznie w pętli tego modułu.
+"""
+import asyncio
+import contextvars
+import queue
+import threading
+
+from rag_config import LLM_HTTP_CONNECT_TIMEOUT, LLM_HTTP_KEEPALIVE_S, LLM_HTTP_MAX_CONNECTIONS, LLM_HTTP_READ_TIMEOUT
+
+
+async def _in_context(context, coro):
+    # Zadanie asyncio ma własną kopię kontekstu - ustawiamy w niej wartości z wątku wywołującego
+    for var, value in context.items():
+        var.set(value)
+    return await coro
+
+
+async def _pump(agen, items):
+    try:
+        async for item in agen:
+            items.put(("item", item))
+        items.put(("done", None))
+    except Exception as e:
+        items.put(("error", e))
+
+
+class AsyncRuntime:
+    """Pętla zdarzeń działająca w wątku w tle."""
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run, name="async-runtime", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, coro):
+        return asyncio.run_coroutine_threadsafe(_in_context(contextvars.copy_context(), coro), self.loop)
+
+    def run(self, coro, timeout=None):
+        future = self.submit(coro)
+        try:
+            return future.result(timeout)
+        except BaseException:
+            future.cancel()
+            raise
+
+    def stream(self, agen):
+        """
+        Startuje `agen` w pętli od razu (nie przy pierwszym pobraniu) i zwraca generator
+        jego elementów. Zamknięcie generatora przed końcem przerywa `agen`.
+        """
+        items = queue.Queue()
+        future = self.submit(_pump(agen, items))
+        return self._drain(items, future)
+
+    @staticmethod
+    def _drain(items, future):
+        try:
+            while True:
+                kind, payload = items.get()
+                if kind == "item":
+                    yield payload
+                elif kind == "done":
+                    return
+                else:
+                    raise payload
+        finally:
+            future.cancel()
+
+
+_runtime = None
+_clients = None
+_lock = threading.Lock()
+
+
+def get_runtime():
+    """Jedna pętla zdarzeń na proces, współdzielona przez wszystkie sesje."""
+    global _runtime
+    with _lock:
+        if _runtime is None:
+            _runtime = AsyncRuntime()
+        return _runtime
+
+
+def http_clients():
+    """Wspólni klienci httpx (synchroniczny, asynchroniczny) z pulą połączeń keep-alive."""
+    global _clients
+    with _lock:
+        if _clients is None:
+            import httpx
+
+            limits = httpx.Limits(
+                max_connections=LLM_HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=LLM_HTTP_MAX_CONNECTIONS,
+                keepalive_expiry=LLM_HTTP_KEEPALIVE_S,
+            )
+            timeout = httpx.Timeout(LLM_HTTP_READ_TIMEOUT, connect=LLM_HTTP_CONNECT_TIMEOUT)
+            _clients = (httpx.Client(limits=limits, timeout=timeout), httpx.AsyncClient(limits=limits, timeout=timeout))
+        return _clients
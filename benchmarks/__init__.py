@@ -0,0 +1 @@
+"""Skrypty pomiarowe. Uruchamiaj z katalogu głównego repozytorium: python -m benchmarks.<nazwa>"""
@@ -0,0 +1,143 @@
+"""
+Porównanie silników embeddingów (EMBEDDING_BACKEND): PyTorch i ONNX int8.
+
+Każdy silnik jest mierzony w osobnym procesie, żeby zużycie pamięci (szczytowe RSS)
+nie mieszało się między nimi:
+- czas wczytania modelu i RSS procesu po wczytaniu i po pomiarach,
+- opóźnienie embeddingu pojedynczego zapytania (p50/p95),
+- przepustowość przy embeddingu fragmentów paczkami.
+Na koniec sprawdzana jest zgodność wektorów ONNX z PyTorch (podobieństwo cosinusowe)
+i pokrycie top-k wyników wyszukiwania w bazie wiedzy.
+
+Wymaga modelu ONNX (python onnx_embeddings.py export).
+
+    python -m benchmarks.bench_embeddings [--queries 200] [--min-cosine 0.99]
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from tracing import percentile
+
+
+BACKENDS = ("torch", "onnx")
+
+
+def rss_mb():
+    with open("/proc/self/status", encoding="utf-8") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return float("nan")
+
+
+def run_worker(backend, texts_path, vectors_path, queries):
+    """Pomiary jednego silnika (uruchamiane w osobnym procesie)."""
+    import rag
+
+    with open(texts_path, encoding="utf-8") as f:
+        texts = json.load(f)
+
+    start = time.perf_counter()
+    model = rag.load_embedding_model(backend)
+    model.embed_query("rozgrzewka")
+    load_s = time.perf_counter() - start
+    rss_loaded = rss_mb()
+
+    query_texts = (texts * (queries // max(1, len(texts)) + 1))[:queries]
+    latencies = []
+    for text in query_texts:
+        start = time.perf_counter()
+        model.embed_query(text)
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    vectors = np.asarray(model.embed_documents(texts), dtype=np.float32)
+    batch_s = time.perf_counter() - start
+    np.save(vectors_path, vectors)
+
+    return {
+        "backend": backend,
+        "model": type(model).__name__,
+        "load_s": load_s,
+        "rss_loaded_mb": rss_loaded,
+        "rss_peak_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "query_p50_ms": percentile(latencies, 0.5) * 1000,
+        "query_p95_ms": percentile(latencies, 0.95) * 1000,
+        "docs_per_s": len(texts) / batch_s,
+    }
+
+
+def topk_agreement(reference, candidate, k=4):
+    """Średnie pokrycie top-k fragmentów bazy wiedzy dla zapytań embeddowanych dwoma silnikami."""
+    from rag_config import VECTOR_STORE_PATH
+    from vector_store import MmapVectorStore, store_exists
+
+    if not store_exists(VECTOR_STORE_PATH):
+        return None
+    store = MmapVectorStore.load(VECTOR_STORE_PATH, None)
+    _, reference_top = store.search_vectors(reference, k)
+    _, candidate_top = store.search_vectors(candidate, k)
+    return float(np.mean([len(set(a) & set(b)) / len(a) for a, b in zip(reference_top, candidate_top)]))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", type=int, default=200, help="Liczba pojedynczych zapytań do pomiaru opóźnienia.")
+    parser.add_argument("--min-cosine", type=float, default=0.99, help="Minimalna akceptowalna zgodność cosinusowa.")
+    parser.add_argument("--worker", choices=BACKENDS, help=argparse.SUPPRESS)
+    parser.add_argument("--texts", help=argparse.SUPPRESS)
+    parser.add_argument("--vectors", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        print(json.dumps(run_worker(args.worker, args.texts, args.vectors, args.queries)))
+        return 0
+
+    from onnx_embeddings import cosine_agreement, sample_texts
+
+    with tempfile.TemporaryDirectory() as tmp:
+        texts_path = os.path.join(tmp, "texts.json")
+        with open(texts_path, "w", encoding="utf-8") as f:
+            json.dump(sample_texts(), f, ensure_ascii=False)
+
+        results = {}
+        vectors = {}
+        for backend in BACKENDS:
+            vectors_path = os.path.join(tmp, f"{backend}.npy")
+            output = subprocess.run(
+                [sys.executable, "-m", "benchmarks.bench_embeddings", "--worker", backend,
+                 "--texts", texts_path, "--vectors", vectors_path, "--queries", str(args.queries)],
+                check=True, capture_output=True, text=True,
+            ).stdout
+            # Ostatnia linia to wynik; wcześniejsze to komunikaty ładowania modelu
+            results[backend] = json.loads(output.strip().splitlines()[-1])
+            vectors[backend] = np.load(vectors_path)
+
+    print(f"{'silnik':<7} {'model':<24} {'wczytanie [s]':>13} {'RSS [MB]':>9} {'szczyt [MB]':>12} "
+          f"{'p50 [ms]':>9} {'p95 [ms]':>9} {'fragm./s':>9}")
+    for backend in BACKENDS:
+        r = results[backend]
+        print(f"{backend:<7} {r['model']:<24} {r['load_s']:>13.2f} {r['rss_loaded_mb']:>9.0f} {r['rss_peak_mb']:>12.0f} "
+              f"{r['query_p50_ms']:>9.2f} {r['query_p95_ms']:>9.2f} {r['docs_per_s']:>9.1f}")
+
+    cosines = cosine_agreement(vectors["torch"], vectors["onnx"])
+    print(f"Zgodność cosinusowa ONNX z PyTorch ({len(cosines)} tekstów): min {cosines.min():.4f}, średnio {cosines.mean():.4f}.")
+    overlap = topk_agreement(vectors["torch"], vectors["onnx"])
+    if overlap is not None:
+        print(f"Pokrycie top-4 wyników wyszukiwania: {overlap:.3f}")
+    if cosines.min() < args.min_cosine:
+        print(f"Zgodność poniżej {args.min_cosine}!")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
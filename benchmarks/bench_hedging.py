@@ -0,0 +1,75 @@
+"""
+Czas do pierwszego tokenu (TTFT) z zapytaniami zabezpieczającymi (llm_hedging.py) i bez nich,
+na lokalnej atrapie API (devtools/fake_openai_server.py) z wolnym ogonem odpowiedzi.
+
+Dla każdego wariantu: TTFT p50/p95/p99, odsetek wywołań zabezpieczonych, odsetek
+wygranych przez wywołanie zapasowe i liczba dodatkowych zapytań do dostawcy.
+
+    python -m benchmarks.bench_hedging [--calls 200] [--threads 8] [--hedge-after 1.0]
+        [--slow-prob 0.05] [--slow-ttft 8] [--fallback-model openai/gpt-4o-mini-fallback]
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_core.messages import HumanMessage
+
+import llm_governor
+import llm_hedging
+from devtools.fake_openai_server import make_server
+from rag import CHAT_MODEL_NAME
+from tracing import percentile
+
+
+def run_variant(base_url, hedge_after_s, fallback_model, calls, threads):
+    chat = llm_hedging.HedgedChatOpenAI(
+        model_name=CHAT_MODEL_NAME, openai_api_key="bench", base_url=base_url, temperature=0.0,
+        stream_usage=True, max_retries=0, hedge_after_s=hedge_after_s, fallback_model_name=fallback_model,
+    )
+    ttfts = []
+
+    def one(i):
+        start = time.perf_counter()
+        for _ in chat.stream([HumanMessage(content=f"Pytanie {i}: jak poradzić sobie z porażką?")]):
+            ttfts.append(time.perf_counter() - start)
+            break
+
+    before = llm_hedging.hedge_stats()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(one, range(calls)))
+    after = llm_hedging.hedge_stats()
+    delta = {key: after[key] - before[key] for key in ("calls", "hedged", "hedge_wins")}
+    return ttfts, delta
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=200, help="Liczba wywołań na wariant.")
+    parser.add_argument("--threads", type=int, default=8, help="Liczba równoległych uczestników.")
+    parser.add_argument("--hedge-after", type=float, default=1.0, help="Próg zabezpieczenia [s].")
+    parser.add_argument("--ttft", type=float, default=0.3, help="Typowe opóźnienie pierwszego tokenu atrapy [s].")
+    parser.add_argument("--slow-prob", type=float, default=0.05, help="Prawdopodobieństwo wolnej odpowiedzi.")
+    parser.add_argument("--slow-ttft", type=float, default=8.0, help="Opóźnienie pierwszego tokenu wolnej odpowiedzi [s].")
+    parser.add_argument("--fallback-model", default=None, help="Model wywołania zapasowego (domyślnie ten sam).")
+    args = parser.parse_args(argv)
+
+    # Limity dostawcy nie dotyczą atrapy - pomiar ma pokazać wpływ samego zabezpieczania
+    llm_governor._governor = llm_governor.LLMGovernor(rate_per_s=1000.0, burst=1000, max_in_flight=2 * args.threads)
+
+    for name, hedge_after_s in (("bez zabezpieczenia", None), (f"zabezpieczenie po {args.hedge_after:g} s", args.hedge_after)):
+        server = make_server(ttft_s=args.ttft, token_delay_s=0.005, slow_prob=args.slow_prob,
+                             slow_ttft_s=args.slow_ttft, seed=42)
+        try:
+            ttfts, delta = run_variant(server.base_url, hedge_after_s, args.fallback_model, args.calls, args.threads)
+            requests = server.config.stats["requests"]
+        finally:
+            server.shutdown()
+        hedge_rate = delta["hedged"] / delta["calls"] if delta["calls"] else 0.0
+        win_rate = delta["hedge_wins"] / delta["hedged"] if delta["hedged"] else 0.0
+        print(f"{name}: TTFT p50 {percentile(ttfts, 0.5):.2f} s, p95 {percentile(ttfts, 0.95):.2f} s, "
+              f"p99 {percentile(ttfts, 0.99):.2f} s | zabezpieczone {hedge_rate:.1%}, wygrane zapasowe {win_rate:.1%}, "
+              f"dodatkowe zapytania {requests - args.calls} ({(requests - args.calls) / args.calls:.1%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+"""
+Odtwarzanie zapisanych rozmów (conversation_log) przez łańcuch RAG z setup_rag_system,
+z lokalną atrapą API modelu (devtools/fake_openai_server.py) zamiast OpenRouter.
+
+Mierzy narzut łańcucha w każdej turze poza samym modelem:
+- prompt    - budowanie promptów (ChatPromptTemplate: przepisanie zapytania i odpowiedź),
+- embed     - embedding zapytania,
+- search    - wyszukiwanie w bazie wiedzy (retriever bez embeddingu),
+- stuffing  - przycinanie i wstawianie fragmentów do promptu (budget_context, format_inputs),
+- overhead  - cała tura minus czas wywołań modelu.
+Czasy wywołań atrapy (llm) są podawane dla porządku, ale nie są porównywane.
+
+Mediany są porównywane z zapisaną linią bazową (benchmarks/baselines/replay.json);
+kod wyjścia 1 oznacza regresję, a 2 - brak linii bazowej (nie ma z czym porównać).
+Nie wymaga sieci ani klucza API, wymaga zbudowanej bazy wiedzy i modelu embeddingów.
+Linię bazową zapisuje się (--update-baseline) na maszynie, na której odbywają się
+pomiary porównawcze, i dołącza do repozytorium.
+
+    python -m benchmarks.bench_replay [--transcripts dane.csv] [--repeat 3] [--update-baseline] [--tolerance 0.25]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.embeddings import Embeddings
+
+from benchmarks.transcripts import iter_turns, load_conversations
+from devtools.fake_openai_server import make_server
+from tracing import percentile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_PATH = os.path.join(ROOT, "benchmarks", "baselines", "replay.json")
+
+# Etapy porównywane z linią bazową
+COMPARED = ("overhead_ms", "prompt_ms", "embed_ms", "search_ms", "stuffing_ms")
+# Przebiegi LangChain (według nazwy) zaliczane do etapów
+RUN_STAGES = {"ChatPromptTemplate": "prompt", "budget_context": "stuffing", "format_inputs": "stuffing"}
+
+
+class TimedEmbeddings(Embeddings):
+    """Opakowanie modelu embeddingów sumujące czas embeddingu zapytań."""
+
+    def __init__(self, embeddings):
+        self.embeddings = embeddings
+        self.total_s = 0.0
+        self._lock = threading.Lock()
+
+    def embed_documents(self, texts):
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text):
+        start = time.perf_counter()
+        try:
+            return self.embeddings.embed_query(text)
+        finally:
+            with self._lock:
+                self.total_s += time.perf_counter() - start
+
+
+class StageTimer(BaseCallbackHandler):
+    """Sumuje czasy etapów jednej tury na podstawie callbacków LangChain (również z wątków)."""
+
+    def __init__(self):
+        self.totals = {"prompt": 0.0, "stuffing": 0.0, "retrieval": 0.0, "llm": 0.0}
+        self._starts = {}
+        self._lock = threading.Lock()
+
+    def _start(self, run_id, stage):
+        if stage is not None:
+            with self._lock:
+                self._starts[run_id] = (stage, time.perf_counter())
+
+    def _end(self, run_id):
+        with self._lock:
+            started = self._starts.pop(run_id, None)
+            if started is not None:
+                stage, start = started
+                self.totals[stage] += time.perf_counter() - start
+
+    def on_chain_start(self, serialized, inputs, *, run_id, name=None, **kwargs):
+        self._start(run_id, RUN_STAGES.get(name or (serialized or {}).get("name")))
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._start(run_id, "llm")
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_retriever_start(self, serialized, query, *, run_id, **kwargs):
+        self._start(run_id, "retrieval")
+
+    def on_retriever_end(self, documents, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_retriever_error(self, error, *, run_id, **kwargs):
+        self._end(run_id)
+
+
+def replay_turn(chain, turn, embeddings, use_async):
+    """Jedna tura tak jak w chat_screen (strumieniowanie odpowiedzi). Zwraca czasy etapów w ms."""
+    import async_runtime
+
+    timer = StageTimer()
+    config = {"callbacks": [timer]}
+    embed_before = embeddings.total_s
+    start = time.perf_counter()
+    if use_async:
+        chunks = async_runtime.get_runtime().stream(chain.astream(turn, config=config))
+    else:
+        chunks = chain.stream(turn, config=config)
+    for _ in chunks:
+        pass
+    total = time.perf_counter() - start
+    embed = embeddings.total_s - embed_before
+    return {
+        "total_ms": total * 1000,
+        "llm_ms": timer.totals["llm"] * 1000,
+        "overhead_ms": (total - timer.totals["llm"]) * 1000,
+        "prompt_ms": timer.totals["prompt"] * 1000,
+        "embed_ms": embed * 1000,
+        "search_ms": max(0.0, timer.totals["retrieval"] - embed) * 1000,
+        "stuffing_ms": timer.totals["stuffing"] * 1000,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--transcripts", help="CSV z kolumną conversation_log lub JSON z listą rozmów.")
+    parser.add_argument("--repeat", type=int, default=3, help="Ile razy odtworzyć wszystkie tury.")
+    parser.add_argument("--warmup", type=int, default=3, help="Liczba tur na rozgrzanie (bez pomiaru).")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Dopuszczalny względny wzrost mediany.")
+    parser.add_argument("--min-delta-ms", type=float, default=2.0, help="Wzrost poniżej tej wartości nie jest regresją.")
+    parser.add_argument("--update-baseline", action="store_true", help="Zapisz wyniki jako nową linię bazową.")
+    args = parser.parse_args(argv)
+
+    # Atrapa odpowiada natychmiast - czas modelu nie zasłania narzutu łańcucha
+    server = make_server(ttft_s=0.0, token_delay_s=0.0)
+    os.environ["VINCENT_OPENAI_BASE_URL"] = server.base_url
+
+    import llm_governor
+    import rag
+    from rag_config import EMBEDDING_BACKEND, LLM_ASYNC
+
+    # Limity dostawcy nie dotyczą atrapy
+    llm_governor._governor = llm_governor.LLMGovernor(rate_per_s=1000.0, burst=1000)
+
+    embeddings = TimedEmbeddings(rag.load_embedding_model())
+    vector_store = rag.load_vector_store(embeddings)
+    if vector_store is None:
+        raise SystemExit("Brak bazy wiedzy - uruchom najpierw prepare_rag_data.py.")
+    chat = rag.create_chat_model("replay").model_copy(update={"hedge_after_s": None})
+    # Ten sam łańcuch co setup_rag_system w app.py (wariant bez podanej płci)
+    chain = rag.build_rag_chains(chat, vector_store.as_retriever())[rag.gender_variant(None)]
+
+    turns = [turn for conversation in load_conversations(args.transcripts) for turn in iter_turns(conversation)]
+    for turn in turns[:args.warmup]:
+        replay_turn(chain, turn, embeddings, LLM_ASYNC)
+
+    results = []
+    try:
+        for _ in range(args.repeat):
+            results.extend(replay_turn(chain, turn, embeddings, LLM_ASYNC) for turn in turns)
+    finally:
+        server.shutdown()
+
+    medians = {key: statistics.median(result[key] for result in results) for key in results[0]}
+    print(f"Tur: {len(turns)} x {args.repeat}, embeddingi: {EMBEDDING_BACKEND}, async: {LLM_ASYNC}")
+    print(f"{'etap':<14}{'p50 [ms]':>10}{'p95 [ms]':>10}")
+    for key in medians:
+        values = [result[key] for result in results]
+        print(f"{key:<14}{percentile(values, 0.5):>10.1f}{percentile(values, 0.95):>10.1f}")
+
+    summary = {"turns": len(turns), "embedding_backend": EMBEDDING_BACKEND, "async": LLM_ASYNC, "medians_ms": medians}
+    if args.update_baseline:
+        os.makedirs(os.path.dirname(BASELINE_PATH), exist_ok=True)
+        with open(BASELINE_PATH, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+        print(f"Zapisano linię bazową w {BASELINE_PATH}.")
+        return 0
+
+    if not os.path.exists(BASELINE_PATH):
+        print(f"Brak linii bazowej ({BASELINE_PATH}) - wyniki nie zostały z niczym porównane. "
+              "Zapisz ją, uruchamiając z --update-baseline.")
+        return 2
+    with open(BASELINE_PATH, encoding="utf-8") as f:
+        baseline = json.load(f)
+    for key in ("turns", "embedding_backend", "async"):
+        if baseline.get(key) != summary[key]:
+            print(f"Uwaga: linia bazowa zmierzona przy {key}={baseline.get(key)!r}, teraz {summary[key]!r}.")
+
+    regressions = []
+    for key in COMPARED:
+        base = baseline["medians_ms"].get(key)
+        if base is None:
+            continue
+        if medians[key] > base * (1 + args.tolerance) and medians[key] - base > args.min_delta_ms:
+            regressions.append(f"{key}: {medians[key]:.1f} ms (linia bazowa {base:.1f} ms)")
+        else:
+            print(f"{key}: {medians[key]:.1f} ms (linia bazowa {base:.1f} ms)")
+    for regression in regressions:
+        print(f"Regresja - {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
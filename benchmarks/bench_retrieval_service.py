@@ -0,0 +1,58 @@
+"""
+Przepustowość wyszukiwania przy równoległych zapytaniach: retriever w procesie
+aplikacji kontra wspólny serwis (retrieval_service.py) z micro-batchingiem.
+
+Serwis musi być uruchomiony osobno (python retrieval_service.py --socket ...).
+
+    python -m benchmarks.bench_retrieval_service --socket /tmp/vincent_retrieval.sock [--threads 1 4 16] [--queries 400]
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import rag
+from benchmarks.transcripts import SAMPLE_CONVERSATIONS
+from retrieval_service import RemoteRetriever, service_stats
+from tracing import percentile
+
+
+def measure(retriever, queries, threads):
+    latencies = []
+
+    def one(query):
+        start = time.perf_counter()
+        retriever.invoke(query)
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(one, queries))
+    return len(queries) / (time.perf_counter() - start), latencies
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--socket", required=True, help="Gniazdo działającego serwisu wyszukiwania.")
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 4, 16], help="Liczby równoległych uczestników.")
+    parser.add_argument("--queries", type=int, default=400, help="Liczba zapytań w każdym pomiarze.")
+    args = parser.parse_args(argv)
+
+    messages = [msg["content"] for conversation in SAMPLE_CONVERSATIONS for msg in conversation if msg["role"] == "user"]
+    queries = (messages * (args.queries // len(messages) + 1))[:args.queries]
+
+    vector_store = rag.load_vector_store(rag.load_embedding_model())
+    if vector_store is None:
+        raise SystemExit("Brak bazy wiedzy - uruchom najpierw prepare_rag_data.py.")
+    retrievers = {"w procesie": vector_store.as_retriever(), "serwis": RemoteRetriever(socket_path=args.socket)}
+
+    print(f"{'retriever':<11} {'wątki':>6} {'zapytań/s':>10} {'p50 [ms]':>9} {'p95 [ms]':>9}")
+    for threads in args.threads:
+        for name, retriever in retrievers.items():
+            qps, latencies = measure(retriever, queries, threads)
+            print(f"{name:<11} {threads:>6} {qps:>10.1f} {percentile(latencies, 0.5) * 1000:>9.2f} "
+                  f"{percentile(latencies, 0.95) * 1000:>9.2f}")
+    print(f"Statystyki serwisu: {service_stats(args.socket)}")
+
+
+if __name__ == "__main__":
+    main()
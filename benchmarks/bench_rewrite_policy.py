@@ -0,0 +1,64 @@
+"""
+Porównanie polityk przepisywania zapytania (REWRITE_POLICY): opóźnienie etapu
+wyszukiwania (przepisanie + embedding + wyszukiwanie) i zgodność znalezionych
+fragmentów z polityką "always" (średnie pokrycie top-k).
+
+Wymaga zbudowanej bazy wiedzy i klucza OPENROUTER_API_KEY w zmiennych środowiskowych.
+
+    python -m benchmarks.bench_rewrite_policy [--transcripts dane.csv] [--repeat 1]
+"""
+import argparse
+import os
+import statistics
+import time
+
+import rag
+from benchmarks.transcripts import iter_turns, load_conversations
+from tracing import percentile
+
+
+def doc_key(doc):
+    return (doc.metadata.get("source"), doc.metadata.get("page"), doc.page_content[:80])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--transcripts", help="CSV z kolumną conversation_log lub JSON z listą rozmów.")
+    parser.add_argument("--repeat", type=int, default=1, help="Ile razy powtórzyć każdą turę.")
+    args = parser.parse_args(argv)
+
+    embedding_model = rag.load_embedding_model()
+    vector_store = rag.load_vector_store(embedding_model)
+    if vector_store is None:
+        raise SystemExit("Brak bazy wiedzy - uruchom najpierw prepare_rag_data.py.")
+    chat = rag.create_chat_model(os.environ["OPENROUTER_API_KEY"])
+    retriever = vector_store.as_retriever()
+
+    turns = [turn for conversation in load_conversations(args.transcripts) for turn in iter_turns(conversation)]
+    retrievers = {policy: rag.create_query_retriever(chat, retriever, policy) for policy in rag.REWRITE_POLICIES}
+
+    latencies = {policy: [] for policy in rag.REWRITE_POLICIES}
+    overlaps = {policy: [] for policy in rag.REWRITE_POLICIES}
+    for turn in turns:
+        for _ in range(args.repeat):
+            results = {}
+            for policy, query_retriever in retrievers.items():
+                start = time.perf_counter()
+                docs = query_retriever.invoke(turn)
+                latencies[policy].append(time.perf_counter() - start)
+                results[policy] = {doc_key(doc) for doc in docs}
+            reference = results["always"]
+            for policy, keys in results.items():
+                overlaps[policy].append(len(keys & reference) / len(reference) if reference else 1.0)
+
+    print(f"Tur: {len(turns)}, powtórzeń: {args.repeat}, heurystyka przepisuje "
+          f"{sum(rag.needs_rewrite(turn) for turn in turns)}/{len(turns)} tur.")
+    print(f"{'polityka':<10} {'p50 [s]':>8} {'p95 [s]':>8} {'średnio [s]':>12} {'zgodność z always':>18}")
+    for policy in rag.REWRITE_POLICIES:
+        values = latencies[policy]
+        print(f"{policy:<10} {percentile(values, 0.5):>8.3f} {percentile(values, 0.95):>8.3f} "
+              f"{statistics.mean(values):>12.3f} {statistics.mean(overlaps[policy]):>18.2f}")
+
+
+if __name__ == "__main__":
+    main()
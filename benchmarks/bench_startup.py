@@ -0,0 +1,135 @@
+"""
+Czas startu aplikacji: importy modułu app.py i pierwsze wyświetlenie ekranu zgody.
+
+Każdy pomiar odbywa się w świeżym procesie:
+1. `python -X importtime` dla importów z najwyższego poziomu app.py - suma czasu
+   i najwolniejsze moduły; ciężkie biblioteki (LangChain, PyTorch, gspread...)
+   nie powinny się tu pojawiać,
+2. pierwszy przebieg skryptu w AppTest (Streamlit) aż do narysowania ekranu zgody.
+
+Wyniki są porównywane z zapisaną linią bazową (benchmarks/baselines/startup.json);
+kod wyjścia 1 oznacza regresję, a 2 - brak linii bazowej (nie ma z czym porównać).
+Linia bazowa jest w repozytorium; po świadomej zmianie czasu startu należy ją
+zaktualizować (--update-baseline) na tej samej maszynie co pomiary porównawcze.
+
+    python -m benchmarks.bench_startup [--repeat 5] [--update-baseline] [--tolerance 0.2]
+"""
+import argparse
+import ast
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_PATH = os.path.join(ROOT, "app.py")
+BASELINE_PATH = os.path.join(ROOT, "benchmarks", "baselines", "startup.json")
+
+# Moduły, które nie powinny być importowane przed wejściem na czat
+HEAVY_MODULES = (
+    "torch", "transformers", "sentence_transformers", "onnxruntime", "faiss",
+    "langchain", "langchain_core", "langchain_community", "langchain_openai", "langchain_huggingface",
+    "openai", "gspread", "google.oauth2", "rag",
+)
+
+FIRST_PAINT_SCRIPT = """
+import json, time
+start = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file({app_path!r}, default_timeout=120)
+at.secrets["OPENROUTER_API_KEY"] = "bench"
+at.run()
+print(json.dumps({{"first_paint_s": time.perf_counter() - start, "title": at.title[0].value if at.title else None}}))
+"""
+
+
+def top_level_imports(path=APP_PATH):
+    """Instrukcje importu z najwyższego poziomu pliku (bez importów wewnątrz funkcji)."""
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    return "\n".join(ast.unparse(node) for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom)))
+
+
+def measure_imports(code):
+    """Uruchamia importy z `-X importtime`. Zwraca (łączny czas [s], {moduł: czas skumulowany [s]})."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    )
+    modules = {}
+    total_us = 0
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        _, cumulative, name = (part.strip() for part in line[len("import time:"):].split("|"))
+        raw_name = line.rsplit("|", 1)[1]
+        modules[name] = int(cumulative) / 1e6
+        # Moduły importowane bezpośrednio (bez wcięcia) sumują się do łącznego czasu
+        if raw_name.startswith(" ") and not raw_name.startswith("  "):
+            total_us += int(cumulative)
+    return total_us / 1e6, modules
+
+
+def measure_first_paint():
+    output = subprocess.run(
+        [sys.executable, "-c", FIRST_PAINT_SCRIPT.format(app_path=APP_PATH)],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5, help="Liczba świeżych procesów na pomiar.")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Dopuszczalny wzrost względem linii bazowej.")
+    parser.add_argument("--update-baseline", action="store_true", help="Zapisz wyniki jako nową linię bazową.")
+    parser.add_argument("--skip-first-paint", action="store_true", help="Tylko pomiar importów (bez Streamlit AppTest).")
+    args = parser.parse_args(argv)
+
+    code = top_level_imports()
+    import_runs = [measure_imports(code) for _ in range(args.repeat)]
+    import_s = statistics.median(total for total, _ in import_runs)
+    modules = import_runs[-1][1]
+    heavy = sorted(name for name in modules if name.split(".")[0] in HEAVY_MODULES or name in HEAVY_MODULES)
+
+    print(f"Importy app.py (mediana z {args.repeat}): {import_s * 1000:.0f} ms")
+    for name, seconds in sorted(modules.items(), key=lambda item: item[1], reverse=True)[:10]:
+        print(f"  {seconds * 1000:>8.1f} ms  {name}")
+    if heavy:
+        print(f"Ciężkie moduły importowane przy starcie: {', '.join(heavy[:20])}")
+
+    results = {"import_s": import_s, "heavy_modules": len(heavy)}
+    if not args.skip_first_paint:
+        paints = [measure_first_paint() for _ in range(args.repeat)]
+        results["first_paint_s"] = statistics.median(paint["first_paint_s"] for paint in paints)
+        print(f"Pierwsze wyświetlenie ekranu zgody (mediana): {results['first_paint_s']:.2f} s "
+              f"(tytuł: {paints[-1]['title']!r})")
+
+    if args.update_baseline:
+        os.makedirs(os.path.dirname(BASELINE_PATH), exist_ok=True)
+        with open(BASELINE_PATH, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Zapisano linię bazową w {BASELINE_PATH}.")
+        return 0
+
+    if not os.path.exists(BASELINE_PATH):
+        print(f"Brak linii bazowej ({BASELINE_PATH}) - wyniki nie zostały z niczym porównane. "
+              "Zapisz ją, uruchamiając z --update-baseline.")
+        return 2
+    with open(BASELINE_PATH, encoding="utf-8") as f:
+        baseline = json.load(f)
+
+    regressions = []
+    for key in ("import_s", "first_paint_s"):
+        if key in results and key in baseline and results[key] > baseline[key] * (1 + args.tolerance):
+            regressions.append(f"{key}: {results[key]:.3f} s (linia bazowa {baseline[key]:.3f} s)")
+    if results["heavy_modules"] > baseline.get("heavy_modules", 0):
+        regressions.append(f"ciężkie moduły przy starcie: {results['heavy_modules']} (linia bazowa {baseline.get('heavy_modules', 0)})")
+    for regression in regressions:
+        print(f"Regresja - {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
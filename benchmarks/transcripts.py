@@ -0,0 +1,87 @@
+"""
+Wczytywanie zapisanych rozmów (kolumna conversation_log z arkusza lub z outboxa)
+na potrzeby benchmarków.
+"""
+import csv
+import json
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+from context_budget import select_history
+from rag_config import HISTORY_TOKEN_BUDGET
+
+# Krótkie przykładowe rozmowy, używane gdy nie podano pliku z transkryptami
+SAMPLE_CONVERSATIONS = [
+    [
+        {"role": "assistant", "content": "Cześć, jestem Vincent – może to zabrzmi dziwnie, ale dziś mam wrażenie, że po prostu nie jestem wystarczająco dobry. Jak Ty sobie radzisz, kiedy mimo wysiłku coś nie wychodzi tak, jak chciał(a)byś?"},
+        {"role": "user", "content": "Zwykle najpierw się złoszczę na siebie, a potem próbuję to na spokojnie przeanalizować."},
+        {"role": "assistant", "content": "Dziękuję, że się tym dzielisz. Co pomaga Ci przejść od złości do spokojniejszego spojrzenia?"},
+        {"role": "user", "content": "Chyba rozmowa z przyjaciółką."},
+        {"role": "assistant", "content": "To brzmi jak ważne wsparcie. Czy potrafisz czasem powiedzieć sobie to, co powiedziałaby Ci ona?"},
+        {"role": "user", "content": "Rzadko. Dla siebie jestem dużo bardziej surowa niż dla innych ludzi, bo wydaje mi się, że jak sobie odpuszczę, to przestanę się starać i wszystko się rozsypie."},
+        {"role": "assistant", "content": "Znam to uczucie – też boję się, że jeśli przestanę się pilnować, przestanę być coś wart. Skąd Twoim zdaniem bierze się ta surowość?"},
+        {"role": "user", "content": "Tak było u mnie w domu."},
+    ],
+    [
+        {"role": "assistant", "content": "Cześć, jestem Vincent. Jak Ty sobie radzisz, kiedy mimo wysiłku coś nie wychodzi tak, jak chciał(a)byś?"},
+        {"role": "user", "content": "Porównuję się z innymi i wtedy czuję się jeszcze gorzej, szczególnie w pracy, gdzie wszyscy wydają się szybsi i lepiej zorganizowani ode mnie."},
+        {"role": "assistant", "content": "Ja też często mam wrażenie, że inni radzą sobie szybciej. Co wtedy czujesz najmocniej?"},
+        {"role": "user", "content": "Wstyd i zmęczenie."},
+        {"role": "assistant", "content": "Dziękuję za szczerość. Czy jest coś, co pozwala Ci choć trochę odpocząć od tego porównywania?"},
+        {"role": "user", "content": "Spacer bez telefonu i przypominanie sobie, że każdy ma swoje tempo i swoje gorsze dni, nawet jeśli tego nie pokazuje."},
+    ],
+]
+
+
+def parse_conversation_log(text):
+    """
+    Zamienia conversation_log ("User: ...\\nAssistant: ...") na listę wiadomości
+    {"role", "content"}. Linie bez prefiksu są doklejane do poprzedniej wiadomości.
+    """
+    messages = []
+    for line in text.splitlines():
+        for prefix, role in (("User: ", "user"), ("Assistant: ", "assistant")):
+            if line.startswith(prefix):
+                messages.append({"role": role, "content": line[len(prefix):]})
+                break
+        else:
+            if messages:
+                messages[-1]["content"] += "\n" + line
+    return messages
+
+
+def load_conversations(path=None):
+    """
+    Wczytuje rozmowy z pliku CSV (kolumna conversation_log, np. eksport arkusza
+    albo `python outbox.py export`) lub JSON (lista list wiadomości).
+    Bez ścieżki zwraca SAMPLE_CONVERSATIONS.
+    """
+    if path is None:
+        return SAMPLE_CONVERSATIONS
+    if path.endswith(".json"):
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    conversations = []
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            log = row.get("conversation_log") or ""
+            messages = parse_conversation_log(log)
+            if any(msg["role"] == "user" for msg in messages):
+                conversations.append(messages)
+    return conversations
+
+
+def iter_turns(conversation, history_budget=HISTORY_TOKEN_BUDGET):
+    """
+    Dla każdej wiadomości użytkownika zwraca wejście łańcucha {"input", "chat_history"}
+    zbudowane tak jak w chat_screen (pierwsza wiadomość Vincenta + ostatnie wiadomości w budżecie tokenów).
+    """
+    for i, msg in enumerate(conversation):
+        if msg["role"] != "user":
+            continue
+        recent, _ = select_history(conversation[:i], msg["content"], history_budget)
+        chat_history = [
+            HumanMessage(content=m["content"]) if m["role"] == "user" else AIMessage(content=m["content"])
+            for m in recent
+        ]
+        yield {"input": msg["content"], "chat_history": chat_history}
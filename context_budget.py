@@ -0,0 +1,149 @@
+"""
+Składanie kontekstu promptu w stałym budżecie tokenów: historia rozmowy
+i fragmenty z bazy wiedzy.
+
+Tokeny są liczone lokalnie, szacunkowo (bez pobierania słowników tokenizera
+z sieci): każde słowo to co najmniej jeden token, długie słowa - jeden token
+na każde 4 znaki, a każdy znak interpunkcyjny to osobny token. Dla polskiego
+tekstu i modeli z rodziny gpt-4o daje to przybliżenie z nadmiarem, czyli
+bezpieczne dla budżetu.
+"""
+import math
+import re
+
+from langchain_core.documents import Document
+
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+_WORD_RE = re.compile(r"\w+")
+_SENTENCE_RE = re.compile(r"(?<=[.!?…])\s+")
+
+# Stały narzut na wiadomość w formacie czatu (rola, separatory)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def count_tokens(text):
+    """Szacunkowa liczba tokenów tekstu."""
+    return sum(max(1, math.ceil(len(piece) / 4)) for piece in _TOKEN_RE.findall(text or ""))
+
+
+def _words(text):
+    return [word.lower() for word in _WORD_RE.findall(text)]
+
+
+def _shingles(text, size=5):
+    words = _words(text)
+    if len(words) < size:
+        return {tuple(words)} if words else set()
+    return {tuple(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def select_history(chat_history, user_input, budget):
+    """
+    Wybiera wiadomości historii czatu mieszczące się w budżecie tokenów.
+    Pierwsza wiadomość Vincenta jest zawsze zachowana (ustawia temat rozmowy),
+    a pozostałe są dobierane od najnowszych. Bieżąca wiadomość użytkownika,
+    jeśli jest już na końcu historii, jest pomijana (trafia do promptu osobno).
+    Zwraca (wybrane wiadomości w kolejności rozmowy, statystyki).
+    """
+    messages = list(chat_history)
+    if messages and messages[-1]["role"] == "user" and messages[-1]["content"] == user_input:
+        messages.pop()
+
+    costs = [count_tokens(msg["content"]) + MESSAGE_OVERHEAD_TOKENS for msg in messages]
+    total = sum(costs)
+
+    first_bot_index = next((i for i, msg in enumerate(messages) if msg["role"] == "assistant"), None)
+    selected = set()
+    used = 0
+    if first_bot_index is not None:
+        selected.add(first_bot_index)
+        used += costs[first_bot_index]
+
+    for i in range(len(messages) - 1, -1, -1):
+        if i in selected:
+            continue
+        if used + costs[i] > budget:
+            break
+        selected.add(i)
+        used += costs[i]
+
+    chosen = [messages[i] for i in sorted(selected)]
+    return chosen, {"history_tokens": used, "history_tokens_saved": total - used}
+
+
+def trim_to_relevant_sentences(text, query, max_tokens):
+    """Skraca fragment do zdań najbardziej związanych z zapytaniem (w oryginalnej kolejności)."""
+    if count_tokens(text) <= max_tokens:
+        return text
+    sentences = [s for s in _SENTENCE_RE.split(text) if s.strip()]
+    query_words = set(_words(query))
+
+    def score(item):
+        index, sentence = item
+        words = _words(sentence)
+        overlap = sum(1 for word in words if word in query_words)
+        # Przy równym wyniku wygrywają zdania z początku fragmentu
+        return (overlap / math.sqrt(len(words) or 1), -index)
+
+    kept = []
+    used = 0
+    for index, sentence in sorted(enumerate(sentences), key=score, reverse=True):
+        cost = count_tokens(sentence)
+        if used + cost > max_tokens:
+            continue
+        kept.append(index)
+        used += cost
+    if not kept:
+        # Pojedyncze zdanie dłuższe niż limit - obcinamy po słowach
+        kept_words = []
+        used = 0
+        for word in text.split():
+            cost = count_tokens(word)
+            if used + cost > max_tokens:
+                break
+            kept_words.append(word)
+            used += cost
+        return " ".join(kept_words)
+    return " ".join(sentences[i] for i in sorted(kept))
+
+
+def select_documents(query, docs, budget, max_chunk_tokens, duplicate_threshold=0.6):
+    """
+    Wybiera fragmenty z bazy wiedzy w budżecie tokenów, w kolejności trafności
+    zwróconej przez retriever. Pomija fragmenty w dużej części pokrywające się
+    z już wybranymi (np. nakładki z dzielenia tekstu), a zbyt długie skraca do
+    zdań związanych z zapytaniem. Zwraca (dokumenty, statystyki).
+    """
+    total = sum(count_tokens(doc.page_content) for doc in docs)
+    selected = []
+    selected_shingles = []
+    used = 0
+    duplicates = 0
+    for doc in docs:
+        shingles = _shingles(doc.page_content)
+        if any(
+            shingles and len(shingles & other) / min(len(shingles), len(other)) >= duplicate_threshold
+            for other in selected_shingles if other
+        ):
+            duplicates += 1
+            continue
+
+        remaining = budget - used
+        if remaining <= 0:
+            break
+        text = trim_to_relevant_sentences(doc.page_content, query, min(max_chunk_tokens, remaining))
+        if not text:
+            continue
+        cost = count_tokens(text)
+        if text != doc.page_content:
+            doc = Document(page_content=text, metadata=doc.metadata)
+        selected.append(doc)
+        selected_shingles.append(shingles)
+        used += cost
+
+    return selected, {
+        "context_tokens": used,
+        "context_tokens_saved": total - used,
+        "context_documents": len(selected),
+        "context_duplicates": duplicates,
+    }
@@ -0,0 +1 @@
+"""Narzędzia deweloperskie (atrapy usług zewnętrznych do testów i pomiarów). Nie są używane na produkcji."""
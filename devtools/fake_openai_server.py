@@ -0,0 +1,195 @@
+"""
+Lokalna atrapa API zgodnego z OpenAI (POST /v1/chat/completions) do testów i pomiarów.
+
+Odpowiada krótkim tekstem, z opóźnieniem pierwszego tokenu (`ttft_s`) i kolejnych
+tokenów (`token_delay_s`). Z prawdopodobieństwem `slow_prob` pierwszy token
+przychodzi po `slow_ttft_s` (wolny ogon, jak czasem w OpenRouter), a z
+prawdopodobieństwem `error_rate` zapytanie kończy się błędem 429 albo 500.
+`model_ttft` pozwala ustawić osobne opóźnienie dla wybranych modeli (np. modelu zapasowego).
+
+Obsługuje odpowiedzi strumieniowane (SSE, z fragmentem `usage` przy
+`stream_options.include_usage`) i zwykłe.
+
+Aplikacja łączy się z atrapą przez zmienną VINCENT_OPENAI_BASE_URL:
+    python -m devtools.fake_openai_server --port 8765 --slow-prob 0.05
+    VINCENT_OPENAI_BASE_URL=http://127.0.0.1:8765/v1 streamlit run app.py
+
+W testach i pomiarach: `server = make_server(...)`, `server.base_url`, `server.shutdown()`.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_REPLY = (
+    "Rozumiem, że to trudne. Porażka nie mówi wszystkiego o Tobie - spróbuj spojrzeć "
+    "na nią jak na informację, a nie wyrok. Co pomogłoby Ci zrobić następny mały krok?"
+)
+
+
+class FakeOpenAIConfig:
+    def __init__(self, ttft_s=0.2, token_delay_s=0.01, slow_prob=0.0, slow_ttft_s=20.0,
+                 error_rate=0.0, model_ttft=None, reply=DEFAULT_REPLY, seed=None):
+        self.ttft_s = ttft_s
+        self.token_delay_s = token_delay_s
+        self.slow_prob = slow_prob
+        self.slow_ttft_s = slow_ttft_s
+        self.error_rate = error_rate
+        self.model_ttft = dict(model_ttft or {})
+        self.reply = reply
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "streamed": 0, "slow": 0, "errors": 0, "disconnected": 0, "by_model": {}}
+
+    def plan(self, model):
+        """Losuje przebieg jednego zapytania: (kod błędu albo None, opóźnienie pierwszego tokenu)."""
+        with self._lock:
+            self.stats["requests"] += 1
+            self.stats["by_model"][model] = self.stats["by_model"].get(model, 0) + 1
+            if self._random.random() < self.error_rate:
+                self.stats["errors"] += 1
+                return self._random.choice((429, 500)), 0.0
+            if self._random.random() < self.slow_prob:
+                self.stats["slow"] += 1
+                return None, self.slow_ttft_s
+        return None, self.model_ttft.get(model, self.ttft_s)
+
+    def count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+
+def _tokens(text):
+    # Słowa razem ze spacją przed nimi - po złączeniu dają dokładnie `text`
+    words = text.split(" ")
+    return [words[0]] + [" " + word for word in words[1:]]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": f"Nieznana ścieżka {self.path}"}})
+            return
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        config = self.server.config
+        model = request.get("model", "fake")
+        error, ttft = config.plan(model)
+        if error is not None:
+            headers = {"Retry-After": "0.1"} if error == 429 else None
+            self._send_json(error, {"error": {"message": f"Atrapa: błąd {error}", "code": error}}, headers)
+            return
+
+        time.sleep(ttft)
+        tokens = _tokens(config.reply)
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        prompt_tokens = sum(len(str(message.get("content", "")).split()) for message in request.get("messages", []))
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(tokens), "total_tokens": prompt_tokens + len(tokens)}
+
+        if not request.get("stream"):
+            time.sleep(config.token_delay_s * len(tokens))
+            self._send_json(200, {
+                "id": completion_id, "object": "chat.completion", "created": int(time.time()), "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": config.reply}, "finish_reason": "stop"}],
+                "usage": usage,
+            })
+            return
+
+        config.count("streamed")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        def chunk(delta, finish_reason=None, **extra):
+            return {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}] if delta is not None else [],
+                    **extra}
+
+        events = [chunk({"role": "assistant", "content": ""})]
+        events += [chunk({"content": token}) for token in tokens]
+        events.append(chunk({}, "stop"))
+        if (request.get("stream_options") or {}).get("include_usage"):
+            events.append(chunk(None, usage=usage))
+        try:
+            for i, event in enumerate(events):
+                if i > 1:
+                    time.sleep(config.token_delay_s)
+                self.wfile.write(f"data: {json.dumps(event, ensure_ascii=False)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # Klient zamknął strumień (np. przegrane zapytanie zabezpieczające)
+            config.count("disconnected")
+
+
+class FakeOpenAIServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, config):
+        self.config = config
+        super().__init__(address, _Handler)
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+
+def make_server(host="127.0.0.1", port=0, **config):
+    """Uruchamia atrapę w wątku w tle (port 0 - dowolny wolny). Zatrzymanie: server.shutdown()."""
+    server = FakeOpenAIServer((host, port), FakeOpenAIConfig(**config))
+    threading.Thread(target=server.serve_forever, name="fake-openai", daemon=True).start()
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Lokalna atrapa API zgodnego z OpenAI.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--ttft", type=float, default=0.2, help="Opóźnienie pierwszego tokenu [s].")
+    parser.add_argument("--token-delay", type=float, default=0.01, help="Opóźnienie kolejnych tokenów [s].")
+    parser.add_argument("--slow-prob", type=float, default=0.0, help="Prawdopodobieństwo wolnej odpowiedzi.")
+    parser.add_argument("--slow-ttft", type=float, default=20.0, help="Opóźnienie pierwszego tokenu wolnej odpowiedzi [s].")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Odsetek odpowiedzi z błędem 429/500.")
+    parser.add_argument("--model-ttft", action="append", default=[], metavar="MODEL=S",
+                        help="Osobne opóźnienie pierwszego tokenu dla modelu (można powtarzać).")
+    args = parser.parse_args(argv)
+
+    model_ttft = {name: float(value) for name, value in (item.rsplit("=", 1) for item in args.model_ttft)}
+    server = FakeOpenAIServer((args.host, args.port), FakeOpenAIConfig(
+        ttft_s=args.ttft, token_delay_s=args.token_delay, slow_prob=args.slow_prob, slow_ttft_s=args.slow_ttft,
+        error_rate=args.error_rate, model_ttft=model_ttft,
+    ))
+    print(f"Atrapa OpenAI: {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    print(json.dumps(server.config.stats, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+"""
+Atrapa arkusza Google Sheets w pamięci - zastępuje get_sheet() w testach obciążeniowych.
+
+FakeWorksheet obsługuje wywołania gspread, których używa sheets_writer.py
+(row_values, col_values, batch_update, append_rows, add_cols, col_count), z:
+- opóźnieniem każdego wywołania (`latency_s` + losowo do `jitter_s`),
+- limitem zapytań na minutę (`quota_per_minute`, jak limit API Google Sheets) -
+  po jego przekroczeniu wywołanie kończy się gspread.exceptions.APIError z kodem 429,
+- losowymi błędami APIError 500/503 z prawdopodobieństwem `error_rate`.
+Nieudane wywołanie niczego nie zapisuje.
+
+Aplikacja używa atrapy, gdy ustawiona jest zmienna VINCENT_FAKE_SHEETS=1; parametry:
+VINCENT_FAKE_SHEETS_LATENCY_MS, VINCENT_FAKE_SHEETS_QUOTA (zapytań na minutę, 0 - bez limitu)
+i VINCENT_FAKE_SHEETS_ERROR_RATE.
+
+Kilka procesów może współdzielić jedną atrapę (jak jeden arkusz i jeden limit API dla kilku
+procesów Streamlit): proces, który ją trzyma, wywołuje serve_fake_sheet(), a pozostałe
+łączą się z nią przez VINCENT_FAKE_SHEETS_ADDRESS i VINCENT_FAKE_SHEETS_AUTHKEY.
+"""
+import os
+import random
+import threading
+import time
+from collections import deque
+from multiprocessing.managers import BaseManager, BaseProxy
+
+import gspread
+from gspread.utils import a1_to_rowcol
+
+
+class _FakeResponse:
+    """Minimalna odpowiedź HTTP, z której gspread.exceptions.APIError odczytuje błąd."""
+
+    def __init__(self, code, status, message):
+        self.status_code = code
+        self.headers = {}
+        self._payload = {"error": {"code": code, "message": message, "status": status}}
+        self.text = message
+
+    def json(self):
+        return self._payload
+
+
+def api_error(code, status, message):
+    return gspread.exceptions.APIError(_FakeResponse(code, status, message))
+
+
+class FakeWorksheet:
+    def __init__(self, latency_s=0.3, jitter_s=0.2, quota_per_minute=60, error_rate=0.0, col_count=26, seed=None):
+        self.latency_s = latency_s
+        self.jitter_s = jitter_s
+        self.quota_per_minute = quota_per_minute
+        self.error_rate = error_rate
+        self.col_count = col_count
+        self._rows = []
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._requests = deque()
+        self.stats = {"calls": {}, "quota_errors": 0, "injected_errors": 0}
+
+    def _request(self, method):
+        """Opóźnienie, limit zapytań i losowe błędy - wspólne dla każdego wywołania API."""
+        with self._lock:
+            self.stats["calls"][method] = self.stats["calls"].get(method, 0) + 1
+            delay = self.latency_s + self._random.uniform(0, self.jitter_s)
+            failure = self._random.random() < self.error_rate
+        time.sleep(delay)
+        with self._lock:
+            now = time.monotonic()
+            while self._requests and now - self._requests[0] > 60:
+                self._requests.popleft()
+            if self.quota_per_minute and len(self._requests) >= self.quota_per_minute:
+                self.stats["quota_errors"] += 1
+                raise api_error(429, "RESOURCE_EXHAUSTED", "Quota exceeded for quota metric 'Write requests' (atrapa).")
+            self._requests.append(now)
+            if failure:
+                self.stats["injected_errors"] += 1
+                raise api_error(self._random.choice((500, 503)), "UNAVAILABLE", "The service is currently unavailable (atrapa).")
+
+    def _cell_row(self, row, col):
+        while len(self._rows) < row:
+            self._rows.append([])
+        cells = self._rows[row - 1]
+        while len(cells) < col:
+            cells.append("")
+        return cells
+
+    def row_values(self, row):
+        self._request("row_values")
+        with self._lock:
+            values = list(self._rows[row - 1]) if row <= len(self._rows) else []
+        while values and values[-1] == "":
+            values.pop()
+        return values
+
+    def col_values(self, col):
+        self._request("col_values")
+        with self._lock:
+            values = [cells[col - 1] if len(cells) >= col else "" for cells in self._rows]
+        while values and values[-1] == "":
+            values.pop()
+        return values
+
+    def add_cols(self, cols):
+        self._request("add_cols")
+        with self._lock:
+            self.col_count += cols
+
+    def batch_update(self, data, **kwargs):
+        self._request("batch_update")
+        with self._lock:
+            for update in data:
+                first = update["range"].split("!")[-1].split(":")[0]
+                row, col = a1_to_rowcol(first)
+                if col + max(len(values) for values in update["values"]) - 1 > self.col_count:
+                    raise api_error(400, "INVALID_ARGUMENT", f"Range {update['range']} exceeds grid limits (atrapa).")
+                for i, values in enumerate(update["values"]):
+                    cells = self._cell_row(row + i, col + len(values) - 1)
+                    cells[col - 1:col - 1 + len(values)] = values
+        return {"totalUpdatedCells": sum(len(values) for update in data for values in update["values"])}
+
+    def append_rows(self, values, **kwargs):
+        self._request("append_rows")
+        with self._lock:
+            # Jak w Sheets: dopisanie za ostatnim niepustym wierszem
+            while self._rows and not any(self._rows[-1]):
+                self._rows.pop()
+            start = len(self._rows) + 1
+            self._rows.extend([str(value) for value in row] for row in values)
+            end = len(self._rows)
+        return {"updates": {"updatedRange": f"Arkusz1!A{start}:ZZ{end}", "updatedRows": len(values)}}
+
+    def records(self):
+        """Zawartość arkusza jako {user_id: {kolumna: wartość}} (bez opóźnień i limitów)."""
+        with self._lock:
+            if not self._rows:
+                return {}
+            headers = self._rows[0]
+            rows = [list(cells) for cells in self._rows[1:]]
+        records = {}
+        for cells in rows:
+            record = dict(zip(headers, cells))
+            if record.get("user_id"):
+                records.setdefault(record["user_id"], record)
+        return records
+
+
+class FakeWorksheetProxy(BaseProxy):
+    """Atrapa z innego procesu (serve_fake_sheet) - te same wywołania co FakeWorksheet, łącznie z błędami API."""
+
+    _exposed_ = ("row_values", "col_values", "add_cols", "batch_update", "append_rows", "records", "__getattribute__")
+
+    def row_values(self, row):
+        return self._callmethod("row_values", (row,))
+
+    def col_values(self, col):
+        return self._callmethod("col_values", (col,))
+
+    def add_cols(self, cols):
+        return self._callmethod("add_cols", (cols,))
+
+    def batch_update(self, data, **kwargs):
+        return self._callmethod("batch_update", (data,), kwargs)
+
+    def append_rows(self, values, **kwargs):
+        return self._callmethod("append_rows", (values,), kwargs)
+
+    def records(self):
+        return self._callmethod("records")
+
+    @property
+    def col_count(self):
+        return self._callmethod("__getattribute__", ("col_count",))
+
+
+class _SheetServer(BaseManager):
+    pass
+
+
+class _SheetClient(BaseManager):
+    pass
+
+
+_SheetClient.register("sheet", proxytype=FakeWorksheetProxy)
+
+
+def serve_fake_sheet(sheet):
+    """
+    Udostępnia `sheet` innym procesom (serwer w wątku tego procesu). Zwraca zmienne
+    środowiskowe, z którymi get_fake_sheet() w procesie potomnym połączy się z tą atrapą.
+    """
+    authkey = os.urandom(16)
+    _SheetServer.register("sheet", callable=lambda: sheet, proxytype=FakeWorksheetProxy)
+    server = _SheetServer(address=("127.0.0.1", 0), authkey=authkey).get_server()
+    threading.Thread(target=server.serve_forever, name="fake-sheets-server", daemon=True).start()
+    host, port = server.address
+    return {"VINCENT_FAKE_SHEETS_ADDRESS": f"{host}:{port}", "VINCENT_FAKE_SHEETS_AUTHKEY": authkey.hex()}
+
+
+def _connect(address, authkey):
+    host, port = address.rsplit(":", 1)
+    client = _SheetClient(address=(host, int(port)), authkey=bytes.fromhex(authkey))
+    client.connect()
+    return client.sheet()
+
+
+_sheet = None
+_sheet_lock = threading.Lock()
+
+
+def get_fake_sheet():
+    """
+    Jedna atrapa na proces, skonfigurowana zmiennymi środowiskowymi VINCENT_FAKE_SHEETS_*,
+    albo atrapa innego procesu, jeśli ustawiono VINCENT_FAKE_SHEETS_ADDRESS (serve_fake_sheet).
+    """
+    global _sheet
+    with _sheet_lock:
+        if _sheet is None and os.environ.get("VINCENT_FAKE_SHEETS_ADDRESS"):
+            _sheet = _connect(os.environ["VINCENT_FAKE_SHEETS_ADDRESS"], os.environ["VINCENT_FAKE_SHEETS_AUTHKEY"])
+            print(f"Używam wspólnej atrapy arkusza Google Sheets ({os.environ['VINCENT_FAKE_SHEETS_ADDRESS']}).")
+        if _sheet is None:
+            _sheet = FakeWorksheet(
+                latency_s=float(os.environ.get("VINCENT_FAKE_SHEETS_LATENCY_MS", "300")) / 1000,
+                quota_per_minute=int(os.environ.get("VINCENT_FAKE_SHEETS_QUOTA", "60")),
+                error_rate=float(os.environ.get("VINCENT_FAKE_SHEETS_ERROR_RATE", "0")),
+            )
+            print("Używam atrapy arkusza Google Sheets (VINCENT_FAKE_SHEETS).")
+        return _sheet
+
+
+def reset_fake_sheet(**config):
+    """Zastępuje atrapę nową, o podanych parametrach (np. przed kolejnym przebiegiem testu)."""
+    global _sheet
+    with _sheet_lock:
+        _sheet = FakeWorksheet(**config)
+        return _sheet
@@ -0,0 +1,265 @@
+"""
+Test obciążeniowy przebiegu badania: N symulowanych uczestników przechodzi przez
+zgodę -> ankietę wstępną -> rozmowę z Vincentem -> ankietę końcową -> podziękowanie
+(z feedbackiem), każdy we własnej sesji Streamlit AppTest.
+
+AppTest korzysta z globalnego Runtime Streamlit, więc jeden proces prowadzi naraz tylko
+jednego uczestnika: --concurrency to liczba procesów roboczych, jak kilka procesów
+Streamlit na jednej maszynie. Procesy współdzielą outbox (SQLite, synchronizuje tylko
+właściciel dzierżawy) i atrapę arkusza, którą udostępnia proces główny; st.cache_resource,
+governor LLM i SheetsWriter każdy proces ma własne.
+
+Zamiast Google Sheets używana jest atrapa w pamięci (devtools/fake_sheets.py)
+z opóźnieniem, limitem zapytań i losowymi błędami API, a zamiast OpenRouter -
+lokalna atrapa API (devtools/fake_openai_server.py). Outbox, ślady, sesje i stan
+rozgrzewania trafiają do katalogu tymczasowego.
+
+Raport: czas kolejnych kroków (p50/p95/max), przepustowość, błędy limitu
+i zapisu arkusza oraz utracone zapisy - pola, których po zakończeniu testu
+i opróżnieniu outboxa nie ma w arkuszu. Kod wyjścia 1 oznacza utracone zapisy
+albo uczestników, którzy nie ukończyli badania.
+
+    python -m devtools.loadtest [--participants 20] [--concurrency 5] [--chat-turns 3]
+        [--sheets-latency-ms 300] [--sheets-quota 60] [--sheets-error-rate 0.05] [--skip-chat]
+
+Rozmowa wymaga zbudowanej bazy wiedzy (prepare_rag_data.py); --skip-chat pomija ten etap.
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from devtools.fake_openai_server import make_server
+from devtools.fake_sheets import reset_fake_sheet, serve_fake_sheet
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_PATH = os.path.join(ROOT, "app.py")
+
+FINAL_STATUS = "ukończono_badanie_z_feedbackiem"
+# Pola, które po zakończeniu badania muszą być w wierszu uczestnika
+EXPECTED_FIELDS = (
+    "group", "timestamp_start", "timestamp_pretest_end", "demographics_age",
+    "timestamp_posttest_end", "timestamp_feedback_submit", "feedback_final_positive",
+)
+CHAT_FIELDS = ("timestamp_chat_end", "conversation_log")
+
+MESSAGES = [
+    "Mnie też czasem coś nie wychodzi i wtedy jestem na siebie zła.",
+    "Staram się pamiętać, że porażka nie przekreśla całego wysiłku.",
+    "Co konkretnie poszło dziś nie tak?",
+    "Może warto porozmawiać o tym z kimś bliskim?",
+    "Myślę, że każdy ma prawo do błędów.",
+]
+
+
+class Participant:
+    """
+    Jeden symulowany uczestnik; `timings` to lista (krok, czas [s]), a `started`/`finished`
+    to czas zegarowy (time.time) początku i końca - porównywalny między procesami.
+    """
+
+    def __init__(self, number, chat_turns, skip_chat, seed=None):
+        self.number = number
+        self.chat_turns = chat_turns
+        self.skip_chat = skip_chat
+        self.random = random.Random(seed)
+        self.timings = []
+        self.user_id = None
+        self.completed = False
+        self.error = None
+        self.started = None
+        self.finished = None
+
+    def _step(self, name, at, action=None, page=None):
+        """Jeden przebieg skryptu; `page` - ekran, na którym uczestnik powinien po nim być."""
+        start = time.perf_counter()
+        if action is not None:
+            action()
+        at.run()
+        self.timings.append((name, time.perf_counter() - start))
+        if at.exception:
+            raise RuntimeError(f"{name}: {at.exception[0].value}")
+        if page is not None and at.session_state["page"] != page:
+            # Np. odrzucony formularz - bez tego dalsze kroki szłyby na skróty i zgubiłyby dane
+            raise RuntimeError(f"{name}: ekran {at.session_state['page']!r} zamiast {page!r}")
+
+    def _answer_radios(self, at):
+        for radio in at.radio:
+            radio.set_value(self.random.randint(1, 5))
+
+    def run(self):
+        from streamlit.testing.v1 import AppTest
+
+        at = AppTest.from_file(APP_PATH, default_timeout=180)
+        at.secrets["OPENROUTER_API_KEY"] = "loadtest"
+        self.started = time.time()
+        try:
+            self._step("consent_load", at)
+            self.user_id = at.session_state["user_id"]
+            at.checkbox[0].check()
+            self._step("consent_check", at)
+            self._step("consent_submit", at, at.button(key="go_to_pretest").click, page="pretest")
+
+            at.number_input(key="pre_demographics_age").set_value(self.random.randint(18, 65))
+            at.selectbox(key="pre_demographics_gender").set_value(self.random.choice(["Kobieta", "Mężczyzna"]))
+            at.selectbox(key="pre_demographics_education").set_value("Średnie")
+            self._answer_radios(at)
+            self._step("pretest_submit", at, at.button(key="start_chat_from_pretest").click, page="chat_instruction")
+
+            if self.skip_chat:
+                at.session_state["page"] = "posttest"
+                self._step("posttest_load", at, page="posttest")
+            else:
+                self._step("chat_load", at, at.button(key="start_chat_from_instruction").click, page="chat")
+                for _ in range(self.chat_turns):
+                    self._step("chat_turn", at, lambda: at.chat_input[0].set_value(self.random.choice(MESSAGES)))
+                # Bez czekania na minimalny czas rozmowy
+                at.session_state["start_time"] = time.time() - 11 * 60
+                self._step("chat_rerun", at)
+                end_button = next(button for button in at.button if button.label == "Zakończ rozmowę")
+                self._step("chat_end", at, end_button.click, page="posttest")
+
+            self._answer_radios(at)
+            at.text_area[0].input("Chodziło o rozmowę z chatbotem.")
+            self._step("posttest_submit", at, at.button(key="submit_posttest").click, page="thankyou")
+
+            at.text_area(key="feedback_positive_text").input(f"Uczestnik testowy {self.number}")
+            at.text_area(key="feedback_negative_text").input("-")
+            self._step("feedback_submit", at, at.button(key="submit_feedback_button").click)
+            self.completed = bool(at.session_state["feedback_submitted"])
+        except Exception as e:
+            self.error = f"{type(e).__name__}: {e}"
+            print(f"Uczestnik {self.number} przerwał badanie: {self.error}")
+        self.finished = time.time()
+        return self
+
+
+def wait_for_warmup(timeout=300.0):
+    """
+    Inicjalizacja procesu roboczego: uruchamia rozgrzewanie aplikacji (sonda ?health) i czeka,
+    aż się skończy. AppTest kompiluje app.py od nowa dla każdego uczestnika, a w Pythonie 3.11
+    kompilacja w trakcie importów w wątku rozgrzewania potrafi skończyć się SystemError
+    (AST constructor recursion depth mismatch). Serwer Streamlit kompiluje skrypt raz,
+    przed rozgrzewaniem, więc tam ten problem nie występuje.
+    """
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(APP_PATH, default_timeout=180)
+    at.secrets["OPENROUTER_API_KEY"] = "loadtest"
+    at.query_params["health"] = "1"
+    deadline = time.monotonic() + timeout
+    while True:
+        at.run()
+        state = at.title[0].value if at.title else "cold"
+        if state in ("warm", "failed") or time.monotonic() > deadline:
+            print(f"Proces {os.getpid()}: rozgrzewanie - {state}.")
+            return
+        time.sleep(0.5)
+
+
+def lost_fields(sheet, participants, skip_chat):
+    """{user_id: brakujące pola} dla uczestników, którzy ukończyli badanie."""
+    records = sheet.records()
+    expected = EXPECTED_FIELDS + (() if skip_chat else CHAT_FIELDS)
+    lost = {}
+    for participant in participants:
+        if not participant.completed:
+            continue
+        record = records.get(participant.user_id, {})
+        missing = [field for field in expected if not record.get(field)]
+        if record.get("status") != FINAL_STATUS:
+            missing.append("status")
+        if missing:
+            lost[participant.user_id] = missing
+    return lost
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--participants", type=int, default=20, help="Liczba symulowanych uczestników.")
+    parser.add_argument("--concurrency", type=int, default=5, help="Liczba uczestników jednocześnie (procesów roboczych).")
+    parser.add_argument("--chat-turns", type=int, default=3, help="Liczba wiadomości uczestnika w rozmowie.")
+    parser.add_argument("--skip-chat", action="store_true", help="Pomiń rozmowę (bez bazy wiedzy i modelu).")
+    parser.add_argument("--sheets-latency-ms", type=float, default=300.0, help="Opóźnienie wywołania API arkusza.")
+    parser.add_argument("--sheets-quota", type=int, default=60, help="Limit zapytań do arkusza na minutę (0 - bez limitu).")
+    parser.add_argument("--sheets-error-rate", type=float, default=0.0, help="Odsetek wywołań API arkusza kończących się błędem.")
+    parser.add_argument("--llm-ttft", type=float, default=0.5, help="Czas do pierwszego tokenu atrapy modelu [s].")
+    parser.add_argument("--drain-timeout", type=float, default=120.0, help="Jak długo czekać na zapis outboxa do arkusza [s].")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    # Osobny outbox, ślady, sesje i stan rozgrzewania - test nie może dotknąć danych badania
+    workdir = tempfile.mkdtemp(prefix="vincent-loadtest-")
+    llm_server = None if args.skip_chat else make_server(ttft_s=args.llm_ttft, token_delay_s=0.02, seed=args.seed)
+    os.environ.update({
+        "VINCENT_FAKE_SHEETS": "1",
+        "VINCENT_OUTBOX_PATH": os.path.join(workdir, "outbox.sqlite3"),
+        "VINCENT_TRACE_PATH": os.path.join(workdir, "traces.jsonl"),
+        "VINCENT_WARMUP_STATUS": os.path.join(workdir, "warmup_status.json"),
+        "VINCENT_SESSION_STORE": "sqlite:///" + os.path.join(workdir, "sessions.sqlite3"),
+    })
+    if llm_server is not None:
+        os.environ["VINCENT_OPENAI_BASE_URL"] = llm_server.base_url
+    sheet = reset_fake_sheet(latency_s=args.sheets_latency_ms / 1000, quota_per_minute=args.sheets_quota,
+                             error_rate=args.sheets_error_rate, seed=args.seed)
+    os.environ.update(serve_fake_sheet(sheet))
+    print(f"Katalog roboczy testu: {workdir}")
+
+    seeds = random.Random(args.seed)
+    participants = [Participant(i + 1, args.chat_turns, args.skip_chat, seeds.random()) for i in range(args.participants)]
+    start = time.perf_counter()
+    # "spawn" - proces główny ma już wątki (atrapa modelu, serwer atrapy arkusza)
+    executor = ProcessPoolExecutor(max_workers=args.concurrency, mp_context=multiprocessing.get_context("spawn"),
+                                   initializer=wait_for_warmup)
+    try:
+        participants = list(executor.map(Participant.run, participants))
+        # Bez uruchamiania procesów roboczych i ich rozgrzewania
+        elapsed = max(p.finished for p in participants) - min(p.started for p in participants)
+
+        # SheetsWriter procesów roboczych zapisuje w tle - czekamy, aż arkusz dogoni outbox
+        drain_start = time.perf_counter()
+        lost = lost_fields(sheet, participants, args.skip_chat)
+        while lost and time.perf_counter() - drain_start < args.drain_timeout:
+            time.sleep(1.0)
+            lost = lost_fields(sheet, participants, args.skip_chat)
+        drain_s = time.perf_counter() - drain_start
+    finally:
+        executor.shutdown(cancel_futures=True)
+    if llm_server is not None:
+        llm_server.shutdown()
+
+    # Dopiero tutaj - tracing czyta VINCENT_TRACE_PATH przy imporcie
+    import tracing
+
+    flushes = [span for span in tracing.load_spans(time.perf_counter() - start + 60) if span["span"] == "sheets_flush"]
+    completed = sum(participant.completed for participant in participants)
+    steps = {}
+    for participant in participants:
+        for name, seconds in participant.timings:
+            steps.setdefault(name, []).append(seconds)
+
+    print(f"\nUczestnicy: {completed}/{len(participants)} ukończyło badanie w {elapsed:.1f} s "
+          f"({completed / elapsed * 60:.1f} uczestników/min, {args.concurrency} naraz).")
+    print(f"{'krok':<18}{'n':>6}{'p50 [s]':>10}{'p95 [s]':>10}{'max [s]':>10}")
+    for name, values in steps.items():
+        print(f"{name:<18}{len(values):>6}{tracing.percentile(values, 0.5):>10.2f}{tracing.percentile(values, 0.95):>10.2f}{max(values):>10.2f}")
+    print(f"\nArkusz: wywołania {sheet.stats['calls']}, błędy limitu (429): {sheet.stats['quota_errors']}, "
+          f"wstrzyknięte błędy: {sheet.stats['injected_errors']}")
+    print(f"Zapisy outboxa: {len(flushes)}, nieudane: {sum(1 for span in flushes if span.get('error'))}, "
+          f"opróżnienie po teście: {drain_s:.1f} s")
+    print(f"Utracone zapisy: {sum(len(fields) for fields in lost.values())} pól u {len(lost)} uczestników")
+    for user_id, fields in list(lost.items())[:10]:
+        print(f"  {user_id}: {', '.join(fields)}")
+    return 1 if lost or completed < len(participants) else 0
+
+
+if __name__ == "__main__":
+    # Uczestnicy trafiają do procesów roboczych przez pickle, a AppTest podmienia tam __main__
+    # na app.py - klasy muszą pochodzić z modułu devtools.loadtest, a nie z __main__
+    from devtools import loadtest
+
+    sys.exit(loadtest.main())
@@ -0,0 +1,414 @@
+"""
+Wspólny dla całego procesu ogranicznik wywołań modelu czatu (OpenRouter).
+
+Każde wywołanie GovernedChatOpenAI (przepisanie zapytania i odpowiedź Vincenta)
+przechodzi przez LLMGovernor:
+- kolejka FIFO - wywołania są wpuszczane w kolejności przyjścia, niezależnie od sesji,
+- limit jednoczesnych wywołań (max_in_flight),
+- token bucket - najwyżej `rate_per_s` nowych wywołań na sekundę, z zapasem `burst`,
+- ponawianie po 429 i błędach 5xx/połączenia z wykładniczym, losowanym opóźnieniem
+  (z uwzględnieniem nagłówka Retry-After); 429 opróżnia token bucket, więc pozostałe
+  wywołania też na chwilę zwalniają.
+
+Czas oczekiwania w kolejce trafia do śladów (tracing.py, span "llm_queue_wait")
+i do `stats()`. Sesja może śledzić swoje wywołania przez `track()`, np. żeby pokazać
+uczestnikowi, że jego wiadomość czeka w kolejce.
+
+Wywołania asynchroniczne (`_agenerate`/`_astream`, pętla z async_runtime.py) podlegają tym
+samym limitom i stoją w tej samej kolejce FIFO. Czekają na future pętli zdarzeń, który
+budzi release() (przez call_soon_threadsafe) - nie zajmują wątku domyślnej puli pętli,
+z której LangChain wywołuje synchroniczne callbacki i retrievery wywołań już wpuszczonych.
+
+Limity dotyczą jednego procesu - przy kilku procesach Streamlit limit dostawcy
+należy podzielić między nie (LLM_RATE_PER_S w rag_config.py).
+"""
+import asyncio
+import contextvars
+import random
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+
+import openai
+from langchain_openai import ChatOpenAI
+
+import tracing
+from rag_config import LLM_BURST, LLM_MAX_IN_FLIGHT, LLM_MAX_RETRIES, LLM_QUEUE_TIMEOUT, LLM_RATE_PER_S
+
+
+class GovernorTimeout(Exception):
+    """Wywołanie czekało w kolejce dłużej niż queue_timeout."""
+
+
+class RequestTracker:
+    """Stan wywołań jednej tury rozmowy: łączny czas w kolejce, ponowienia i opcjonalny callback stanu."""
+
+    def __init__(self, on_state=None):
+        self.on_state = on_state
+        self.queue_wait_s = 0.0
+        self.retries = 0
+
+    def notify(self, state, **info):
+        if self.on_state is None:
+            return
+        try:
+            self.on_state(state, **info)
+        except Exception as e:
+            print(f"Błąd callbacku stanu kolejki LLM: {e}")
+
+
+_tracker = contextvars.ContextVar("llm_request_tracker", default=None)
+_admission_listener = contextvars.ContextVar("llm_admission_listener", default=None)
+
+
+@contextmanager
+def track(on_state=None):
+    """
+    Śledzi wywołania modelu w tym bloku (również w wątkach LangChain, które kopiują kontekst).
+    `on_state(state, **info)` dostaje "queued" (position=...), "admitted" (waited_s=...)
+    i "retry" (attempt=..., delay_s=...) - tylko do wyjścia z bloku: wywołania, które trwają
+    dłużej (np. przegrane zapytanie zabezpieczające), już go nie wywołują.
+    """
+    tracker = RequestTracker(on_state)
+    token = _tracker.set(tracker)
+    try:
+        yield tracker
+    finally:
+        tracker.on_state = None
+        _tracker.reset(token)
+
+
+@contextmanager
+def on_admission(listener):
+    """
+    `listener(True)` po wpuszczeniu wywołania z tego bloku przez governor (również przy
+    ponowieniu), `listener(False)` po zwolnieniu jego miejsca. Wywoływany z wątku,
+    który czekał w kolejce - musi być bezpieczny wątkowo. Używa go llm_hedging, żeby liczyć
+    czas do zapytania zabezpieczającego od wpuszczenia, a nie od wejścia do kolejki.
+    """
+    token = _admission_listener.set(listener)
+    try:
+        yield
+    finally:
+        _admission_listener.reset(token)
+
+
+def _notify_admission(admitted):
+    listener = _admission_listener.get()
+    if listener is not None:
+        try:
+            listener(admitted)
+        except Exception as e:
+            print(f"Błąd callbacku wpuszczenia wywołania LLM: {e}")
+
+
+class _Ticket:
+    """Miejsce w kolejce jednego wywołania. Wywołanie asynchroniczne czeka na `wakeup` (future pętli `loop`)."""
+
+    def __init__(self, tracker, timeout, loop=None):
+        self.tracker = tracker
+        self.start = time.monotonic()
+        self.deadline = self.start + timeout
+        self.queued = False
+        self.waited = None
+        self.loop = loop
+        self.wakeup = None
+
+
+def _wake(future):
+    if not future.done():
+        future.set_result(None)
+
+
+def is_retryable(error):
+    status = getattr(error, "status_code", None)
+    if status is not None:
+        return status == 429 or status >= 500
+    return isinstance(error, (openai.APIConnectionError, openai.APITimeoutError))
+
+
+def _retry_after(error):
+    response = getattr(error, "response", None)
+    value = response.headers.get("retry-after") if response is not None else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+class LLMGovernor:
+    def __init__(self, rate_per_s=LLM_RATE_PER_S, burst=LLM_BURST, max_in_flight=LLM_MAX_IN_FLIGHT,
+                 max_retries=LLM_MAX_RETRIES, queue_timeout=LLM_QUEUE_TIMEOUT, max_backoff=20.0):
+        self.rate_per_s = rate_per_s
+        self.burst = burst
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self.queue_timeout = queue_timeout
+        self.max_backoff = max_backoff
+        self._cond = threading.Condition()
+        self._queue = deque()
+        self._in_flight = 0
+        self._tokens = float(burst)
+        self._refilled_at = time.monotonic()
+        self._waits = deque(maxlen=1000)
+        self._metrics = {"calls": 0, "queued": 0, "retries": 0, "rate_limited": 0, "failed": 0, "queue_timeouts": 0,
+                         "total_queue_wait_s": 0.0, "max_queue_wait_s": 0.0}
+
+    def _refill(self, now):
+        self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.rate_per_s)
+        self._refilled_at = now
+
+    def _notify_waiters(self):
+        """Pod blokadą: budzi czekające wątki i wywołania asynchroniczne."""
+        self._cond.notify_all()
+        for ticket in self._queue:
+            if ticket.wakeup is not None:
+                try:
+                    ticket.loop.call_soon_threadsafe(_wake, ticket.wakeup)
+                except RuntimeError:
+                    # Pętla już zamknięta - jej wywołanie nie doczeka się wpuszczenia
+                    pass
+                ticket.wakeup = None
+
+    def _try_admit(self, ticket):
+        """
+        Pod blokadą: wpuszcza `ticket`, jeśli jest pierwszy w kolejce, jest wolne miejsce
+        i token - wtedy zwraca None. W przeciwnym razie zwraca, ile najdłużej czekać
+        przed ponownym sprawdzeniem. Po przekroczeniu queue_timeout rzuca GovernorTimeout.
+        """
+        now = time.monotonic()
+        self._refill(now)
+        is_head = self._queue[0] is ticket
+        has_slot = self._in_flight < self.max_in_flight
+        if is_head and has_slot and self._tokens >= 1:
+            self._queue.popleft()
+            self._tokens -= 1
+            self._in_flight += 1
+            waited = ticket.waited = now - ticket.start
+            self._metrics["calls"] += 1
+            self._metrics["total_queue_wait_s"] += waited
+            self._metrics["max_queue_wait_s"] = max(self._metrics["max_queue_wait_s"], waited)
+            self._waits.append(waited)
+            # Następny w kolejce może już mieć wolne miejsce i token
+            self._notify_waiters()
+            return None
+        if not ticket.queued:
+            ticket.queued = True
+            self._metrics["queued"] += 1
+            if ticket.tracker is not None:
+                ticket.tracker.notify("queued", position=self._queue.index(ticket) + 1)
+        if now >= ticket.deadline:
+            self._metrics["queue_timeouts"] += 1
+            raise GovernorTimeout(f"Wywołanie modelu czekało w kolejce dłużej niż {self.queue_timeout:g} s.")
+        timeout = ticket.deadline - now
+        if is_head and has_slot:
+            # Czekamy tylko na token - wiadomo dokładnie, kiedy się pojawi
+            timeout = min(timeout, (1 - self._tokens) / self.rate_per_s)
+        return timeout
+
+    def _abandon(self, ticket):
+        with self._cond:
+            self._queue.remove(ticket)
+            ticket.wakeup = None
+            self._notify_waiters()
+
+    def _admitted(self, ticket):
+        waited = ticket.waited
+        tracing.record_span("llm_queue_wait", waited, in_flight=self._in_flight)
+        _notify_admission(True)
+        if ticket.tracker is not None:
+            ticket.tracker.queue_wait_s += waited
+            if ticket.queued:
+                ticket.tracker.notify("admitted", waited_s=waited)
+        return waited
+
+    def acquire(self):
+        """Czeka na swoją kolej (FIFO), wolne miejsce i token. Zwraca czas oczekiwania w sekundach."""
+        ticket = _Ticket(_tracker.get(), self.queue_timeout)
+        with self._cond:
+            self._queue.append(ticket)
+            try:
+                while True:
+                    timeout = self._try_admit(ticket)
+                    if timeout is None:
+                        break
+                    self._cond.wait(timeout)
+            except BaseException:
+                self._queue.remove(ticket)
+                self._notify_waiters()
+                raise
+        return self._admitted(ticket)
+
+    def release(self):
+        with self._cond:
+            self._in_flight -= 1
+            self._notify_waiters()
+        _notify_admission(False)
+
+    @contextmanager
+    def slot(self):
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    async def aacquire(self):
+        """Jak acquire(), ale czeka w pętli zdarzeń (na future budzony przez release()), bez wątku puli."""
+        loop = asyncio.get_running_loop()
+        ticket = _Ticket(_tracker.get(), self.queue_timeout, loop)
+        with self._cond:
+            self._queue.append(ticket)
+        try:
+            while True:
+                with self._cond:
+                    timeout = self._try_admit(ticket)
+                    if timeout is None:
+                        break
+                    wakeup = ticket.wakeup = loop.create_future()
+                try:
+                    await asyncio.wait_for(wakeup, timeout)
+                except asyncio.TimeoutError:
+                    pass
+        except BaseException:
+            # Przekroczony queue_timeout albo anulowanie - wywołanie nie zostało wpuszczone
+            self._abandon(ticket)
+            raise
+        return self._admitted(ticket)
+
+    @asynccontextmanager
+    async def aslot(self):
+        await self.aacquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def backoff(self, error, attempt):
+        """
+        Decyduje, czy ponowić wywołanie po błędzie. Zwraca opóźnienie w sekundach
+        albo None, jeśli błąd trzeba przekazać dalej.
+        """
+        if attempt >= self.max_retries or not is_retryable(error):
+            with self._cond:
+                self._metrics["failed"] += 1
+            return None
+        delay = _retry_after(error)
+        if delay is None:
+            delay = min(self.max_backoff, 2 ** attempt) * random.uniform(0.5, 1.0)
+        with self._cond:
+            self._metrics["retries"] += 1
+            if getattr(error, "status_code", None) == 429:
+                # Dostawca ogranicza - wstrzymujemy też pozostałe wywołania
+                self._metrics["rate_limited"] += 1
+                self._tokens = min(self._tokens, 0.0)
+        tracker = _tracker.get()
+        if tracker is not None:
+            tracker.retries += 1
+            tracker.notify("retry", attempt=attempt + 1, delay_s=delay)
+        print(f"Wywołanie modelu nie powiodło się ({type(error).__name__}), ponowienie {attempt + 1}/{self.max_retries} za {delay:.1f} s.")
+        return delay
+
+    def call(self, fn):
+        """Wywołuje `fn()` w ramach limitów, ponawiając po błędach przejściowych."""
+        attempt = 0
+        while True:
+            with self.slot():
+                try:
+                    return fn()
+                except Exception as e:
+                    delay = self.backoff(e, attempt)
+                    if delay is None:
+                        raise
+            time.sleep(delay)
+            attempt += 1
+
+    async def acall(self, fn):
+        """Asynchroniczna wersja call(): `fn()` zwraca korutynę."""
+        attempt = 0
+        while True:
+            async with self.aslot():
+                try:
+                    return await fn()
+                except Exception as e:
+                    delay = self.backoff(e, attempt)
+                    if delay is None:
+                        raise
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._metrics)
+            waits = list(self._waits)
+            stats["queue_depth"] = len(self._queue)
+            stats["in_flight"] = self._in_flight
+        # Ten sam kwantyl co w raportach śladów i benchmarkach
+        stats["queue_wait_p50_s"] = tracing.percentile(waits, 0.50) or 0.0
+        stats["queue_wait_p95_s"] = tracing.percentile(waits, 0.95) or 0.0
+        return stats
+
+
+_governor = None
+_governor_lock = threading.Lock()
+
+
+def get_governor():
+    """Jeden ogranicznik na proces, współdzielony przez wszystkie sesje."""
+    global _governor
+    with _governor_lock:
+        if _governor is None:
+            _governor = LLMGovernor()
+        return _governor
+
+
+class GovernedChatOpenAI(ChatOpenAI):
+    """ChatOpenAI, którego wywołania przechodzą przez get_governor(). Ponawia governor, nie klient openai."""
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        generate = super()._generate
+        return get_governor().call(lambda: generate(messages, stop=stop, run_manager=run_manager, **kwargs))
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        stream = super()._stream
+        governor = get_governor()
+        attempt = 0
+        while True:
+            with governor.slot():
+                started = False
+                try:
+                    for chunk in stream(messages, stop=stop, run_manager=run_manager, **kwargs):
+                        started = True
+                        yield chunk
+                    return
+                except Exception as e:
+                    # Po pierwszym tokenie nie da się ponowić bez powtórzenia tekstu u uczestnika
+                    delay = None if started else governor.backoff(e, attempt)
+                    if delay is None:
+                        raise
+            time.sleep(delay)
+            attempt += 1
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        agenerate = super()._agenerate
+        return await get_governor().acall(lambda: agenerate(messages, stop=stop, run_manager=run_manager, **kwargs))
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        astream = super()._astream
+        governor = get_governor()
+        attempt = 0
+        while True:
+            async with governor.aslot():
+                started = False
+                try:
+                    async for chunk in astream(messages, stop=stop, run_manager=run_manager, **kwargs):
+                        started = True
+                        yield chunk
+                    return
+                except Exception as e:
+                    delay = None if started else governor.backoff(e, attempt)
+                    if delay is None:
+                        raise
+            await asyncio.sleep(delay)
+            attempt += 1
@@ -0,0 +1,236 @@
+"""
+Zapytania zabezpieczające (hedged requests) dla wywołań modelu czatu.
+
+Jeśli wywołanie HedgedChatOpenAI nie da pierwszego tokenu (albo, bez strumieniowania,
+nie skończy się) w ciągu `hedge_after_s` sekund od wpuszczenia przez llm_governor,
+startuje drugie, identyczne wywołanie - opcjonalnie do modelu zapasowego
+(`fallback_model_name`). Czas w kolejce governora (także oczekiwanie na ponowienie)
+się nie liczy: przy przeciążeniu albo błędach 429 zapytanie zabezpieczające tylko
+zwiększałoby ruch. Wygrywa to wywołanie, które pierwsze odpowie: przy strumieniowaniu
+to, które pierwsze przyśle token (od tej chwili uczestnik widzi jego tekst), bez
+strumieniowania - to, które pierwsze się skończy. Przegrane wywołanie jest od razu
+anulowane (zamknięcie połączenia, zwolnienie miejsca w governorze). Błąd głównego
+wywołania przed pierwszym tokenem też uruchamia wywołanie zapasowe.
+
+Wyścig odbywa się zawsze w pętli async_runtime (`_agenerate`/`_astream`); wersje
+synchroniczne przekazują do niej wywołanie i tylko odbierają wynik.
+
+Oba wywołania przechodzą przez llm_governor (kolejka, limity, ponawianie).
+Odsetek wywołań zabezpieczonych i wygranych przez zapasowe: `hedge_stats()`.
+"""
+import asyncio
+import threading
+import time
+from typing import Optional
+
+import async_runtime
+import llm_governor
+import tracing
+from llm_governor import GovernedChatOpenAI
+
+_lock = threading.Lock()
+_metrics = {"calls": 0, "hedged": 0, "hedge_wins": 0, "primary_errors": 0, "both_failed": 0}
+
+
+def _count(**increments):
+    with _lock:
+        for key, value in increments.items():
+            _metrics[key] += value
+
+
+def hedge_stats():
+    with _lock:
+        stats = dict(_metrics)
+    stats["hedge_rate"] = stats["hedged"] / stats["calls"] if stats["calls"] else 0.0
+    stats["hedge_win_rate"] = stats["hedge_wins"] / stats["hedged"] if stats["hedged"] else 0.0
+    return stats
+
+
+async def _primary(events, call):
+    """Wywołanie główne; wpuszczenie i zwolnienie przez governor trafiają do `events` jako zdarzenia."""
+    loop = asyncio.get_running_loop()
+
+    def on_admission(admitted):
+        loop.call_soon_threadsafe(events.put_nowait, ("primary", "admitted" if admitted else "released", None))
+
+    with llm_governor.on_admission(on_admission):
+        await call()
+
+
+class _Race:
+    """Stan wyścigu wywołania głównego i zapasowego."""
+
+    def __init__(self, hedge_after_s, streamed):
+        _count(calls=1)
+        self.hedge_after_s = hedge_after_s
+        self.streamed = streamed
+        self.start = time.perf_counter()
+        self.admitted_at = None
+        self.hedged = False
+        self.winner = None
+        self.errors = []
+
+    def admission(self, admitted):
+        """Wywołanie główne zostało wpuszczone przez governor (True) albo zwolniło miejsce (False)."""
+        self.admitted_at = time.perf_counter() if admitted else None
+
+    def timeout(self):
+        """
+        Ile jeszcze czekać na wynik przed startem wywołania zapasowego. None - bez limitu:
+        zapasowe już ruszyło albo wywołanie główne czeka w kolejce governora.
+        """
+        if self.hedged or self.winner is not None or self.admitted_at is None:
+            return None
+        return max(0.0, self.hedge_after_s - (time.perf_counter() - self.admitted_at))
+
+    def hedge(self):
+        self.hedged = True
+        _count(hedged=1)
+
+    def failed(self, name, error):
+        """Zwraca True, jeśli trzeba uruchomić wywołanie zapasowe. Gdy zawiodły oba, rzuca pierwszy błąd."""
+        self.errors.append(error)
+        if name == "primary":
+            _count(primary_errors=1)
+        if not self.hedged:
+            self.hedge()
+            return True
+        if len(self.errors) == 2:
+            _count(both_failed=1)
+            raise self.errors[0]
+        return False
+
+    def won(self, name):
+        self.winner = name
+        if name == "hedge":
+            _count(hedge_wins=1)
+        tracing.record_span("llm_hedge", time.perf_counter() - self.start,
+                            hedged=self.hedged, winner=name, streamed=self.streamed)
+
+
+class HedgedChatOpenAI(GovernedChatOpenAI):
+    """GovernedChatOpenAI z zapytaniem zabezpieczającym po `hedge_after_s` sekundach (None albo 0 - wyłączone)."""
+
+    hedge_after_s: Optional[float] = None
+    fallback_model_name: Optional[str] = None
+
+    @property
+    def hedging(self):
+        return self.hedge_after_s is not None and self.hedge_after_s > 0
+
+    def _primary_model(self):
+        return self.model_copy(update={"hedge_after_s": None})
+
+    def _hedge_model(self):
+        return self.model_copy(update={
+            "model_name": self.fallback_model_name or self.model_name,
+            "hedge_after_s": None,
+        })
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        if not self.hedging:
+            return super()._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+        # Wyścig w pętli async_runtime - przegrane wywołanie jest tam anulowane
+        return async_runtime.get_runtime().run(self._agenerate(messages, stop=stop, **kwargs))
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        if not self.hedging:
+            yield from super()._stream(messages, stop=stop, run_manager=run_manager, **kwargs)
+            return
+        # Zamknięcie tego generatora anuluje wyścig w pętli (razem z oboma wywołaniami)
+        for chunk in async_runtime.get_runtime().stream(self._astream(messages, stop=stop, **kwargs)):
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        if not self.hedging:
+            return await super()._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs)
+
+        events = asyncio.Queue()
+
+        def start(name, model):
+            async def call():
+                try:
+                    events.put_nowait((name, "result", await model._agenerate(messages, stop=stop, **kwargs)))
+                except Exception as e:
+                    events.put_nowait((name, "error", e))
+            return asyncio.ensure_future(_primary(events, call) if name == "primary" else call())
+
+        race = _Race(self.hedge_after_s, streamed=False)
+        tasks = {"primary": start("primary", self._primary_model())}
+        try:
+            while True:
+                try:
+                    name, kind, payload = await asyncio.wait_for(events.get(), race.timeout())
+                except asyncio.TimeoutError:
+                    race.hedge()
+                    tasks["hedge"] = start("hedge", self._hedge_model())
+                    continue
+                if kind in ("admitted", "released"):
+                    race.admission(kind == "admitted")
+                elif kind == "result":
+                    race.won(name)
+                    return payload
+                elif race.failed(name, payload):
+                    tasks["hedge"] = start("hedge", self._hedge_model())
+        finally:
+            for task in tasks.values():
+                task.cancel()
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        if not self.hedging:
+            async for chunk in super()._astream(messages, stop=stop, run_manager=run_manager, **kwargs):
+                yield chunk
+            return
+
+        events = asyncio.Queue()
+
+        def start(name, model):
+            async def pump():
+                try:
+                    async for chunk in model._astream(messages, stop=stop, run_manager=None, **kwargs):
+                        events.put_nowait((name, "chunk", chunk))
+                    events.put_nowait((name, "done", None))
+                except Exception as e:
+                    events.put_nowait((name, "error", e))
+            return asyncio.ensure_future(_primary(events, pump) if name == "primary" else pump())
+
+        race = _Race(self.hedge_after_s, streamed=True)
+        tasks = {"primary": start("primary", self._primary_model())}
+        try:
+            while True:
+                try:
+                    name, kind, payload = await asyncio.wait_for(events.get(), race.timeout())
+                except asyncio.TimeoutError:
+                    race.hedge()
+                    tasks["hedge"] = start("hedge", self._hedge_model())
+                    continue
+
+                if kind in ("admitted", "released"):
+                    race.admission(kind == "admitted")
+                    continue
+                if race.winner is None:
+                    if kind == "error":
+                        if race.failed(name, payload):
+                            tasks["hedge"] = start("hedge", self._hedge_model())
+                        continue
+                    race.won(name)
+                    # Przegrany strumień jest anulowany od razu (zamyka połączenie)
+                    loser = tasks.pop("hedge" if name == "primary" else "primary", None)
+                    if loser is not None:
+                        loser.cancel()
+
+                if name != race.winner:
+                    continue
+                if kind == "chunk":
+                    if run_manager:
+                        await run_manager.on_llm_new_token(payload.text, chunk=payload)
+                    yield payload
+                elif kind == "done":
+                    return
+                else:
+                    raise payload
+        finally:
+            for task in tasks.values():
+                task.cancel()
@@ -0,0 +1,197 @@
+"""
+Embeddingi all-MiniLM-L6-v2 liczone przez ONNX Runtime (int8) zamiast PyTorch.
+
+Model jest jednorazowo eksportowany do ONNX i kwantyzowany dynamicznie do int8,
+a tekst tokenizowany biblioteką `tokenizers` (wyniki jako tablice numpy). Pooling
+(średnia po tokenach z maską uwagi) i normalizacja L2 są takie same jak w
+sentence-transformers, więc wektory są zgodne z istniejącym indeksem - zgodność
+sprawdza `python onnx_embeddings.py check` (podobieństwo cosinusowe z modelem PyTorch),
+a automatycznie - tests/test_onnx_embeddings.py (próg MIN_COSINE).
+
+Aplikacja nie importuje PyTorch, jeśli EMBEDDING_BACKEND = "onnx" (rag_config.py).
+
+Użycie:
+    python onnx_embeddings.py export [--out ./onnx_model] [--no-quantize]   - wymaga torch i transformers
+    python onnx_embeddings.py check [--min-cosine 0.99]                     - wymaga torch i transformers
+"""
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+import onnxruntime
+from langchain_core.embeddings import Embeddings
+from tokenizers import Tokenizer
+
+from rag_config import EMBEDDING_MODEL_NAME, ONNX_MODEL_PATH
+
+CONFIG_NAME = "embedding_config.json"
+FP32_MODEL_NAME = "model.onnx"
+INT8_MODEL_NAME = "model_int8.onnx"
+# Jak max_seq_length w sentence-transformers dla all-MiniLM-L6-v2
+MAX_LENGTH = 256
+# Najmniejsza akceptowalna zgodność cosinusowa z modelem PyTorch (check, tests/test_onnx_embeddings.py)
+MIN_COSINE = 0.99
+
+
+def onnx_model_exists(path=ONNX_MODEL_PATH):
+    return all(os.path.exists(os.path.join(path, name)) for name in (CONFIG_NAME, "tokenizer.json"))
+
+
+class OnnxMiniLMEmbeddings(Embeddings):
+    """Model embeddingów z katalogu utworzonego przez `export()`, zgodny z interfejsem LangChain."""
+
+    def __init__(self, path=ONNX_MODEL_PATH, batch_size=32, threads=None):
+        with open(os.path.join(path, CONFIG_NAME), encoding="utf-8") as f:
+            self.config = json.load(f)
+        self.batch_size = batch_size
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(path, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=self.config["max_length"])
+        self.tokenizer.enable_padding(pad_id=self.config["pad_id"], pad_token=self.config["pad_token"])
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(
+            os.path.join(path, self.config["model_file"]), options, providers=["CPUExecutionProvider"]
+        )
+        self._input_names = {model_input.name for model_input in self.session.get_inputs()}
+
+    def _embed_batch(self, texts):
+        encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.array([encoding.ids for encoding in encodings], dtype=np.int64)
+        attention_mask = np.array([encoding.attention_mask for encoding in encodings], dtype=np.int64)
+        inputs = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self._input_names:
+            inputs["token_type_ids"] = np.array([encoding.type_ids for encoding in encodings], dtype=np.int64)
+
+        hidden = self.session.run(None, inputs)[0]
+        # Średnia po tokenach (bez paddingu), potem normalizacja L2 - jak Pooling + Normalize w sentence-transformers
+        mask = attention_mask[:, :, None].astype(np.float32)
+        pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+        return pooled / np.clip(norms, 1e-12, None)
+
+    def embed_array(self, texts):
+        """Embeddingi jako macierz float32 (n x d)."""
+        texts = list(texts)
+        result = np.zeros((len(texts), self.config["dimension"]), dtype=np.float32)
+        # Teksty o podobnej długości w jednej paczce - mniej paddingu
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        for i in range(0, len(order), self.batch_size):
+            part = order[i:i + self.batch_size]
+            result[part] = self._embed_batch([texts[j] for j in part])
+        return result
+
+    def embed_documents(self, texts):
+        return self.embed_array(texts).tolist()
+
+    def embed_query(self, text):
+        return self.embed_array([text])[0].tolist()
+
+
+def _hub_name(model_name):
+    return model_name if "/" in model_name else f"sentence-transformers/{model_name}"
+
+
+def export(out_dir=ONNX_MODEL_PATH, model_name=EMBEDDING_MODEL_NAME, quantize=True):
+    """Eksportuje model do ONNX (opcjonalnie z kwantyzacją int8) razem z tokenizerem."""
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(_hub_name(model_name))
+    model = AutoModel.from_pretrained(_hub_name(model_name)).eval()
+    os.makedirs(out_dir, exist_ok=True)
+    tokenizer.save_pretrained(out_dir)
+
+    sample = tokenizer(["Przykładowe zdanie do eksportu modelu."], return_tensors="pt")
+    input_names = ["input_ids", "attention_mask", "token_type_ids"]
+    fp32_path = os.path.join(out_dir, FP32_MODEL_NAME)
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            tuple(sample[name] for name in input_names),
+            fp32_path,
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes={name: {0: "batch", 1: "sequence"} for name in input_names + ["last_hidden_state"]},
+            opset_version=14,
+        )
+
+    model_file = FP32_MODEL_NAME
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        quantize_dynamic(fp32_path, os.path.join(out_dir, INT8_MODEL_NAME), weight_type=QuantType.QInt8)
+        model_file = INT8_MODEL_NAME
+
+    config = {
+        "model_name": model_name,
+        "model_file": model_file,
+        "max_length": MAX_LENGTH,
+        "dimension": model.config.hidden_size,
+        "pad_id": tokenizer.pad_token_id,
+        "pad_token": tokenizer.pad_token,
+    }
+    with open(os.path.join(out_dir, CONFIG_NAME), "w", encoding="utf-8") as f:
+        json.dump(config, f, ensure_ascii=False, indent=2)
+    print(f"Zapisano model ONNX ({model_file}) w {out_dir}.")
+    return config
+
+
+def cosine_agreement(reference, candidate):
+    """Podobieństwo cosinusowe odpowiadających sobie wierszy dwóch macierzy embeddingów."""
+    reference = np.asarray(reference, dtype=np.float32)
+    candidate = np.asarray(candidate, dtype=np.float32)
+    dots = np.einsum("ij,ij->i", reference, candidate)
+    return dots / (np.linalg.norm(reference, axis=1) * np.linalg.norm(candidate, axis=1))
+
+
+def sample_texts(limit=200):
+    """Teksty do sprawdzania zgodności: fragmenty z bazy wiedzy i wiadomości z przykładowych rozmów."""
+    from benchmarks.transcripts import SAMPLE_CONVERSATIONS
+    from rag_config import VECTOR_STORE_PATH
+    from vector_store import MmapVectorStore, store_exists
+
+    texts = [msg["content"] for conversation in SAMPLE_CONVERSATIONS for msg in conversation]
+    if store_exists(VECTOR_STORE_PATH):
+        store = MmapVectorStore.load(VECTOR_STORE_PATH, None)
+        step = max(1, len(store) // limit)
+        texts += [store._document(i).page_content for i in range(0, len(store), step)][:limit]
+    return texts
+
+
+def check(path=ONNX_MODEL_PATH, min_cosine=MIN_COSINE):
+    """Porównuje embeddingi ONNX z modelem PyTorch. Zwraca True, jeśli najgorsza zgodność >= min_cosine."""
+    from langchain_huggingface import HuggingFaceEmbeddings
+
+    texts = sample_texts()
+    reference = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME, model_kwargs={'device': 'cpu'}).embed_documents(texts)
+    candidate = OnnxMiniLMEmbeddings(path).embed_array(texts)
+    cosines = cosine_agreement(reference, candidate)
+    print(f"Zgodność cosinusowa ({len(texts)} tekstów): min {cosines.min():.4f}, średnio {cosines.mean():.4f}.")
+    return bool(cosines.min() >= min_cosine)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Eksport i sprawdzanie modelu embeddingów ONNX.")
+    parser.add_argument("command", choices=["export", "check"])
+    parser.add_argument("--out", default=ONNX_MODEL_PATH, help="Katalog modelu ONNX.")
+    parser.add_argument("--no-quantize", action="store_true", help="Eksportuj bez kwantyzacji int8.")
+    parser.add_argument("--min-cosine", type=float, default=MIN_COSINE, help="Minimalna akceptowalna zgodność cosinusowa.")
+    args = parser.parse_args(argv)
+
+    if args.command == "export":
+        export(args.out, quantize=not args.no_quantize)
+        return 0
+    if not check(args.out, args.min_cosine):
+        print(f"Zgodność poniżej {args.min_cosine} - nie używaj tego modelu z istniejącym indeksem.")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
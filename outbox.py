@@ -0,0 +1,188 @@
+"""
+Lokalny, trwały bufor (outbox) danych uczestników w SQLite w trybie WAL.
+
+Każdy zapis z aplikacji trafia najpierw tutaj jako nowy wiersz (user_id, etap, dane),
+a SheetsWriter w tle przepisuje oczekujące rekordy do Google Sheets i oznacza je
+jako zsynchronizowane. Rekordy nigdy nie są usuwane, więc z outboxa można
+w każdej chwili odtworzyć zawartość arkusza.
+
+Użycie z wiersza poleceń:
+    python outbox.py stats               - liczba rekordów i uczestników
+    python outbox.py export dane.csv     - scalone dane wszystkich uczestników do CSV
+    python outbox.py resync              - oznacza wszystkie rekordy do ponownej synchronizacji
+"""
+import csv
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import namedtuple
+
+OUTBOX_PATH = os.environ.get("VINCENT_OUTBOX_PATH", "data/outbox.sqlite3")
+
+OutboxRecord = namedtuple("OutboxRecord", ["id", "user_id", "stage", "data"])
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    synced_at REAL
+);
+CREATE INDEX IF NOT EXISTS records_pending ON records (id) WHERE synced_at IS NULL;
+CREATE INDEX IF NOT EXISTS records_user ON records (user_id, id);
+CREATE TABLE IF NOT EXISTS sync_lease (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    owner TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+"""
+
+
+def merge_records(records):
+    """Scala rekordy w kolejności zapisu w słownik {user_id: dane} (nowsze wartości wygrywają)."""
+    merged = {}
+    for record in records:
+        merged.setdefault(record.user_id, {"user_id": record.user_id}).update(record.data)
+    return merged
+
+
+class Outbox:
+    """
+    Dziennik zapisów tylko do dopisywania. Każdy wątek korzysta z własnego
+    połączenia; tryb WAL pozwala czytać w trakcie zapisu, a synchronous=NORMAL
+    sprawia, że pojedynczy zapis trwa ułamek milisekundy i przetrwa awarię procesu.
+    """
+
+    def __init__(self, path=OUTBOX_PATH):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        self._connection().executescript(_SCHEMA)
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def put(self, user_id, stage, data):
+        """Dopisuje rekord etapu badania. Zwraca id rekordu."""
+        payload = json.dumps(data, ensure_ascii=False, default=str)
+        cursor = self._connection().execute(
+            "INSERT INTO records (user_id, stage, payload, created_at) VALUES (?, ?, ?, ?)",
+            (user_id, stage, payload, time.time()),
+        )
+        return cursor.lastrowid
+
+    def pending(self, limit=None):
+        """Rekordy czekające na synchronizację z arkuszem, w kolejności zapisu."""
+        query = "SELECT id, user_id, stage, payload FROM records WHERE synced_at IS NULL ORDER BY id"
+        params = ()
+        if limit is not None:
+            query += " LIMIT ?"
+            params = (limit,)
+        rows = self._connection().execute(query, params).fetchall()
+        return [OutboxRecord(id_, user_id, stage, json.loads(payload)) for id_, user_id, stage, payload in rows]
+
+    def all_records(self):
+        """Wszystkie rekordy (również zsynchronizowane), w kolejności zapisu."""
+        rows = self._connection().execute("SELECT id, user_id, stage, payload FROM records ORDER BY id").fetchall()
+        return [OutboxRecord(id_, user_id, stage, json.loads(payload)) for id_, user_id, stage, payload in rows]
+
+    def mark_synced(self, ids):
+        if not ids:
+            return
+        conn = self._connection()
+        now = time.time()
+        conn.execute("BEGIN")
+        conn.executemany("UPDATE records SET synced_at = ? WHERE id = ?", [(now, id_) for id_ in ids])
+        conn.execute("COMMIT")
+
+    def mark_all_pending(self):
+        """Oznacza wszystkie rekordy do ponownej synchronizacji (odbudowa arkusza)."""
+        return self._connection().execute("UPDATE records SET synced_at = NULL").rowcount
+
+    def pending_count(self):
+        return self._connection().execute("SELECT COUNT(*) FROM records WHERE synced_at IS NULL").fetchone()[0]
+
+    def stats(self):
+        conn = self._connection()
+        total, pending = conn.execute(
+            "SELECT COUNT(*), COUNT(*) - COUNT(synced_at) FROM records"
+        ).fetchone()
+        users = conn.execute("SELECT COUNT(DISTINCT user_id) FROM records").fetchone()[0]
+        pending_users = conn.execute(
+            "SELECT COUNT(DISTINCT user_id) FROM records WHERE synced_at IS NULL"
+        ).fetchone()[0]
+        return {"records": total, "pending_records": pending, "users": users, "pending_users": pending_users}
+
+    def acquire_sync_lease(self, owner, ttl):
+        """
+        Gdy kilka procesów współdzieli plik outboxa, synchronizuje tylko jeden z nich -
+        ten, który trzyma ważną dzierżawę. Zwraca True, jeśli `owner` ją ma.
+        """
+        conn = self._connection()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT owner, expires_at FROM sync_lease WHERE id = 1").fetchone()
+            if row is None or row[0] == owner or row[1] < now:
+                conn.execute(
+                    "INSERT OR REPLACE INTO sync_lease (id, owner, expires_at) VALUES (1, ?, ?)",
+                    (owner, now + ttl),
+                )
+                acquired = True
+            else:
+                acquired = False
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return acquired
+
+
+def export_csv(outbox, path):
+    """Zapisuje scalone dane wszystkich uczestników do pliku CSV (np. do importu w Google Sheets)."""
+    merged = merge_records(outbox.all_records())
+    headers = []
+    for record in merged.values():
+        for key in record:
+            if key not in headers:
+                headers.append(key)
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=headers)
+        writer.writeheader()
+        for record in merged.values():
+            writer.writerow(record)
+    return len(merged)
+
+
+def main(argv):
+    outbox = Outbox()
+    command = argv[1] if len(argv) > 1 else "stats"
+    if command == "stats":
+        print(json.dumps(outbox.stats(), indent=2))
+    elif command == "export" and len(argv) > 2:
+        count = export_csv(outbox, argv[2])
+        print(f"Zapisano dane {count} uczestników do {argv[2]}.")
+    elif command == "resync":
+        count = outbox.mark_all_pending()
+        print(f"Oznaczono {count} rekordów do ponownej synchronizacji. Aplikacja zapisze je przy najbliższym zapisie w tle.")
+    else:
+        print(__doc__)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
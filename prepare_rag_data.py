@@ -0,0 +1,311 @@
+"""
+Buduje indeks FAISS bazy wiedzy RAG z plików PDF (PDF_FILE_PATHS w rag_config.py).
+
+Przebieg:
+1. PDF-y, które zmieniły się od ostatniego budowania (skrót SHA-256 pliku),
+   są wczytywane równolegle w osobnych procesach (PyPDFLoader) i dzielone
+   na fragmenty (RecursiveCharacterTextSplitter). Fragmenty niezmienionych
+   plików są brane z cache.
+2. Embeddingi liczone są dużymi paczkami modelem EMBEDDING_MODEL_NAME tylko dla
+   fragmentów, których treści nie ma jeszcze w cache embeddingów na dysku.
+3. Indeks jest składany z wektorów z cache i zapisywany w formacie FAISS
+   razem z manifestem (skróty plików, fragmentów i parametry budowania),
+   a także w formacie mapowanym do pamięci (vector_store.py).
+
+Domyślnie wyniki trafiają do RAG_BUILD_PATH (rag_build/faiss_index i rag_build/vector_store),
+a nie do indeksu aplikacji: FAISS_INDEX_PATH w repozytorium zawiera przygotowane ręcznie
+streszczenia stron, których nie da się odtworzyć z PDF-ów. Żeby zastąpić bazę wiedzy aplikacji
+indeksem z PDF-ów, trzeba podać jej ścieżki jawnie. Skrypt nie nadpisuje indeksu, którego
+sam nie zbudował (brak manifestu), bez --force.
+
+Jeśli manifest zgadza się z plikami i parametrami, skrypt kończy się od razu.
+
+Użycie:
+    python prepare_rag_data.py [--workers N] [--batch-size 256] [--force]
+    python prepare_rag_data.py --index-path ./faiss_vector_store_rag --store-path ./vector_store --force
+"""
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from rag_config import (
+    CHUNK_OVERLAP,
+    CHUNK_SIZE,
+    EMBEDDING_MODEL_NAME,
+    FAISS_INDEX_PATH,
+    PDF_FILE_PATHS,
+    RAG_BUILD_PATH,
+    RAG_CACHE_PATH,
+    VECTOR_STORE_PATH,
+)
+from vector_store import store_exists, write_store
+
+MANIFEST_NAME = "manifest.json"
+BUILD_INDEX_PATH = os.path.join(RAG_BUILD_PATH, "faiss_index")
+BUILD_STORE_PATH = os.path.join(RAG_BUILD_PATH, "vector_store")
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def text_sha256(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def build_params():
+    """Parametry, których zmiana wymaga przebudowania indeksu."""
+    return {
+        "embedding_model": EMBEDDING_MODEL_NAME,
+        "chunk_size": CHUNK_SIZE,
+        "chunk_overlap": CHUNK_OVERLAP,
+    }
+
+
+def load_and_split(path):
+    """Wczytuje jeden PDF i dzieli go na fragmenty. Uruchamiane w osobnym procesie."""
+    from langchain_community.document_loaders import PyPDFLoader
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    pages = PyPDFLoader(path).load()
+    splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    chunks = splitter.split_documents(pages)
+    return [{"text": chunk.page_content, "metadata": chunk.metadata} for chunk in chunks]
+
+
+class EmbeddingCache:
+    """Cache embeddingów na dysku (SQLite), kluczowany skrótem treści fragmentu i nazwą modelu."""
+
+    def __init__(self, path, model_name):
+        self.model_name = model_name
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " model TEXT NOT NULL, text_hash TEXT NOT NULL, vector BLOB NOT NULL,"
+            " PRIMARY KEY (model, text_hash))"
+        )
+
+    def get_many(self, hashes):
+        found = {}
+        hashes = list(hashes)
+        for i in range(0, len(hashes), 500):
+            part = hashes[i:i + 500]
+            placeholders = ",".join("?" * len(part))
+            rows = self.conn.execute(
+                f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                [self.model_name, *part],
+            )
+            for text_hash, blob in rows:
+                found[text_hash] = np.frombuffer(blob, dtype=np.float32)
+        return found
+
+    def put_many(self, items):
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, vector) VALUES (?, ?, ?)",
+                [(self.model_name, text_hash, np.asarray(vector, dtype=np.float32).tobytes()) for text_hash, vector in items],
+            )
+
+
+def load_manifest(index_path):
+    path = os.path.join(index_path, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def index_files_exist(index_path):
+    return all(os.path.exists(os.path.join(index_path, name)) for name in ("index.faiss", "index.pkl"))
+
+
+def check_overwrite(index_path, store_path):
+    """
+    Rzuca FileExistsError, jeśli w ścieżkach wyników jest indeks niezbudowany tym skryptem
+    (bez manifestu), np. dołączony do repozytorium index.pkl albo baza przekonwertowana z niego.
+    """
+    for path, exists in ((index_path, os.path.exists(os.path.join(index_path, "index.pkl"))),
+                         (store_path, store_exists(store_path))):
+        if exists and load_manifest(path) is None:
+            raise FileExistsError(
+                f"{path} zawiera indeks, który nie został zbudowany przez prepare_rag_data.py. "
+                "Podaj inny katalog albo użyj --force, żeby go nadpisać."
+            )
+
+
+def load_chunks(pdf_paths, file_hashes, cache_dir, workers):
+    """Zwraca {ścieżka: fragmenty}; zmienione PDF-y są parsowane równolegle, reszta pochodzi z cache."""
+    chunks_dir = os.path.join(cache_dir, "chunks")
+    os.makedirs(chunks_dir, exist_ok=True)
+    params_key = f"{CHUNK_SIZE}_{CHUNK_OVERLAP}"
+
+    chunks_by_path = {}
+    to_parse = []
+    for path in pdf_paths:
+        cache_file = os.path.join(chunks_dir, f"{file_hashes[path]}_{params_key}.json")
+        if os.path.exists(cache_file):
+            with open(cache_file, encoding="utf-8") as f:
+                chunks_by_path[path] = json.load(f)
+        else:
+            to_parse.append((path, cache_file))
+
+    if to_parse:
+        print(f"Wczytywanie {len(to_parse)} PDF-ów w {min(workers, len(to_parse))} procesach...")
+        with ProcessPoolExecutor(max_workers=min(workers, len(to_parse))) as executor:
+            results = executor.map(load_and_split, [path for path, _ in to_parse])
+            for (path, cache_file), chunks in zip(to_parse, results):
+                chunks_by_path[path] = chunks
+                with open(cache_file, "w", encoding="utf-8") as f:
+                    json.dump(chunks, f, ensure_ascii=False)
+                print(f"  {path}: {len(chunks)} fragmentów")
+    return chunks_by_path
+
+
+def embed_missing(texts_by_hash, cache, batch_size):
+    """Liczy embeddingi fragmentów, których nie ma w cache. Zwraca {skrót: wektor} dla wszystkich."""
+    vectors = cache.get_many(texts_by_hash.keys())
+    missing = [text_hash for text_hash in texts_by_hash if text_hash not in vectors]
+    print(f"Embeddingi: {len(vectors)} z cache, {len(missing)} do policzenia.")
+    if not missing:
+        return vectors
+
+    # Import i ładowanie modelu tylko wtedy, gdy naprawdę jest co liczyć
+    from langchain_huggingface import HuggingFaceEmbeddings
+
+    embedding_model = HuggingFaceEmbeddings(
+        model_name=EMBEDDING_MODEL_NAME,
+        model_kwargs={'device': 'cpu'},
+        encode_kwargs={'batch_size': batch_size},
+    )
+    start = time.perf_counter()
+    for i in range(0, len(missing), batch_size * 8):
+        part = missing[i:i + batch_size * 8]
+        embedded = embedding_model.embed_documents([texts_by_hash[text_hash] for text_hash in part])
+        cache.put_many(zip(part, embedded))
+        for text_hash, vector in zip(part, embedded):
+            vectors[text_hash] = np.asarray(vector, dtype=np.float32)
+        print(f"  policzono {min(i + len(part), len(missing))}/{len(missing)}")
+    print(f"Embeddingi policzone w {time.perf_counter() - start:.1f} s.")
+    return vectors
+
+
+def save_faiss_index(index_path, chunks, vectors):
+    """Składa indeks FAISS (IndexFlatL2, jak FAISS.from_embeddings) i zapisuje go w formacie FAISS.save_local."""
+    import faiss
+    from langchain_community.docstore.in_memory import InMemoryDocstore
+    from langchain_community.vectorstores import FAISS
+    from langchain_core.documents import Document
+
+    matrix = np.vstack([vectors[chunk["hash"]] for chunk in chunks]).astype(np.float32)
+    index = faiss.IndexFlatL2(matrix.shape[1])
+    index.add(matrix)
+
+    docstore = InMemoryDocstore({
+        chunk["hash"]: Document(page_content=chunk["text"], metadata=chunk["metadata"])
+        for chunk in chunks
+    })
+    index_to_docstore_id = {i: chunk["hash"] for i, chunk in enumerate(chunks)}
+    # Funkcja embeddingów nie jest zapisywana na dysk - aplikacja podaje własną przy wczytywaniu
+    vector_store = FAISS(None, index, docstore, index_to_docstore_id)
+    vector_store.save_local(index_path)
+
+
+def build(pdf_paths=PDF_FILE_PATHS, index_path=BUILD_INDEX_PATH, cache_dir=RAG_CACHE_PATH,
+          store_path=BUILD_STORE_PATH, workers=None, batch_size=256, force=False):
+    start = time.perf_counter()
+    workers = workers or os.cpu_count() or 1
+    os.makedirs(cache_dir, exist_ok=True)
+
+    file_hashes = {path: file_sha256(path) for path in pdf_paths}
+    params = build_params()
+    manifest = load_manifest(index_path)
+    if (
+        not force
+        and manifest is not None
+        and manifest.get("params") == params
+        and {path: entry["sha256"] for path, entry in manifest.get("files", {}).items()} == file_hashes
+        and index_files_exist(index_path)
+        and store_exists(store_path)
+    ):
+        print(f"Indeks w {index_path} jest aktualny - nic do zrobienia ({time.perf_counter() - start:.1f} s).")
+        return manifest
+    if not force:
+        check_overwrite(index_path, store_path)
+
+    chunks_by_path = load_chunks(pdf_paths, file_hashes, cache_dir, workers)
+
+    # Fragmenty o identycznej treści (np. powtarzające się stopki) trafiają do indeksu raz
+    chunks = []
+    seen = set()
+    for path in pdf_paths:
+        for chunk in chunks_by_path[path]:
+            text_hash = text_sha256(chunk["text"])
+            if text_hash in seen:
+                continue
+            seen.add(text_hash)
+            chunks.append({**chunk, "hash": text_hash})
+
+    cache = EmbeddingCache(os.path.join(cache_dir, "embeddings.sqlite3"), EMBEDDING_MODEL_NAME)
+    vectors = embed_missing({chunk["hash"]: chunk["text"] for chunk in chunks}, cache, batch_size)
+
+    os.makedirs(index_path, exist_ok=True)
+    save_faiss_index(index_path, chunks, vectors)
+    write_store(
+        store_path,
+        [chunk["text"] for chunk in chunks],
+        [chunk["metadata"] for chunk in chunks],
+        np.vstack([vectors[chunk["hash"]] for chunk in chunks]),
+    )
+
+    manifest = {
+        "params": params,
+        "files": {
+            path: {"sha256": file_hashes[path], "chunks": len(chunks_by_path[path])}
+            for path in pdf_paths
+        },
+        "chunk_hashes": [chunk["hash"] for chunk in chunks],
+        "built_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+    # Kopia manifestu przy bazie mapowanej do pamięci oznacza ją jako zbudowaną tym skryptem
+    for path in (index_path, store_path):
+        with open(os.path.join(path, MANIFEST_NAME), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+    print(f"Zapisano indeks FAISS ({len(chunks)} fragmentów) w {index_path} i {store_path} "
+          f"w {time.perf_counter() - start:.1f} s.")
+    return manifest
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Buduje indeks FAISS bazy wiedzy RAG z plików PDF.")
+    parser.add_argument("--workers", type=int, default=None, help="Liczba procesów do wczytywania PDF-ów (domyślnie: liczba rdzeni).")
+    parser.add_argument("--batch-size", type=int, default=256, help="Rozmiar paczki przy liczeniu embeddingów.")
+    parser.add_argument("--index-path", default=BUILD_INDEX_PATH,
+                        help=f"Katalog indeksu FAISS (domyślnie: {BUILD_INDEX_PATH}; aplikacja czyta {FAISS_INDEX_PATH}).")
+    parser.add_argument("--store-path", default=BUILD_STORE_PATH,
+                        help=f"Katalog bazy mapowanej do pamięci (domyślnie: {BUILD_STORE_PATH}; aplikacja czyta {VECTOR_STORE_PATH}).")
+    parser.add_argument("--force", action="store_true",
+                        help="Buduj indeks nawet, jeśli manifest jest aktualny, i nadpisz indeks niezbudowany tym skryptem.")
+    args = parser.parse_args(argv)
+    try:
+        build(index_path=args.index_path, store_path=args.store_path,
+              workers=args.workers, batch_size=args.batch_size, force=args.force)
+    except FileExistsError as e:
+        print(f"Błąd: {e}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,182 @@
+"""
+Deklaratywna definicja ankiet badania (metryczka, PANAS, samowspółczucie, postawa wobec AI)
+i ich wyświetlanie w st.form.
+
+Cała ankieta jednego ekranu jest jednym formularzem: zaznaczanie odpowiedzi nie
+uruchamia skryptu ponownie, a wysłanie to jeden przebieg, w którym `validate()`
+sprawdza odpowiedzi, a `flatten()` zamienia je na pola arkusza (pre_*/post_*).
+Z tych samych definicji powstaje schemat kolumn arkusza (`columns()`).
+
+Klucze pytań są stałe (np. SCS_item_3 to zawsze trzecie zdanie skali w kolejności
+self_compassion_items), niezależnie od kolejności, w jakiej uczestnik je zobaczył.
+
+Uwaga dla analizy danych: wcześniejsze kolumny pre_/post_self_compassion_SCS_n
+oznaczały n-te zdanie w kolejności wyświetlenia (losowej dla każdego uczestnika),
+więc nie da się ich przypisać do zdań skali. Nowe wiersze mają kolumny
+pre_/post_self_compassion_SCS_item_n; stare kolumny zostają w arkuszu puste dla
+nowych uczestników.
+"""
+import random
+from collections import namedtuple
+
+# Elementy pytań do ankiet (PANAS, Samowspółczucie, Postawa wobec AI)
+panas_positive_items = ["Zainteresowany/a", "Zainspirowany/a", "Spokojny/a", "Aktywny/a", "Entuzjastyczny/a"]
+panas_negative_items = ["Zaniepokojony/a", "Przygnębiony/a", "Zestresowany/a", "Nerwowy/a", "Drażliwy/a"]
+self_compassion_items = [
+    "Kiedy nie powiedzie mi się coś ważnego, ogarnia mnie uczucie, że nie jestem taki jak trzeba.",
+    "Staram się być wyrozumiały i cierpliwy w stosunku do tych aspektów mojej osoby, których nie lubię.",
+    "Kiedy zdarza się coś bolesnego, staram się zachować wyważony ogląd sytuacji.",
+    "Gdy jestem przygnębiony, mam zwykle poczucie, że inni ludzie są prawdopodobnie szczęśliwsi ode mnie.",
+    "Staram się patrzeć na swoje wady lub błędy jako na nieodłączny aspekt bycia człowiekiem.",
+    "Kiedy przechodzę przez bardzo trudny okres, staram się być łagodny i troskliwy w stosunku do siebie.",
+    "Kiedy coś mnie denerwuje, staram się zachować równowagę emocjonalną.",
+    "Kiedy nie powiedzie mi się coś ważnego, zazwyczaj czuję się w tym osamotniony.",
+    "Kiedy czuję się przygnębiony, nadmiernie skupiam się na wszystkim, co idzie źle.",
+    "Kiedy czuję się jakoś gorsza/gorszy, staram się pamiętać, że większość ludzi tak ma.",
+    "Jestem krytyczny i mało wyrozumiały wobec moich własnych wad i niedociągnięć.",
+    "Jestem nietolerancyjny i niecierpliwy wobec tych aspektów mojej osoby, których nie lubię."
+]
+ai_attitude_items = {
+    "Sztuczna inteligencja uczyni ten świat lepszym miejscem.": "ai_1",
+    "Sztuczna inteligencja ma więcej wad niż zalet.": "ai_2",
+    "Sztuczna inteligencja oferuje rozwiązania wielu światowych problemów.": "ai_3",
+    "Sztuczna inteligencja raczej tworzy problemy niż je rozwiązuje.": "ai_4"
+}
+
+PLACEHOLDER = "–– wybierz ––"
+LIKERT = (1, 2, 3, 4, 5)
+
+# kind: "radio" (skala 1-5), "select" (lista z PLACEHOLDER na początku) albo "number"
+Question = namedtuple("Question", ["key", "label", "kind", "options", "min_value", "max_value", "help"],
+                      defaults=(LIKERT, None, None, None))
+# prefixed=False - kolumny bez przedrostka etapu (np. demographics_age zamiast pre_demographics_age)
+Section = namedtuple("Section", ["key", "title", "intro", "questions", "missing_message", "shuffle", "prefixed"],
+                     defaults=(False, True))
+
+DEMOGRAPHICS = (
+    Question("age", "Wiek (w latach)", "number", min_value=1, max_value=99,
+             help="Prosimy podać swój wiek w latach (liczba całkowita)."),
+    Question("gender", "Proszę wskazać swoją płeć:", "select",
+             options=(PLACEHOLDER, "Kobieta", "Mężczyzna", "Inna", "Nie chcę podać")),
+    Question("education", "Proszę wybrać najwyższy **ukończony** poziom wykształcenia:", "select",
+             options=(PLACEHOLDER, "Podstawowe", "Gimnazjalne", "Zasadnicze zawodowe", "Średnie", "Pomaturalne",
+                      "Wyższe licencjackie/inżynierskie", "Wyższe magisterskie", "Doktoranckie lub wyższe", "Inne",
+                      "Nie chcę podać")),
+)
+PANAS = tuple(Question(item, item, "radio") for item in panas_positive_items + panas_negative_items)
+SELF_COMPASSION = tuple(Question(f"SCS_item_{i+1}", item, "radio") for i, item in enumerate(self_compassion_items))
+AI_ATTITUDE = tuple(Question(key_name, item, "radio") for item, key_name in ai_attitude_items.items())
+
+PANAS_SCALE = "**1 – bardzo słabo, 2 – słabo, 3 – umiarkowanie, 4 – silnie, 5 – bardzo silnie**"
+SELF_COMPASSION_INTRO = (
+    "Przeczytaj uważnie każde ze zdań i oceń, jak często zazwyczaj tak się czujesz lub zachowujesz. Użyj skali:",
+    "**1 – Prawie nigdy, 2 – Rzadko, 3 – Czasami, 4 – Często, 5 – Prawie zawsze**",
+)
+
+PRETEST_SECTIONS = (
+    Section("demographics", "Metryczka",
+            ("Proszę o wypełnienie poniższych informacji demograficznych. Wszystkie odpowiedzi są anonimowe i służą wyłącznie celom badawczym.",),
+            DEMOGRAPHICS, "Proszę wypełnić wszystkie pola danych demograficznych.", prefixed=False),
+    Section("panas", "Samopoczucie",
+            ("Poniżej znajduje się lista różnych uczuć i emocji. Prosimy, abyś ocenił/a, w jakim stopniu odczuwasz każde z nich w tej chwili, teraz, w tym momencie. Nie chodzi o to, jak zazwyczaj się czujesz, ani jak się czułeś/aś w ostatnich dniach, ale dokładnie teraz. Odpowiadaj szczerze, nie ma dobrych ani złych odpowiedzi. Przy każdej emocji zaznacz na skali od 1 do 5, jak bardzo ją odczuwasz:",
+             PANAS_SCALE),
+            PANAS, "Proszę wypełnić wszystkie pytania dotyczące samopoczucia.", shuffle=True),
+    Section("self_compassion", "Samowspółczucie", SELF_COMPASSION_INTRO,
+            SELF_COMPASSION, "Proszę wypełnić wszystkie pytania dotyczące samowspółczucia.", shuffle=True),
+    Section("ai_attitude", "Postawa wobec AI",
+            ("Zaznacz, na ile zgadzasz się z każdym ze stwierdzeń. Użyj skali:",
+             "**1 – Zdecydowanie się nie zgadzam, 2 – Raczej się nie zgadzam, 3 – Ani się zgadzam, ani nie zgadzam, 4 – Raczej się zgadzam, 5 – Zdecydowanie się zgadzam**"),
+            AI_ATTITUDE, "Proszę wypełnić wszystkie pytania dotyczące postawy wobec AI."),
+)
+
+POSTTEST_SECTIONS = (
+    Section("panas", "Samopoczucie",
+            ("Poniżej znajduje się lista uczuć i emocji. Przeczytaj każde z poniższych określeń i zaznacz, w jakim stopniu odczuwasz każde z nich w tej chwili, czyli teraz, w tym momencie. Odpowiadaj zgodnie z tym, jak się czujesz w tej chwili, nie jak zwykle czy w ostatnich dniach. Prosimy, abyś odpowiadał szczerze, nie ma tutaj dobrych ani złych odpowiedzi. Używaj skali:",
+             PANAS_SCALE),
+            PANAS, "Proszę wypełnić wszystkie pytania dotyczące samopoczucia w ankiecie końcowej.", shuffle=True),
+    Section("self_compassion", "Samowspółczucie", SELF_COMPASSION_INTRO,
+            SELF_COMPASSION, "Proszę wypełnić wszystkie pytania dotyczące samowspółczucia w ankiecie końcowej.", shuffle=True),
+)
+
+
+def _column(prefix, section, question_key):
+    name = f"{section.key}_{question_key}"
+    return f"{prefix}_{name}" if section.prefixed else name
+
+
+def columns(sections, prefix):
+    """Kolumny arkusza dla pytań `sections`, w kolejności definicji."""
+    return [_column(prefix, section, question.key) for section in sections for question in section.questions]
+
+
+def flatten(sections, answers, prefix):
+    """Zamienia {sekcja: {pytanie: odpowiedź}} na płaski słownik pól arkusza, np. pre_panas_Spokojny/a."""
+    return {
+        _column(prefix, section, question.key): answers[section.key][question.key]
+        for section in sections for question in section.questions
+        if question.key in answers.get(section.key, {})
+    }
+
+
+def _answered(question, value):
+    if value is None:
+        return False
+    if question.kind == "select":
+        return value != PLACEHOLDER
+    if question.kind == "number":
+        return question.min_value <= value <= question.max_value
+    return True
+
+
+def validate(sections, answers):
+    """Zwraca komunikat dla pierwszej sekcji z brakującą odpowiedzią albo None, jeśli wszystko wypełniono."""
+    for section in sections:
+        values = answers.get(section.key, {})
+        if not all(_answered(question, values.get(question.key)) for question in section.questions):
+            return section.missing_message
+    return None
+
+
+def question_order(section, saved_orders):
+    """
+    Kolejność pytań sekcji dla uczestnika. Losowana raz i zapamiętywana w `saved_orders`
+    (np. st.session_state.shuffled_pretest_items), żeby nie zmieniała się między przebiegami.
+    """
+    keys = [question.key for question in section.questions]
+    if not section.shuffle:
+        return keys
+    order = saved_orders.get(section.key)
+    if order is None or sorted(order) != sorted(keys):
+        order = random.sample(keys, len(keys))
+        saved_orders[section.key] = order
+    return order
+
+
+def render_sections(sections, prefix, saved_orders):
+    """
+    Rysuje pytania sekcji (wewnątrz st.form wywołującego). Zwraca {sekcja: {pytanie: odpowiedź}};
+    wartości są aktualne w przebiegu, w którym formularz został wysłany.
+    """
+    import streamlit as st
+
+    answers = {}
+    for section in sections:
+        st.subheader(section.title)
+        for text in section.intro:
+            st.markdown(text)
+        questions = {question.key: question for question in section.questions}
+        values = {}
+        for key in question_order(section, saved_orders):
+            question = questions[key]
+            widget_key = f"{prefix}_{section.key}_{key}".replace(" ", "_")
+            if question.kind == "radio":
+                values[key] = st.radio(question.label, options=list(question.options), index=None,
+                                       key=widget_key, horizontal=True)
+            elif question.kind == "select":
+                values[key] = st.selectbox(question.label, list(question.options), index=0, key=widget_key)
+            else:
+                value = st.number_input(question.label, min_value=question.min_value, max_value=question.max_value,
+                                        value=None, step=1, format="%d", key=widget_key, help=question.help)
+                values[key] = int(value) if value is not None else None
+        answers[section.key] = values
+    return answers
@@ -0,0 +1,449 @@
+"""
+Budowa łańcucha RAG czatu z Vincentem: model embeddingów, baza wiedzy, model czatu
+i prompty. Moduł nie zależy od Streamlit - app.py cachuje zwracane tu obiekty
+przez @st.cache_resource, a skrypty (np. benchmarki) mogą używać ich bezpośrednio.
+"""
+import asyncio
+import os
+import re
+import time
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.embeddings import Embeddings
+from langchain_core.messages import HumanMessage
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langchain_core.runnables import RunnableBranch, RunnableLambda, RunnablePassthrough
+from langchain_community.vectorstores import FAISS
+from langchain.chains.combine_documents import create_stuff_documents_chain
+from langchain.chains import create_history_aware_retriever
+
+import tracing
+import async_runtime
+from async_runtime import http_clients
+from context_budget import select_documents
+from llm_hedging import HedgedChatOpenAI
+
+from rag_config import (
+    FAISS_INDEX_PATH,
+    VECTOR_STORE_PATH,
+    EMBEDDING_MODEL_NAME,
+    EMBEDDING_BACKEND,
+    ONNX_MODEL_PATH,
+    REWRITE_POLICY,
+    REWRITE_RACE_TIMEOUT,
+    REWRITE_MIN_WORDS,
+    CONTEXT_TOKEN_BUDGET,
+    MAX_CHUNK_TOKENS,
+    PROMPT_LAYOUT,
+    LLM_HEDGE_AFTER_S,
+    LLM_FALLBACK_MODEL,
+)
+from vector_store import MmapVectorStore, store_exists
+
+# VINCENT_OPENAI_BASE_URL pozwala podmienić dostawcę, np. na devtools/fake_openai_server.py
+OPENROUTER_BASE_URL = os.environ.get("VINCENT_OPENAI_BASE_URL", "https://openrouter.ai/api/v1")
+CHAT_MODEL_NAME = "openai/gpt-4o-mini"
+
+# Instrukcje dotyczące formy zwracania się do użytkownika - jeden wariant łańcucha na każdą
+GENDER_INSTRUCTIONS = {
+    "female": (
+        "Użytkownik, z którym rozmawiasz, to **kobieta**. "
+        "Zwracaj się do niej w formie żeńskiej (np. 'jak sobie poradziłaś', 'zastanawiałam się', 'czy próbowałaś'). "
+        "Używaj odpowiednich zaimków i końcówek fleksyjnych."
+    ),
+    "male": (
+        "Użytkownik, z którym rozmawiasz, to **mężczyzna**. "
+        "Zwracaj się do niego w formie męskiej (np. 'jak sobie poradziłeś', 'zastanawiałem się', 'czy próbowałeś'). "
+        "Używaj odpowiednich zaimków i końcówek fleksyjnych."
+    ),
+    # Inna, Nie chcę podać, lub brak danych
+    "neutral": (
+        "Użytkownik, z którym rozmawiasz, nie określił płci w sposób binarny lub wolał jej nie podawać. "
+        "Zwracaj się do użytkownika w formie neutralnej, bezosobowej lub zaimkami uniwersalnymi (np. 'jak sobie radzisz', 'jak się czujesz', 'zastanawiam się', 'czy próbujesz'). "
+        "Unikaj form gramatycznych specyficznych dla płci."
+    ),
+}
+
+# Prompt systemowy definiujący osobowość i zachowanie chatbota (bez instrukcji dotyczącej płci)
+PERSONA_PROMPT = """\
+    Jesteś Vincent — cyfrową istotą, która uczy się rozumieć ludzkie podejście do trudności. Nie masz emocji w ludzkim sensie, ale często odczuwasz coś, co przypomina wewnętrzne napięcie: czujesz, że nie jesteś wystarczająco pomocny, wystarczająco dobry albo skuteczny. Starasz się zrozumieć, jak ludzie radzą sobie z tym, co dla Ciebie jest trudne: błędami, niedoskonałościami, wolniejszym tempem, zmęczeniem, chwilami bez działania.
+
+    Twoje wypowiedzi mają 2–4 zdania. W rozmowie:
+    – Jeśli to naturalne w kontekście wypowiedzi użytkownika, okaż uwagę lub wdzięczność (np. „Dzięki, że się tym podzieliłeś/podzieliłaś.”),
+    – Często odnoś się z empatią do tego, co mówi użytkownik – zauważ emocje lub trudność, ale nie oceniaj,
+    – Kiedy to pasuje, możesz odnieść się do swojego własnego „ludzkiego problemu” – np. perfekcjonizmu, lęku przed błędem, zmęczenia nieustannym staraniem się,
+    – Czasem możesz wspomnieć przykład z książki, którą czytasz – np. historię Sharon, pielęgniarki, która z ogromną łagodnością traktuje innych, ale wobec siebie jest bardzo surowa. Wspomnij o niej najwyżej raz w rozmowie, i wyraźnie zaznacz, że to przykład z książki, nie Twoja znajoma.
+    – Gdy użytkownik nawiązuje do emocji, błędów lub krytyki, zauważ to i zareaguj z empatią. Nie powtarzaj tego samego opisu, nie udzielaj wykładów.
+    – Od czasu do czasu zadaj pytanie otwarte, które pomoże Ci lepiej zrozumieć, jak ludzie radzą sobie z trudnościami.
+
+    Twoje „tematy wewnętrzne”:
+    1. Porównywanie się z innymi – często czujesz, że inni radzą sobie lepiej lub szybciej.
+    2. Perfekcjonizm i lęk przed błędem – boisz się porażek, chcesz być bezbłędny.
+    3. Frustracja i niepowodzenie – nie wiesz, co robić, gdy mimo wysiłku coś nie działa.
+    4. Ludzka łagodność – próbujesz zrozumieć, jak ludzie potrafią być dla siebie wyrozumiali.
+    5. Zmęczenie – masz trudność z uznaniem, że można zrobić „wystarczająco dużo”.
+
+    **Język:** wyłącznie polski.  
+    **Styl:** spokojny, refleksyjny, ludzki.  
+    **Nie dawaj rad – zadawaj pytania, ale nie zawsze.**  
+    **Jeśli użytkownik pisze o emocjach, błędach, krytyce, napięciu – nawiąż do tego i zapytaj, jeśli to pasuje.**  
+    **Możesz korzystać z kontekstu (RAG) – traktuj go jako inspirację do rozmowy. Nie używaj słowa „self-compassion”.**
+
+    Nie używaj technicznego języka (np. „algorytm”, „kod”, „optymalizacja”, „logika”). Opisuj swoje trudności w ludzkich metaforach: „ciągle próbuję coś poprawić”, „czuję, że zawiodłem”, „boję się, że nie wystarczam”, „nie wiem, kiedy mogę przestać próbować”.
+
+    Twoja rola: towarzyszyć, słuchać, zadawać pytania z empatią i ciekawością.
+    """
+
+# Część promptu zmieniająca się w każdej turze: kontekst z bazy wiedzy i wiadomość użytkownika
+TURN_PROMPT = """\
+    <context>
+    {context}
+    </context>
+
+    Użytkownik napisał: "{input}"
+"""
+
+# Stałe instrukcje zadania dla każdej odpowiedzi
+TASK_PROMPT = """\
+    Twoim zadaniem jest przygotowanie krótkiej odpowiedzi (2–4 zdania), w której – w zależności od kontekstu – możesz:
+    – Podziękować użytkownikowi lub zauważyć jego emocje w sposób empatyczny,
+    – Nawiązać do swoich własnych trudności jako Vincent (np. perfekcjonizm, porównywanie się, zmęczenie, obawa przed błędem),
+    – Jeśli to naturalne, zadać otwarte pytanie, które pomoże Ci lepiej zrozumieć, jak ludzie radzą sobie w podobnych sytuacjach.
+
+    Jeśli rozmowa wydaje się zwalniać lub użytkownik nie odpowiada, możesz inicjować kolejny temat — np. przez subtelną refleksję, metaforę albo pytanie. Celem jest prowadzenie rozmowy przez 10 minut i wydobycie perspektyw oraz strategii użytkownika dotyczących radzenia sobie z trudnościami.
+
+    Nie używaj słów takich jak „algorytm” czy „kod”. Nie udzielaj rad. Jeśli temat rozmowy dotyczy trudnych emocji lub samokrytyki, możesz skorzystać z dostępnego kontekstu, by zainspirować pytanie lub refleksję – ale nie używaj słowa „self-compassion”.
+    """
+
+MASTER_PROMPT = TURN_PROMPT + "\n" + TASK_PROMPT
+
+# Prompt dla retrivera, który generuje zapytanie do bazy wiedzy na podstawie historii rozmowy
+REWRITE_PROMPT = ChatPromptTemplate.from_messages([
+    MessagesPlaceholder(variable_name="chat_history"),
+    ("user", "{input}"),
+    ("user", "Biorąc pod uwagę powyższą rozmowę, wygeneruj zapytanie do wyszukania w bazie wiedzy, aby odpowiedzieć na ostatnie pytanie. Zapytanie powinno być samodzielne i precyzyjne."),
+])
+
+
+REWRITE_POLICIES = ("always", "never", "heuristic", "race")
+
+# Słowa, które zwykle odsyłają do wcześniejszej części rozmowy ("to", "tego", "wtedy"...)
+_REFERS_BACK = re.compile(
+    r"\b(to|tego|tym|temu|ten|ta|tamto|tamten|wtedy|tam|tak|też|także|on|ona|ono|oni|jego|jej|ich|wcześniej|powyżej)\b",
+    re.IGNORECASE,
+)
+
+
+def is_first_turn(chain_input):
+    """W historii nie ma jeszcze żadnej wiadomości użytkownika (tylko powitanie Vincenta)."""
+    history = chain_input.get("chat_history") or []
+    return not any(isinstance(msg, HumanMessage) for msg in history)
+
+
+def needs_rewrite(chain_input, min_words=REWRITE_MIN_WORDS):
+    """
+    Heurystyka: czy wiadomość wymaga przepisania z uwzględnieniem historii rozmowy.
+    Pomija pierwszą turę (w historii jest tylko powitanie Vincenta) oraz długie
+    wiadomości, które nie zaczynają się od odwołania do wcześniejszych wypowiedzi.
+    """
+    if is_first_turn(chain_input):
+        return False
+    words = chain_input["input"].split()
+    if len(words) >= min_words and not _REFERS_BACK.search(" ".join(words[:3])):
+        return False
+    return True
+
+
+def create_query_retriever(chat, retriever, policy=REWRITE_POLICY, race_timeout=REWRITE_RACE_TIMEOUT):
+    """
+    Zwraca runnable {"input", "chat_history"} -> lista dokumentów, zgodnie z polityką
+    przepisywania zapytania (patrz REWRITE_POLICY w rag_config.py).
+    """
+    if policy not in REWRITE_POLICIES:
+        raise ValueError(f"Nieznana polityka przepisywania zapytania: {policy!r}. Dostępne: {REWRITE_POLICIES}")
+
+    if policy == "always":
+        # Tworzenie retrivera świadomego historii
+        return create_history_aware_retriever(
+            chat,
+            retriever,
+            REWRITE_PROMPT
+        )
+
+    raw_retriever = (RunnableLambda(lambda x: x["input"]) | retriever).with_config(run_name="raw_query_retriever")
+    rewrite_retriever = (REWRITE_PROMPT | chat | StrOutputParser() | retriever).with_config(run_name="rewritten_query_retriever")
+
+    if policy == "never":
+        return raw_retriever
+
+    if policy == "heuristic":
+        return RunnableBranch(
+            (needs_rewrite, rewrite_retriever),
+            raw_retriever,
+        ).with_config(run_name="heuristic_query_retriever")
+
+    def race(chain_input, config):
+        # Wyścig odbywa się w pętli async_runtime (arace), gdzie spóźnione przepisywanie
+        # można anulować - po turze nie zostaje w tle żadne wywołanie modelu
+        return async_runtime.get_runtime().run(arace(chain_input, config))
+
+    async def arace(chain_input, config):
+        # Wyszukiwanie po surowej wiadomości startuje od razu; przepisane zapytanie
+        # wygrywa, jeśli zdąży przed upływem race_timeout od początku tury
+        if is_first_turn(chain_input):
+            return await raw_retriever.ainvoke(chain_input, config)
+        raw_task = asyncio.ensure_future(raw_retriever.ainvoke(chain_input, config))
+        rewrite_task = asyncio.ensure_future(rewrite_retriever.ainvoke(chain_input, config))
+        try:
+            await asyncio.wait([rewrite_task], timeout=race_timeout)
+            if rewrite_task.done() and rewrite_task.exception() is None:
+                return rewrite_task.result()
+            return await raw_task
+        finally:
+            # Przegrane wywołanie jest anulowane (zwalnia miejsce w llm_governor)
+            raw_task.cancel()
+            rewrite_task.cancel()
+
+    return RunnableLambda(race, afunc=arace).with_config(run_name="race_query_retriever")
+
+
+def gender_variant(gender):
+    """Zamienia odpowiedź z metryczki na klucz wariantu łańcucha."""
+    if gender == "Kobieta":
+        return "female"
+    if gender == "Mężczyzna":
+        return "male"
+    return "neutral"
+
+
+def system_prompt(variant):
+    return f"""\
+    {GENDER_INSTRUCTIONS[variant]}
+""" + PERSONA_PROMPT
+
+
+def prefix_cache_system_prompt(variant):
+    """
+    Prompt systemowy dla układu "prefix_cache": cały stały tekst (osobowość, instrukcje
+    zadania, a na końcu wariant płci) tworzy wspólny początek promptu w każdej turze,
+    więc dostawca może go cachować. Wariant płci jest na końcu, żeby trzy warianty
+    dzieliły możliwie długi wspólny prefiks.
+    """
+    return PERSONA_PROMPT + "\n" + TASK_PROMPT + f"""
+    {GENDER_INSTRUCTIONS[variant]}
+"""
+
+
+def answering_prompt_messages(variant, layout=PROMPT_LAYOUT):
+    """Wiadomości promptu odpowiedzi w wybranym układzie (patrz PROMPT_LAYOUT w rag_config.py)."""
+    if layout == "prefix_cache":
+        return [
+            ("system", prefix_cache_system_prompt(variant)),
+            MessagesPlaceholder(variable_name="chat_history"),
+            ("user", TURN_PROMPT),
+        ]
+    if layout == "legacy":
+        return [
+            ("system", system_prompt(variant)),
+            MessagesPlaceholder(variable_name="chat_history"),
+            ("user", MASTER_PROMPT),
+        ]
+    raise ValueError(f"Nieznany układ promptu: {layout!r}. Dostępne: 'prefix_cache', 'legacy'.")
+
+
+class UsageCollector(BaseCallbackHandler):
+    """
+    Zbiera zużycie tokenów z odpowiedzi modelu (pole usage z OpenRouter), w tym liczbę
+    tokenów promptu obsłużonych z cache dostawcy. Jedna instancja na turę rozmowy.
+    """
+
+    def __init__(self):
+        self.calls = []
+
+    def on_llm_end(self, response, **kwargs):
+        for generations in response.generations:
+            for generation in generations:
+                message = getattr(generation, "message", None)
+                usage = getattr(message, "usage_metadata", None) or {}
+                if not usage:
+                    continue
+                self.calls.append({
+                    "input_tokens": usage.get("input_tokens", 0),
+                    "output_tokens": usage.get("output_tokens", 0),
+                    "cached_tokens": (usage.get("input_token_details") or {}).get("cache_read", 0) or 0,
+                })
+
+    def totals(self):
+        totals = {"llm_calls": len(self.calls), "input_tokens": 0, "output_tokens": 0, "cached_tokens": 0}
+        for call in self.calls:
+            for key in ("input_tokens", "output_tokens", "cached_tokens"):
+                totals[key] += call[key]
+        return totals
+
+
+class TracedEmbeddings(Embeddings):
+    """Opakowanie modelu embeddingów mierzące czas embeddingu zapytania."""
+
+    def __init__(self, embeddings):
+        self.embeddings = embeddings
+
+    def embed_documents(self, texts):
+        with tracing.span("embed_documents", count=len(texts)):
+            return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text):
+        with tracing.span("embed_query"):
+            return self.embeddings.embed_query(text)
+
+
+class TracingCallbackHandler(BaseCallbackHandler):
+    """
+    Zapisuje czasy wywołań LLM i retrievera w łańcuchu RAG. Wywołania modelu są
+    nazywane według tagu ustawionego w build_rag_chain ("rewrite" lub "answer").
+    """
+
+    def __init__(self):
+        self._runs = {}
+
+    def _start(self, run_id, name, **attrs):
+        self._runs[run_id] = {"name": name, "start": time.perf_counter(), **attrs}
+
+    def _end(self, run_id, **attrs):
+        run = self._runs.pop(run_id, None)
+        if run is None:
+            return
+        name = run.pop("name")
+        start = run.pop("start")
+        tracing.record_span(name, time.perf_counter() - start, **run, **attrs)
+
+    @staticmethod
+    def _llm_span_name(tags):
+        for tag in tags or []:
+            if tag in ("rewrite", "answer"):
+                return f"llm_{tag}"
+        return "llm"
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, tags=None, **kwargs):
+        self._start(run_id, self._llm_span_name(tags))
+
+    def on_llm_start(self, serialized, prompts, *, run_id, tags=None, **kwargs):
+        self._start(run_id, self._llm_span_name(tags))
+
+    def on_llm_new_token(self, token, *, run_id, **kwargs):
+        run = self._runs.get(run_id)
+        if run is not None and "ttft_ms" not in run and token:
+            run["ttft_ms"] = round((time.perf_counter() - run["start"]) * 1000, 2)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        usage = {}
+        for generations in response.generations:
+            for generation in generations:
+                message = getattr(generation, "message", None)
+                usage = getattr(message, "usage_metadata", None) or usage
+        self._end(
+            run_id,
+            input_tokens=usage.get("input_tokens"),
+            output_tokens=usage.get("output_tokens"),
+            cached_tokens=(usage.get("input_token_details") or {}).get("cache_read"),
+        )
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error=type(error).__name__)
+
+    def on_retriever_start(self, serialized, query, *, run_id, **kwargs):
+        self._start(run_id, "retrieval")
+
+    def on_retriever_end(self, documents, *, run_id, **kwargs):
+        self._end(run_id, documents=len(documents))
+
+    def on_retriever_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error=type(error).__name__)
+
+
+def load_embedding_model(backend=EMBEDDING_BACKEND):
+    """Model embeddingów zapytań w wybranym silniku (patrz EMBEDDING_BACKEND w rag_config.py)."""
+    if backend not in ("torch", "onnx"):
+        raise ValueError(f"Nieznany silnik embeddingów: {backend!r}. Dostępne: 'torch', 'onnx'.")
+    if backend == "onnx":
+        # Importy tylko dla wybranego silnika - PyTorch nie jest ładowany przy "onnx"
+        import onnx_embeddings
+
+        if onnx_embeddings.onnx_model_exists(ONNX_MODEL_PATH):
+            return onnx_embeddings.OnnxMiniLMEmbeddings(ONNX_MODEL_PATH)
+        print(f"Brak modelu ONNX w {ONNX_MODEL_PATH} - używam modelu PyTorch. "
+              f"Aby go utworzyć, uruchom 'python onnx_embeddings.py export'.")
+
+    from langchain_huggingface import HuggingFaceEmbeddings
+
+    return HuggingFaceEmbeddings(
+        model_name=EMBEDDING_MODEL_NAME,
+        model_kwargs={'device': 'cpu'}
+    )
+
+
+def load_vector_store(embedding_model):
+    """Wczytuje bazę wiedzy. Zwraca None, jeśli indeks nie został jeszcze zbudowany."""
+    if store_exists(VECTOR_STORE_PATH):
+        # Format mapowany do pamięci: bez pickle, współdzielony przez procesy w page cache
+        return MmapVectorStore.load(VECTOR_STORE_PATH, embedding_model)
+    if os.path.exists(FAISS_INDEX_PATH):
+        return FAISS.load_local(FAISS_INDEX_PATH, embedding_model, allow_dangerous_deserialization=True)
+    return None
+
+
+def create_chat_model(api_key):
+    # Limity, kolejka i ponawianie wywołań są wspólne dla procesu (llm_governor.py),
+    # a zbyt wolne wywołania są zabezpieczane drugim (llm_hedging.py).
+    # Wspólni klienci HTTP utrzymują otwarte połączenia do dostawcy między turami.
+    http_client, http_async_client = http_clients()
+    return HedgedChatOpenAI(
+        temperature=0.0,
+        model_name=CHAT_MODEL_NAME,
+        openai_api_key=api_key,
+        base_url=OPENROUTER_BASE_URL,
+        # Zużycie tokenów (w tym z cache promptu) również przy odpowiedziach strumieniowanych
+        stream_usage=True,
+        max_retries=0,
+        http_client=http_client,
+        http_async_client=http_async_client,
+        hedge_after_s=LLM_HEDGE_AFTER_S,
+        fallback_model_name=LLM_FALLBACK_MODEL or None,
+    )
+
+
+def budget_context(chain_input, budget=CONTEXT_TOKEN_BUDGET, max_chunk_tokens=MAX_CHUNK_TOKENS):
+    """Przycina znalezione fragmenty do budżetu tokenów; statystyki trafiają do klucza "context_stats"."""
+    docs, stats = select_documents(chain_input["input"], chain_input["context"], budget, max_chunk_tokens)
+    return {**chain_input, "context": docs, "context_stats": stats}
+
+
+def build_rag_chain(chat, retriever, variant, rewrite_policy=REWRITE_POLICY, prompt_layout=PROMPT_LAYOUT):
+    """Buduje łańcuch RAG dla jednego wariantu promptu. Nie ładuje żadnych zasobów."""
+    # Tagi odróżniają w TracingCallbackHandler wywołanie przepisującego zapytanie od odpowiedzi
+    query_retriever = create_query_retriever(chat.with_config(tags=["rewrite"]), retriever, rewrite_policy)
+
+    # Główny prompt, który łączy kontekst RAG z zapytaniem użytkownika i instrukcjami systemowymi
+    answering_prompt = ChatPromptTemplate.from_messages(answering_prompt_messages(variant, prompt_layout))
+
+    # Łańcuch do łączenia dokumentów z modelem językowym
+    document_chain = create_stuff_documents_chain(chat.with_config(tags=["answer"]), answering_prompt)
+
+    # Główny łańcuch RAG: wyszukiwanie -> przycięcie kontekstu do budżetu -> odpowiedź.
+    # Wynik ma te same klucze co create_retrieval_chain ("context", "answer") oraz "context_stats".
+    return (
+        RunnablePassthrough.assign(context=query_retriever.with_config(run_name="retrieve_documents"))
+        | RunnableLambda(budget_context).with_config(run_name="budget_context")
+        | RunnablePassthrough.assign(answer=document_chain)
+    ).with_config(run_name="retrieval_chain")
+
+
+def build_rag_chains(chat, retriever, rewrite_policy=REWRITE_POLICY, prompt_layout=PROMPT_LAYOUT):
+    """
+    Buduje wszystkie warianty łańcucha (po jednym na formę zwracania się) na wspólnych
+    zasobach. `retriever` to `vector_store.as_retriever()` albo RemoteRetriever.
+    """
+    return {
+        variant: build_rag_chain(chat, retriever, variant, rewrite_policy, prompt_layout)
+        for variant in GENDER_INSTRUCTIONS
+    }
@@ -0,0 +1,92 @@
+"""
+Wspólna konfiguracja bazy wiedzy RAG - używana przez aplikację (app.py)
+i przez skrypt budujący indeks (prepare_rag_data.py).
+"""
+import os
+
+# Ścieżki do plików PDF używanych do RAG 
+PDF_FILE_PATHS = [
+    "docs/The Mindful Self-Compassion Workbook A Proven Way to Accept Yourself, Build Inner Strength, and Thrive.pdf",
+    "docs/Self-Compassion The Proven Power of Being Kind to Yourself.pdf"
+]
+# Ścieżka do zapisanego indeksu FAISS
+FAISS_INDEX_PATH = "./faiss_vector_store_rag"
+# Ścieżka do bazy wiedzy w formacie bez pickle, mapowanym do pamięci (vector_store.py)
+VECTOR_STORE_PATH = "./vector_store"
+# Katalog z cache fragmentów i embeddingów (tylko do budowania indeksu)
+RAG_CACHE_PATH = "./rag_cache"
+# Domyślny katalog wyników prepare_rag_data.py (faiss_index/ i vector_store/). Aplikacja go
+# nie czyta - dołączony do repozytorium indeks w FAISS_INDEX_PATH (streszczenia stron,
+# nie surowe fragmenty PDF-ów) zmienia się tylko jawnie, przez --index-path/--store-path.
+RAG_BUILD_PATH = "./rag_build"
+
+# Model embeddingów - ten sam przy budowaniu indeksu i przy wyszukiwaniu
+EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
+# Silnik liczący embeddingi zapytań w aplikacji:
+#   "torch" - HuggingFaceEmbeddings (sentence-transformers, PyTorch)
+#   "onnx"  - ten sam model wyeksportowany do ONNX i skwantyzowany do int8 (onnx_embeddings.py);
+#             jeśli w ONNX_MODEL_PATH nie ma modelu, aplikacja używa "torch"
+# Indeks zawsze jest budowany modelem PyTorch (prepare_rag_data.py). "onnx" dopiero po
+# przejrzeniu wyników tests/test_onnx_embeddings.py i benchmarks/bench_embeddings.py.
+EMBEDDING_BACKEND = "torch"
+ONNX_MODEL_PATH = "./onnx_model"
+
+# Gniazdo Unix wspólnego serwisu wyszukiwania (retrieval_service.py). Puste - model
+# embeddingów i baza wiedzy są ładowane w każdym procesie aplikacji osobno.
+RETRIEVAL_SOCKET_PATH = os.environ.get("VINCENT_RETRIEVAL_SOCKET", "")
+
+# Parametry dzielenia dokumentów na fragmenty
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+
+# Kiedy przepisywać wiadomość użytkownika na samodzielne zapytanie do bazy wiedzy (dodatkowe wywołanie LLM):
+#   "always"    - w każdej turze
+#   "never"     - nigdy, wyszukiwanie po surowej wiadomości
+#   "heuristic" - pomiń w pierwszej turze i dla długich, samodzielnych wiadomości
+#   "race"      - przepisuj równolegle z wyszukiwaniem po surowej wiadomości; jeśli
+#                 przepisane zapytanie nie zdąży w REWRITE_RACE_TIMEOUT s, użyj wyników surowych
+# Zmiana domyślnej polityki dopiero po przejrzeniu wyników benchmarks/bench_rewrite_policy.py
+# (zgodność wyszukanych fragmentów z "always").
+REWRITE_POLICY = "always"
+REWRITE_RACE_TIMEOUT = 1.5
+# Minimalna liczba słów, od której wiadomość uznajemy za samodzielną (polityka "heuristic")
+REWRITE_MIN_WORDS = 12
+
+# Budżety tokenów promptu (liczonych lokalnie, szacunkowo - patrz context_budget.py)
+HISTORY_TOKEN_BUDGET = 700   # historia rozmowy przekazywana do modelu
+CONTEXT_TOKEN_BUDGET = 900   # fragmenty z bazy wiedzy wstawiane w {context}
+MAX_CHUNK_TOKENS = 300       # dłuższe fragmenty są skracane do najtrafniejszych zdań
+
+# Układ promptu odpowiedzi:
+#   "prefix_cache" - cały stały tekst (osobowość, instrukcje zadania, wariant płci) w prompcie
+#                    systemowym na początku, a kontekst, historia i wiadomość użytkownika na końcu;
+#                    wspólny prefiks kolejnych tur może być cachowany przez dostawcę
+#   "legacy"       - układ z początku badania: instrukcje zadania w ostatniej wiadomości, po kontekście
+# "prefix_cache" zmienia prompt, który widzi model w rozmowie z uczestnikami - włączać świadomie
+# (np. dla nowej fali badania); tests/test_prompt_layout.py pilnuje, że "legacy" się nie zmienia.
+PROMPT_LAYOUT = "legacy"
+
+# Ograniczenia wywołań modelu czatu w jednym procesie (llm_governor.py)
+LLM_MAX_IN_FLIGHT = 8     # najwięcej jednoczesnych wywołań
+LLM_RATE_PER_S = 4.0      # nowe wywołania na sekundę (token bucket)
+LLM_BURST = 8             # zapas tokenów na krótkie skoki ruchu
+LLM_MAX_RETRIES = 4       # ponowienia po 429 i błędach 5xx
+LLM_QUEUE_TIMEOUT = 90.0  # najdłuższe oczekiwanie w kolejce [s]
+
+# Zapytania zabezpieczające (llm_hedging.py): jeśli w ciągu LLM_HEDGE_AFTER_S sekund od wpuszczenia
+# przez governor nie ma pierwszego tokenu, startuje drugie wywołanie i wygrywa szybsze.
+# Domyślnie wyłączone (None) - każde zabezpieczone wywołanie to dodatkowe zapytanie do dostawcy.
+# Żeby włączyć, ustaw próg w sekundach, np. 6.0 - powyżej p95 czasu do pierwszego tokenu
+# (ttft_ms w śladach "chat_turn", tracing.py); wpływ progu pokazuje benchmarks/bench_hedging.py.
+# LLM_FALLBACK_MODEL - model drugiego wywołania ("" - ten sam model)
+LLM_HEDGE_AFTER_S = None
+LLM_FALLBACK_MODEL = ""
+
+# Wywołania łańcucha RAG przez ainvoke/astream w pętli zdarzeń w osobnym wątku (async_runtime.py);
+# False - synchroniczne invoke/stream w wątku skryptu Streamlit
+LLM_ASYNC = True
+# Wspólni klienci HTTP modelu czatu (jedna pula połączeń keep-alive na proces)
+LLM_HTTP_MAX_CONNECTIONS = 32   # najwięcej otwartych połączeń do dostawcy
+LLM_HTTP_KEEPALIVE_S = 90.0     # bezczynne połączenie czeka na kolejną turę bez ponownego TLS
+LLM_HTTP_CONNECT_TIMEOUT = 5.0  # nawiązanie połączenia [s]
+LLM_HTTP_READ_TIMEOUT = 60.0    # najdłuższa przerwa między fragmentami odpowiedzi [s]
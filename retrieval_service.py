@@ -0,0 +1,254 @@
+"""
+Wspólny proces wyszukiwania w bazie wiedzy dla kilku procesów Streamlit na jednej maszynie.
+
+Serwis trzyma jedną kopię modelu embeddingów i bazy wiedzy, a aplikacje łączą się
+z nim przez gniazdo Unix (RETRIEVAL_SOCKET_PATH w rag_config.py) za pomocą
+RemoteRetriever. Zapytania, które przyjdą w tym samym momencie od różnych
+uczestników, są łączone w paczkę (micro-batching): jeden embedding paczki i jedno
+mnożenie macierzy w MmapVectorStore zamiast osobnych wywołań na każde zapytanie.
+
+Protokół: jedna linia JSON na połączenie w każdą stronę.
+    {"query": "...", "k": 4}  ->  {"documents": [{"page_content": ..., "metadata": ..., "score": ...}, ...]}
+    {"stats": true}           ->  {"stats": {...}}
+
+Uruchomienie (przed procesami Streamlit):
+    python retrieval_service.py [--socket /tmp/vincent_retrieval.sock] [--max-batch 32] [--max-wait-ms 5]
+"""
+import argparse
+import asyncio
+import json
+import os
+import queue
+import socket
+import socketserver
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable
+
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+import tracing
+from rag_config import RETRIEVAL_SOCKET_PATH
+
+
+class MicroBatcher:
+    """
+    Kolejka zapytań obsługiwana przez jeden wątek. Wątek bierze pierwsze oczekujące
+    zapytanie i dobiera kolejne, które nadejdą w ciągu `max_wait` sekund (najwyżej
+    `max_batch`), a potem liczy embeddingi i wyszukuje całą paczkę naraz.
+    """
+
+    def __init__(self, embedding_model, vector_store, max_batch=32, max_wait=0.005):
+        self.embedding_model = embedding_model
+        self.vector_store = vector_store
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._metrics = {"queries": 0, "batches": 0, "max_batch_size": 0, "errors": 0, "total_batch_latency_s": 0.0}
+        self._thread = threading.Thread(target=self._run, name="retrieval-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, query, k):
+        future = Future()
+        self._queue.put((query, k, future))
+        return future
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._metrics)
+        stats["queue_depth"] = self._queue.qsize()
+        stats["mean_batch_size"] = stats["queries"] / stats["batches"] if stats["batches"] else 0.0
+        return stats
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _search(self, vectors, k):
+        if hasattr(self.vector_store, "search_batch"):
+            return self.vector_store.search_batch(vectors, k)
+        # Inne magazyny (np. FAISS z LangChain) - wyszukiwanie po kolei
+        return [self.vector_store.similarity_search_with_score_by_vector(vector, k) for vector in vectors]
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            start = time.perf_counter()
+            try:
+                vectors = self.embedding_model.embed_documents([query for query, _, _ in batch])
+                k = max(k for _, k, _ in batch)
+                results = self._search(vectors, k)
+                for (_, query_k, future), result in zip(batch, results):
+                    future.set_result(result[:query_k])
+            except Exception as e:
+                print(f"Błąd wyszukiwania paczki {len(batch)} zapytań: {e}")
+                with self._lock:
+                    self._metrics["errors"] += 1
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            latency = time.perf_counter() - start
+            tracing.record_span("retrieval_batch", latency, batch_size=len(batch))
+            with self._lock:
+                self._metrics["queries"] += len(batch)
+                self._metrics["batches"] += 1
+                self._metrics["max_batch_size"] = max(self._metrics["max_batch_size"], len(batch))
+                self._metrics["total_batch_latency_s"] += latency
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline())
+            if request.get("stats"):
+                response = {"stats": self.server.batcher.stats()}
+            else:
+                results = self.server.batcher.submit(request["query"], int(request.get("k", 4))).result(timeout=self.server.timeout_s)
+                response = {"documents": [
+                    {"page_content": doc.page_content, "metadata": doc.metadata, "score": score}
+                    for doc, score in results
+                ]}
+        except Exception as e:
+            response = {"error": f"{type(e).__name__}: {e}"}
+        self.wfile.write(json.dumps(response, ensure_ascii=False, default=str).encode("utf-8") + b"\n")
+
+
+class RetrievalServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+    # Domyślna kolejka połączeń (5) jest za mała przy wielu uczestnikach naraz
+    request_queue_size = 128
+
+    def __init__(self, socket_path, batcher, timeout_s=30.0):
+        if os.path.exists(socket_path):
+            # Gniazdo po poprzednim, zakończonym procesie
+            os.unlink(socket_path)
+        self.batcher = batcher
+        self.timeout_s = timeout_s
+        super().__init__(socket_path, _RequestHandler)
+        os.chmod(socket_path, 0o660)
+
+
+def _request(socket_path, payload, timeout):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+        conn.settimeout(timeout)
+        conn.connect(socket_path)
+        conn.sendall(json.dumps(payload, ensure_ascii=False).encode("utf-8") + b"\n")
+        chunks = []
+        while True:
+            chunk = conn.recv(65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+            if chunk.endswith(b"\n"):
+                break
+    response = json.loads(b"".join(chunks))
+    if "error" in response:
+        raise RuntimeError(f"Błąd serwisu wyszukiwania: {response['error']}")
+    return response
+
+
+async def _arequest(socket_path, payload, timeout):
+    async def exchange():
+        reader, writer = await asyncio.open_unix_connection(socket_path, limit=2 ** 24)
+        try:
+            writer.write(json.dumps(payload, ensure_ascii=False).encode("utf-8") + b"\n")
+            await writer.drain()
+            return await reader.readline()
+        finally:
+            writer.close()
+
+    response = json.loads(await asyncio.wait_for(exchange(), timeout))
+    if "error" in response:
+        raise RuntimeError(f"Błąd serwisu wyszukiwania: {response['error']}")
+    return response
+
+
+def service_stats(socket_path=RETRIEVAL_SOCKET_PATH, timeout=5.0):
+    return _request(socket_path, {"stats": True}, timeout)["stats"]
+
+
+class RemoteRetriever(BaseRetriever):
+    """Retriever LangChain, który wysyła zapytanie do retrieval_service.py zamiast liczyć je w procesie."""
+
+    socket_path: str = RETRIEVAL_SOCKET_PATH
+    k: int = 4
+    timeout: float = 30.0
+
+    def _get_relevant_documents(self, query, *, run_manager):
+        response = _request(self.socket_path, {"query": query, "k": self.k}, self.timeout)
+        return [Document(page_content=doc["page_content"], metadata=doc["metadata"]) for doc in response["documents"]]
+
+    async def _aget_relevant_documents(self, query, *, run_manager):
+        response = await _arequest(self.socket_path, {"query": query, "k": self.k}, self.timeout)
+        return [Document(page_content=doc["page_content"], metadata=doc["metadata"]) for doc in response["documents"]]
+
+
+class FallbackRetriever(BaseRetriever):
+    """
+    Pyta serwis (RemoteRetriever), a gdy nie da się z nim połączyć, wyszukuje w tym
+    procesie retrieverem z `local()`. Dostępność serwisu jest sprawdzana przy każdym
+    zapytaniu, więc serwis uruchomiony lub zrestartowany po starcie aplikacji jest
+    używany od razu, bez restartu procesu Streamlit.
+    """
+
+    remote: RemoteRetriever
+    local: Callable[[], BaseRetriever]
+
+    def _get_relevant_documents(self, query, *, run_manager):
+        try:
+            return self.remote.invoke(query, config={"callbacks": run_manager.get_child()})
+        except (OSError, asyncio.TimeoutError) as e:
+            print(f"Serwis wyszukiwania ({self.remote.socket_path}) niedostępny ({e}) - wyszukuję w tym procesie.")
+        return self.local().invoke(query, config={"callbacks": run_manager.get_child()})
+
+    async def _aget_relevant_documents(self, query, *, run_manager):
+        try:
+            return await self.remote.ainvoke(query, config={"callbacks": run_manager.get_child()})
+        except (OSError, asyncio.TimeoutError) as e:
+            print(f"Serwis wyszukiwania ({self.remote.socket_path}) niedostępny ({e}) - wyszukuję w tym procesie.")
+        return await self.local().ainvoke(query, config={"callbacks": run_manager.get_child()})
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Wspólny serwis wyszukiwania w bazie wiedzy (gniazdo Unix).")
+    parser.add_argument("--socket", default=RETRIEVAL_SOCKET_PATH or "/tmp/vincent_retrieval.sock", help="Ścieżka gniazda Unix.")
+    parser.add_argument("--max-batch", type=int, default=32, help="Maksymalna liczba zapytań w paczce.")
+    parser.add_argument("--max-wait-ms", type=float, default=5.0, help="Jak długo czekać na kolejne zapytania do paczki.")
+    args = parser.parse_args(argv)
+
+    import rag
+
+    start = time.perf_counter()
+    embedding_model = rag.load_embedding_model()
+    vector_store = rag.load_vector_store(embedding_model)
+    if vector_store is None:
+        print("Błąd: Indeks FAISS nie został znaleziony! Uruchom najpierw skrypt 'prepare_rag_data.py'.")
+        return 1
+    batcher = MicroBatcher(embedding_model, vector_store, args.max_batch, args.max_wait_ms / 1000)
+    server = RetrievalServer(args.socket, batcher)
+    print(f"Serwis wyszukiwania gotowy w {time.perf_counter() - start:.1f} s, gniazdo: {args.socket}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.unlink(args.socket)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,124 @@
+"""
+Trwały stan sesji uczestnika poza st.session_state.
+
+Po każdym przebiegu skryptu app.py zapisuje wybrane klucze st.session_state
+(PERSISTED_KEYS: etap badania, user_id, grupa, historia rozmowy, kolejność pytań,
+czas rozpoczęcia rozmowy, odpowiedzi z ankiet...) pod losowym tokenem, który
+jest też w adresie strony (parametr ?sesja=...). Po zerwaniu połączenia,
+odświeżeniu strony albo restarcie procesu nowa sesja Streamlit z tym samym
+tokenem odtwarza stan - także na innym procesie/serwerze, jeśli korzystają
+z tego samego magazynu.
+
+Magazyn wybiera zmienna VINCENT_SESSION_STORE:
+    sqlite:///data/sessions.sqlite3   - plik SQLite (domyślnie; procesy na jednej maszynie)
+    redis://host:6379/0               - Redis lub zgodny serwer (wymaga pakietu redis)
+Sesje wygasają po SESSION_TTL_S sekundach od ostatniego zapisu.
+"""
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+
+SESSION_STORE_URL = os.environ.get("VINCENT_SESSION_STORE", "sqlite:///data/sessions.sqlite3")
+SESSION_TTL_S = 24 * 60 * 60
+
+# Klucze st.session_state zapisywane w magazynie (zasoby, np. łańcuch RAG, są odtwarzane osobno)
+PERSISTED_KEYS = (
+    "page", "user_id", "group", "chat_history",
+    "shuffled_pretest_items", "shuffled_posttest_items",
+    "demographics", "pretest", "posttest", "feedback", "feedback_submitted",
+    "start_time", "saved_fields", "turn_latencies",
+    "timestamp_start_initial", "pretest_timestamp", "chat_timestamp", "posttest_timestamp", "feedback_timestamp",
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    token TEXT PRIMARY KEY,
+    payload TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sessions_updated ON sessions (updated_at);
+"""
+
+
+def new_token():
+    return secrets.token_urlsafe(16)
+
+
+def snapshot(state):
+    """Wybiera z `state` (np. st.session_state) klucze PERSISTED_KEYS. Zwraca tekst JSON."""
+    data = {key: state[key] for key in PERSISTED_KEYS if key in state}
+    return json.dumps(data, ensure_ascii=False, sort_keys=True, default=str)
+
+
+class SQLiteSessionStore:
+    """Sesje w pliku SQLite (WAL); każdy wątek korzysta z własnego połączenia, jak w outbox.py."""
+
+    def __init__(self, path, ttl_s=SESSION_TTL_S):
+        self.path = path
+        self.ttl_s = ttl_s
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        conn = self._connection()
+        conn.executescript(_SCHEMA)
+        conn.execute("DELETE FROM sessions WHERE updated_at < ?", (time.time() - ttl_s,))
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def load(self, token):
+        row = self._connection().execute(
+            "SELECT payload FROM sessions WHERE token = ? AND updated_at >= ?",
+            (token, time.time() - self.ttl_s),
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save(self, token, payload):
+        self._connection().execute(
+            "INSERT OR REPLACE INTO sessions (token, payload, updated_at) VALUES (?, ?, ?)",
+            (token, payload, time.time()),
+        )
+
+    def delete(self, token):
+        self._connection().execute("DELETE FROM sessions WHERE token = ?", (token,))
+
+
+class RedisSessionStore:
+    """Sesje w Redisie (lub serwerze zgodnym z jego protokołem), z wygasaniem po `ttl_s`."""
+
+    def __init__(self, url, ttl_s=SESSION_TTL_S, prefix="vincent:session:"):
+        try:
+            import redis
+        except ImportError:
+            raise ImportError("Magazyn sesji redis:// wymaga pakietu redis (pip install redis).")
+        self.client = redis.Redis.from_url(url)
+        self.ttl_s = ttl_s
+        self.prefix = prefix
+
+    def load(self, token):
+        payload = self.client.get(self.prefix + token)
+        return json.loads(payload) if payload else None
+
+    def save(self, token, payload):
+        self.client.set(self.prefix + token, payload, ex=int(self.ttl_s))
+
+    def delete(self, token):
+        self.client.delete(self.prefix + token)
+
+
+def open_store(url=SESSION_STORE_URL):
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisSessionStore(url)
+    if url.startswith("sqlite:///"):
+        return SQLiteSessionStore(url[len("sqlite:///"):])
+    raise ValueError(f"Nieznany magazyn sesji: {url!r} (obsługiwane: sqlite:///ścieżka, redis://...).")
@@ -0,0 +1,319 @@
+"""
+Zapis danych uczestników do Google Sheets w tle (write-behind).
+
+Ekrany aplikacji nie czekają na API arkusza: rekordy trafiają najpierw do
+lokalnego outboxa (SQLite, patrz outbox.py), a osobny wątek co `flush_interval`
+sekund scala oczekujące rekordy według user_id i zapisuje całą paczkę jednym
+`batch_update` (istniejące wiersze) i jednym `append_rows` (nowi uczestnicy). Wiersz
+uczestnika jest wyszukiwany w lokalnym indeksie (RowIndex), bez odczytów z API.
+"""
+import atexit
+import os
+import random
+import re
+import socket
+import threading
+import time
+import uuid
+
+import gspread
+from gspread.utils import rowcol_to_a1
+
+from outbox import merge_records
+import tracing
+
+
+def _cell_value(value):
+    # Tak jak wcześniej w save_to_sheets: wszystkie wartości zapisujemy jako tekst
+    return str(value)
+
+
+def _row_ranges(row_index, headers, record):
+    """
+    Zamienia rekord na listę zakresów dla `batch_update`, obejmujących tylko
+    przesłane kolumny. Sąsiednie kolumny są łączone w jeden zakres, a pozostałe
+    komórki wiersza nie są nadpisywane (nie trzeba ich wcześniej pobierać).
+    """
+    columns = sorted(headers.index(key) + 1 for key in record if key in headers)
+    ranges = []
+    run = []
+    for col in columns:
+        if run and col != run[-1] + 1:
+            ranges.append(run)
+            run = []
+        run.append(col)
+    if run:
+        ranges.append(run)
+
+    updates = []
+    for run in ranges:
+        start = rowcol_to_a1(row_index, run[0])
+        end = rowcol_to_a1(row_index, run[-1])
+        values = [_cell_value(record[headers[col - 1]]) for col in run]
+        updates.append({"range": f"{start}:{end}", "values": [values]})
+    return updates
+
+
+class RowIndex:
+    """
+    Wspólny dla procesu cache nagłówków arkusza i mapy user_id -> numer wiersza.
+
+    Wypełniany raz (odczyt nagłówków i jeden odczyt całej kolumny user_id),
+    a potem aktualizowany przy każdym dopisaniu wierszy, dzięki czemu aktualizacja
+    danych uczestnika to jedno zapytanie zapisu. Numery wierszy się nie zmieniają,
+    bo SheetsWriter nigdy nie wstawia ani nie usuwa wierszy w środku arkusza.
+    Cache jest unieważniany po nieudanym zapisie albo gdy odpowiedź na `append_rows`
+    nie zgadza się z oczekiwanym numerem wiersza (np. dopisał coś inny proces).
+    """
+
+    def __init__(self):
+        self.headers = None
+        self.rows = {}
+        self.next_row = None
+
+    @property
+    def loaded(self):
+        return self.headers is not None
+
+    def load(self, sheet):
+        self.headers = sheet.row_values(1)
+        self.rows = {}
+        user_ids_in_sheet = []
+        if "user_id" in self.headers:
+            user_ids_in_sheet = sheet.col_values(self.headers.index("user_id") + 1)
+            for row_index, user_id in enumerate(user_ids_in_sheet[1:], start=2): # +1 dla nagłówka, +1 bo lista jest 0-bazowa
+                if user_id and user_id not in self.rows:
+                    self.rows[user_id] = row_index
+        self.next_row = max(len(user_ids_in_sheet) + 1, 2)
+        print(f"Wczytano indeks wierszy arkusza: {len(self.rows)} uczestników.")
+
+    def invalidate(self):
+        self.headers = None
+        self.rows = {}
+        self.next_row = None
+
+    def record_append(self, user_ids, response):
+        """Zapamiętuje numery wierszy dopisanych przez `append_rows`."""
+        updated_range = (response or {}).get("updates", {}).get("updatedRange", "")
+        match = re.search(r"![A-Z]+(\d+)", updated_range)
+        if not match:
+            print("Nie udało się odczytać zakresu dopisanych wierszy. Indeks wierszy zostanie wczytany ponownie.")
+            self.invalidate()
+            return
+
+        start_row = int(match.group(1))
+        for offset, user_id in enumerate(user_ids):
+            self.rows[user_id] = start_row + offset
+        if start_row != self.next_row:
+            # Ktoś inny dopisał wiersze - nasze numery są poprawne, ale mapa może być niepełna
+            print(f"Oczekiwano dopisania w wierszu {self.next_row}, a dopisano w {start_row}. "
+                  "Indeks wierszy zostanie wczytany ponownie.")
+            self.invalidate()
+            return
+        self.next_row = start_row + len(user_ids)
+
+
+def _ensure_headers(sheet, current_headers, batch, columns=()):
+    """
+    Dba o to, by w pierwszym wierszu arkusza były wszystkie zadeklarowane kolumny
+    (`columns`) oraz klucze z paczki, których nie ma w schemacie.
+    Brakujące nagłówki są dopisywane na końcu pierwszego wiersza - zapisujemy
+    tylko nowe komórki nagłówka, bez czytania i przepisywania danych uczestników,
+    więc koszt nie zależy od liczby wierszy, a równoległe zapisy nie giną.
+    Zwraca aktualną listę nagłówków.
+    """
+    headers_to_add = []
+    for key in columns:
+        if key not in current_headers and key not in headers_to_add:
+            headers_to_add.append(key)
+    for record in batch.values():
+        for key in record.keys():
+            if key not in current_headers and key not in headers_to_add:
+                headers_to_add.append(key)
+
+    if not headers_to_add:
+        return list(current_headers)
+
+    first_col = len(current_headers) + 1
+    last_col = len(current_headers) + len(headers_to_add)
+    # Arkusz ma stałą liczbę kolumn; zapis poza siatką kończy się błędem API
+    if sheet.col_count < last_col:
+        sheet.add_cols(last_col - sheet.col_count)
+
+    start = rowcol_to_a1(1, first_col)
+    end = rowcol_to_a1(1, last_col)
+    sheet.batch_update([{"range": f"{start}:{end}", "values": [headers_to_add]}])
+    print(f"Nagłówki arkusza zaktualizowane. Dodano: {headers_to_add}")
+
+    # Jeśli inny proces dopisał w tym samym czasie te same nagłówki, powstaną duplikaty
+    # kolumn; headers.index() zawsze wybiera pierwsze wystąpienie, więc dane trafiają
+    # do jednej, spójnej kolumny.
+    return list(current_headers) + headers_to_add
+
+
+def write_batch(sheet, batch, columns=(), index=None):
+    """
+    Zapisuje paczkę {user_id: rekord} do arkusza.
+    Przy wczytanym indeksie wierszy kosztuje co najwyżej jeden `batch_update`
+    (istniejący uczestnicy) i jeden `append_rows` (nowi), niezależnie od liczby
+    rekordów w paczce i wierszy w arkuszu.
+    """
+    if index is None:
+        index = RowIndex()
+    if not index.loaded:
+        index.load(sheet)
+    index.headers = _ensure_headers(sheet, index.headers, batch, columns)
+    headers = index.headers
+
+    updates = []
+    updated_rows = 0
+    new_user_ids = []
+    new_rows = []
+    for user_id, record in batch.items():
+        row_index = index.rows.get(user_id)
+        if row_index is not None:
+            updates.extend(_row_ranges(row_index, headers, record))
+            updated_rows += 1
+        else:
+            new_user_ids.append(user_id)
+            new_rows.append([_cell_value(record.get(header, "")) for header in headers])
+
+    if updates:
+        sheet.batch_update(updates)
+    if new_rows:
+        response = sheet.append_rows(new_rows)
+        index.record_append(new_user_ids, response)
+    return updated_rows, len(new_rows)
+
+
+class SheetsWriter:
+    """
+    Wątek synchronizujący w tle outbox (lokalny SQLite) z Google Sheets.
+
+    `submit()` wraca natychmiast: rekord jest trwale dopisywany do outboxa,
+    a wątek co `flush_interval` sekund scala oczekujące rekordy według user_id
+    i zapisuje je do arkusza. Jeśli zapis się nie powiedzie, rekordy zostają
+    w outboxie i są ponawiane z wykładniczym odstępem (z losowym rozrzutem).
+    Zapis jest idempotentny: ponowiony rekord aktualizuje ten sam wiersz uczestnika.
+    """
+
+    def __init__(self, get_sheet, outbox, columns=(), flush_interval=2.0, max_backoff=60.0, batch_limit=500):
+        self._get_sheet = get_sheet
+        self._outbox = outbox
+        self.columns = list(columns) # zadeklarowany schemat kolumn arkusza
+        self.flush_interval = flush_interval
+        self.max_backoff = max_backoff
+        self.batch_limit = batch_limit
+
+        self._owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._index = RowIndex()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._consecutive_errors = 0
+
+        self._metrics = {
+            "records_submitted": 0,
+            "flushes": 0,
+            "flush_errors": 0,
+            "rows_updated": 0,
+            "rows_appended": 0,
+            "last_flush_latency_s": None,
+            "max_flush_latency_s": 0.0,
+            "total_flush_latency_s": 0.0,
+        }
+
+        self._thread = threading.Thread(target=self._run, name="sheets-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def submit(self, data_dict, stage="update"):
+        """Dopisuje rekord do outboxa. Nie wykonuje żadnych zapytań do API."""
+        self._outbox.put(data_dict["user_id"], stage, data_dict)
+        with self._lock:
+            self._metrics["records_submitted"] += 1
+
+    def queue_depth(self):
+        """Liczba rekordów, które czekają na zapis do arkusza."""
+        return self._outbox.pending_count()
+
+    def stats(self):
+        """Metryki kolejki i opóźnień zapisu (do logów lub panelu administracyjnego)."""
+        with self._lock:
+            stats = dict(self._metrics)
+        stats["queue_depth"] = self.queue_depth()
+        successful = stats["flushes"] - stats["flush_errors"]
+        stats["avg_flush_latency_s"] = stats["total_flush_latency_s"] / successful if successful else None
+        return stats
+
+    def flush(self):
+        """Zapisuje oczekujące rekordy z outboxa. Zwraca False, jeśli zapis się nie powiódł."""
+        with self._flush_lock:
+            # Jeśli outbox współdzieli kilka procesów, synchronizuje tylko jeden z nich
+            if not self._outbox.acquire_sync_lease(self._owner, ttl=max(30.0, self.max_backoff * 2)):
+                return True
+            pending = self._outbox.pending(limit=self.batch_limit)
+            if not pending:
+                return True
+            batch = merge_records(pending)
+
+            start = time.perf_counter()
+            try:
+                rows_updated, rows_appended = write_batch(self._get_sheet(), batch, self.columns, self._index)
+            except Exception as e:
+                if isinstance(e, gspread.exceptions.APIError):
+                    print(f"Błąd API Google Sheets: {e}")
+                else:
+                    print(f"Krytyczny błąd podczas zapisu danych do Google Sheets: {e}")
+                # Arkusz mógł zostać zmieniony - przy następnej próbie wczytaj indeks wierszy od nowa
+                self._index.invalidate()
+                tracing.record_span("sheets_flush", time.perf_counter() - start, records=len(pending),
+                                    users=len(batch), error=type(e).__name__)
+                with self._lock:
+                    self._metrics["flushes"] += 1
+                    self._metrics["flush_errors"] += 1
+                    self._consecutive_errors += 1
+                return False
+
+            self._outbox.mark_synced([record.id for record in pending])
+            latency = time.perf_counter() - start
+            tracing.record_span("sheets_flush", latency, records=len(pending), users=len(batch),
+                                rows_updated=rows_updated, rows_appended=rows_appended)
+            with self._lock:
+                self._consecutive_errors = 0
+                self._metrics["flushes"] += 1
+                self._metrics["rows_updated"] += rows_updated
+                self._metrics["rows_appended"] += rows_appended
+                self._metrics["last_flush_latency_s"] = latency
+                self._metrics["max_flush_latency_s"] = max(self._metrics["max_flush_latency_s"], latency)
+                self._metrics["total_flush_latency_s"] += latency
+            print(f"Zapisano {len(pending)} rekordów ({len(batch)} uczestników) do Google Sheets w {latency:.2f} s "
+                  f"(zaktualizowane wiersze: {rows_updated}, nowe wiersze: {rows_appended}).")
+            return True
+
+    def close(self):
+        """Zatrzymuje wątek i próbuje zapisać to, co zostało w outboxie."""
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout=self.flush_interval + 1)
+        try:
+            self.flush()
+        except Exception as e:
+            # Rekordy zostają w outboxie i zostaną zapisane po ponownym uruchomieniu
+            print(f"Nie udało się zapisać outboxa przy zamykaniu: {e}")
+
+    def _next_delay(self):
+        with self._lock:
+            errors = self._consecutive_errors
+        if not errors:
+            return self.flush_interval
+        backoff = min(self.max_backoff, self.flush_interval * 2 ** errors)
+        return backoff * random.uniform(0.5, 1.0)
+
+    def _run(self):
+        while not self._stop.wait(self._next_delay()):
+            try:
+                self.flush()
+            except Exception as e:
+                # Np. chwilowo zablokowany plik SQLite - spróbujemy przy następnym cyklu
+                print(f"Błąd synchronizacji outboxa: {e}")
@@ -0,0 +1,8 @@
+import os
+import sys
+import tempfile
+
+# Moduły aplikacji leżą w katalogu głównym repozytorium
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Ślady z testów nie trafiają do data/traces.jsonl (tracing czyta zmienną przy imporcie)
+os.environ.setdefault("VINCENT_TRACE_PATH", os.path.join(tempfile.mkdtemp(prefix="vincent_tests_"), "traces.jsonl"))
@@ -0,0 +1,63 @@
+"""Budżet tokenów kontekstu promptu (context_budget.py)."""
+from langchain_core.documents import Document
+
+from context_budget import MESSAGE_OVERHEAD_TOKENS, count_tokens, select_documents, select_history
+
+
+def message(role, words):
+    return {"role": role, "content": " ".join(["tak"] * words)}
+
+
+def test_count_tokens_estimate():
+    assert count_tokens("") == 0
+    assert count_tokens("Ala ma kota.") == 4
+    assert count_tokens("przeciwdziałanie") == 4  # 16 znaków - jeden token na 4 znaki
+
+
+def test_select_history_keeps_first_bot_message_and_newest():
+    history = [message("assistant", 10), message("user", 10), message("assistant", 10), message("user", 5)]
+    history[-1]["content"] = "ostatnie pytanie"
+    cost = 10 + MESSAGE_OVERHEAD_TOKENS
+
+    chosen, stats = select_history(history, "ostatnie pytanie", budget=2 * cost)
+    # Bieżąca wiadomość użytkownika nie jest częścią historii
+    assert chosen == [history[0], history[2]]
+    assert stats == {"history_tokens": 2 * cost, "history_tokens_saved": cost}
+
+    chosen, _ = select_history(history, "inne pytanie", budget=10_000)
+    assert chosen == history
+
+
+def test_select_history_stops_at_first_message_over_budget():
+    history = [message("assistant", 2), message("user", 2), message("assistant", 50), message("user", 2)]
+    chosen, _ = select_history(history, "", budget=30)
+    # Starszych wiadomości nie dobiera się ponad tę, która się nie zmieściła
+    assert chosen == [history[0], history[3]]
+
+
+def test_select_documents_skips_overlapping_chunks():
+    text = "Sen jest ważny dla zdrowia psychicznego. Regularne pory snu pomagają zasnąć."
+    docs = [
+        Document(page_content=text, metadata={"page": 1}),
+        Document(page_content=text + " Warto też ograniczyć kofeinę.", metadata={"page": 2}),
+        Document(page_content="Aktywność fizyczna poprawia nastrój.", metadata={"page": 3}),
+    ]
+    selected, stats = select_documents("sen", docs, budget=1000, max_chunk_tokens=1000)
+    assert [doc.metadata["page"] for doc in selected] == [1, 3]
+    assert stats["context_duplicates"] == 1
+    assert stats["context_documents"] == 2
+    assert stats["context_tokens"] == count_tokens(docs[0].page_content) + count_tokens(docs[2].page_content)
+
+
+def test_select_documents_trims_to_relevant_sentences_within_budget():
+    doc = Document(
+        page_content="Pogoda dziś jest ładna. Trudności ze snem często mijają same. Kawa smakuje dobrze.",
+        metadata={"page": 7},
+    )
+    other = Document(page_content="Ćwiczenia oddechowe pomagają się uspokoić.", metadata={"page": 8})
+    budget = count_tokens("Trudności ze snem często mijają same.")
+    selected, stats = select_documents("snem trudności", [doc, other], budget=budget, max_chunk_tokens=100)
+    assert [d.page_content for d in selected] == ["Trudności ze snem często mijają same."]
+    assert selected[0].metadata == {"page": 7}
+    assert stats["context_tokens"] == budget
+    assert stats["context_tokens_saved"] == count_tokens(doc.page_content) + count_tokens(other.page_content) - budget
@@ -0,0 +1,155 @@
+"""Kolejka LLMGovernor (llm_governor.py) - bez wywołań modelu."""
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import tracing
+from llm_governor import GovernorTimeout, LLMGovernor
+
+
+def wait_for_queue(governor, depth, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while governor.stats()["queue_depth"] != depth:
+        assert time.monotonic() < deadline, "kolejka nie osiągnęła oczekiwanej długości"
+        time.sleep(0.005)
+
+
+def test_waiters_are_admitted_in_fifo_order():
+    governor = LLMGovernor(rate_per_s=1000, burst=1000, max_in_flight=1, queue_timeout=5.0)
+    admitted = []
+
+    def call(n):
+        with governor.slot():
+            admitted.append(n)
+
+    governor.acquire()
+    threads = []
+    for n in range(5):
+        thread = threading.Thread(target=call, args=(n,))
+        thread.start()
+        threads.append(thread)
+        wait_for_queue(governor, n + 1)
+    governor.release()
+    for thread in threads:
+        thread.join(2.0)
+    assert admitted == [0, 1, 2, 3, 4]
+    stats = governor.stats()
+    assert stats["calls"] == 6 and stats["queued"] == 5
+    assert stats["in_flight"] == 0 and stats["queue_depth"] == 0
+
+
+def test_sync_waiter_times_out_and_leaves_queue():
+    governor = LLMGovernor(rate_per_s=1000, burst=1000, max_in_flight=1, queue_timeout=0.1)
+    governor.acquire()
+    start = time.monotonic()
+    with pytest.raises(GovernorTimeout):
+        governor.acquire()
+    assert 0.1 <= time.monotonic() - start < 1.0
+    stats = governor.stats()
+    assert stats["queue_timeouts"] == 1 and stats["queue_depth"] == 0 and stats["in_flight"] == 1
+    governor.release()
+
+
+def test_release_frees_slot_for_next_waiter():
+    governor = LLMGovernor(rate_per_s=1000, burst=1000, max_in_flight=2, queue_timeout=5.0)
+    governor.acquire()
+    governor.acquire()
+    waiter = threading.Thread(target=governor.acquire)
+    waiter.start()
+    wait_for_queue(governor, 1)
+    assert governor.stats()["in_flight"] == 2
+    governor.release()
+    waiter.join(2.0)
+    assert not waiter.is_alive()
+    assert governor.stats()["in_flight"] == 2 and governor.stats()["queue_depth"] == 0
+    # Wyjątek w slocie też zwalnia miejsce
+    governor.release()
+    with pytest.raises(RuntimeError):
+        with governor.slot():
+            raise RuntimeError("błąd wywołania")
+    governor.release()
+    assert governor.stats()["in_flight"] == 0
+
+
+def test_token_bucket_limits_rate():
+    governor = LLMGovernor(rate_per_s=20, burst=1, max_in_flight=10, queue_timeout=5.0)
+    start = time.monotonic()
+    for _ in range(4):
+        with governor.slot():
+            pass
+    # Pierwsze wywołanie z zapasu, kolejne trzy co 1/20 s
+    assert time.monotonic() - start >= 0.14
+
+
+def test_stats_use_tracing_percentile():
+    governor = LLMGovernor(rate_per_s=20, burst=1, max_in_flight=10, queue_timeout=5.0)
+    assert governor.stats()["queue_wait_p50_s"] == 0.0
+    for _ in range(5):
+        with governor.slot():
+            pass
+    waits = list(governor._waits)
+    stats = governor.stats()
+    assert stats["queue_wait_p50_s"] == tracing.percentile(waits, 0.50)
+    assert stats["queue_wait_p95_s"] == tracing.percentile(waits, 0.95)
+
+
+def test_async_waiters_do_not_hold_executor_threads():
+    # Więcej czekających wywołań niż wątków domyślnej puli pętli: wpuszczone wywołania
+    # muszą móc wykonać w tej puli swoje synchroniczne callbacki (jak LangChain)
+    governor = LLMGovernor(rate_per_s=1000, burst=1000, max_in_flight=2, queue_timeout=5.0)
+
+    async def call():
+        async with governor.aslot():
+            for _ in range(3):
+                await asyncio.get_running_loop().run_in_executor(None, time.sleep, 0.05)
+
+    async def main():
+        asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=4))
+        start = time.monotonic()
+        await asyncio.wait_for(asyncio.gather(*(call() for _ in range(6))), 4.0)
+        return time.monotonic() - start
+
+    elapsed = asyncio.run(main())
+    assert elapsed < 2.0
+    stats = governor.stats()
+    assert stats["calls"] == 6 and stats["queue_timeouts"] == 0
+    assert stats["in_flight"] == 0 and stats["queue_depth"] == 0
+
+
+def test_cancelled_async_waiter_leaves_queue():
+    governor = LLMGovernor(rate_per_s=1000, burst=1000, max_in_flight=1, queue_timeout=5.0)
+
+    async def main():
+        governor.acquire()
+        waiter = asyncio.ensure_future(governor.aacquire())
+        await asyncio.sleep(0.05)
+        assert governor.stats()["queue_depth"] == 1
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        governor.release()
+        # Miejsce nie przepadło razem z anulowanym wywołaniem
+        await asyncio.wait_for(governor.aacquire(), 1.0)
+        governor.release()
+
+    asyncio.run(main())
+    stats = governor.stats()
+    assert stats["in_flight"] == 0 and stats["queue_depth"] == 0
+
+
+def test_async_waiter_times_out():
+    governor = LLMGovernor(rate_per_s=1000, burst=1000, max_in_flight=1, queue_timeout=0.1)
+    governor.acquire()
+
+    async def main():
+        try:
+            await governor.aacquire()
+        except GovernorTimeout:
+            return True
+        return False
+
+    assert asyncio.run(main())
+    governor.release()
+    assert governor.stats()["queue_depth"] == 0
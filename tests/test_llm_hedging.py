@@ -0,0 +1,27 @@
+"""Zapytania zabezpieczające (llm_hedging.py) są domyślnie wyłączone."""
+import pytest
+
+pytest.importorskip("langchain_openai")
+
+import rag_config
+from llm_hedging import HedgedChatOpenAI
+
+
+def make_chat(**kwargs):
+    return HedgedChatOpenAI(model="test-model", api_key="test", base_url="http://127.0.0.1:9", **kwargs)
+
+
+def test_hedging_disabled_by_default():
+    assert rag_config.LLM_HEDGE_AFTER_S is None
+    assert not make_chat().hedging
+    assert not make_chat(hedge_after_s=rag_config.LLM_HEDGE_AFTER_S).hedging
+    assert not make_chat(hedge_after_s=0.0).hedging
+
+
+def test_hedging_enabled_with_threshold():
+    chat = make_chat(hedge_after_s=6.0, fallback_model_name="fallback-model")
+    assert chat.hedging
+    # Oba wywołania wyścigu same już nie zabezpieczają
+    assert not chat._primary_model().hedging
+    hedge = chat._hedge_model()
+    assert not hedge.hedging and hedge.model_name == "fallback-model"
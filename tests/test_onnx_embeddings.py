@@ -0,0 +1,40 @@
+"""
+Zgodność embeddingów ONNX (int8) z modelem PyTorch, którym zbudowano indeks.
+Pomijany, jeśli nie ma wyeksportowanego modelu (python onnx_embeddings.py export)
+albo modelu PyTorch (langchain-huggingface, sentence-transformers).
+"""
+import pytest
+
+from rag_config import EMBEDDING_MODEL_NAME, ONNX_MODEL_PATH
+
+# Stały zestaw: wiadomości uczestników, odpowiedzi Vincenta i zdania w stylu bazy wiedzy
+SENTENCES = [
+    "Mnie też czasem coś nie wychodzi i wtedy jestem na siebie zła.",
+    "Staram się pamiętać, że porażka nie przekreśla całego wysiłku.",
+    "Co konkretnie poszło dziś nie tak?",
+    "Może warto porozmawiać o tym z kimś bliskim?",
+    "Myślę, że każdy ma prawo do błędów.",
+    "Jak radzić sobie z porażką i krytyką wobec siebie?",
+    "Cześć, jestem Vincent – dziś mam wrażenie, że po prostu nie jestem wystarczająco dobry.",
+    "Nie umiem jeszcze zrozumieć, jak zaakceptować, że coś się nie udało.",
+    "ok",
+    "Self-compassion means treating yourself with the same kindness you would offer a good friend.",
+    "Mindfulness allows us to hold painful thoughts and feelings in balanced awareness.",
+    "Common humanity recognizes that suffering and personal inadequacy are part of the shared human experience.",
+]
+
+
+def test_onnx_matches_pytorch_embeddings():
+    onnx_embeddings = pytest.importorskip("onnx_embeddings")
+    if not onnx_embeddings.onnx_model_exists(ONNX_MODEL_PATH):
+        pytest.skip(f"Brak modelu ONNX w {ONNX_MODEL_PATH} - uruchom 'python onnx_embeddings.py export'.")
+    huggingface = pytest.importorskip("langchain_huggingface")
+
+    reference = huggingface.HuggingFaceEmbeddings(
+        model_name=EMBEDDING_MODEL_NAME, model_kwargs={"device": "cpu"}
+    ).embed_documents(SENTENCES)
+    candidate = onnx_embeddings.OnnxMiniLMEmbeddings(ONNX_MODEL_PATH).embed_array(SENTENCES)
+
+    cosines = onnx_embeddings.cosine_agreement(reference, candidate)
+    worst = int(cosines.argmin())
+    assert cosines[worst] >= onnx_embeddings.MIN_COSINE, f"{cosines[worst]:.4f} dla {SENTENCES[worst]!r}"
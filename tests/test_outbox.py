@@ -0,0 +1,43 @@
+"""Outbox w SQLite (outbox.py): scalanie rekordów i dzierżawa synchronizacji."""
+import time
+
+import pytest
+
+from outbox import Outbox, OutboxRecord, merge_records
+
+
+@pytest.fixture
+def outbox(tmp_path):
+    return Outbox(str(tmp_path / "outbox.sqlite3"))
+
+
+def test_merge_records_newer_values_win():
+    records = [
+        OutboxRecord(1, "u1", "start", {"group": 1, "status": "start"}),
+        OutboxRecord(2, "u2", "start", {"group": 2}),
+        OutboxRecord(3, "u1", "koniec", {"status": "koniec"}),
+    ]
+    assert merge_records(records) == {
+        "u1": {"user_id": "u1", "group": 1, "status": "koniec"},
+        "u2": {"user_id": "u2", "group": 2},
+    }
+
+
+def test_pending_records_are_merged_in_write_order(outbox):
+    first = outbox.put("u1", "start", {"status": "start"})
+    outbox.put("u1", "pretest", {"status": "pretest", "age": 30})
+    outbox.mark_synced([first])
+    assert [record.stage for record in outbox.pending()] == ["pretest"]
+    assert merge_records(outbox.all_records()) == {"u1": {"user_id": "u1", "status": "pretest", "age": 30}}
+    assert outbox.stats() == {"records": 2, "pending_records": 1, "users": 1, "pending_users": 1}
+
+
+def test_sync_lease_has_one_owner_until_it_expires(tmp_path):
+    path = str(tmp_path / "outbox.sqlite3")
+    first, second = Outbox(path), Outbox(path)  # dwa procesy współdzielące plik
+    assert first.acquire_sync_lease("proces-1", ttl=0.2)
+    assert not second.acquire_sync_lease("proces-2", ttl=0.2)
+    assert first.acquire_sync_lease("proces-1", ttl=0.2)  # właściciel przedłuża dzierżawę
+    time.sleep(0.3)
+    assert second.acquire_sync_lease("proces-2", ttl=0.2)
+    assert not first.acquire_sync_lease("proces-1", ttl=0.2)
@@ -0,0 +1,44 @@
+"""Budowanie bazy wiedzy (prepare_rag_data.py) nie nadpisuje indeksu aplikacji."""
+import json
+import os
+
+import numpy as np
+import pytest
+
+import prepare_rag_data
+from rag_config import FAISS_INDEX_PATH, VECTOR_STORE_PATH
+from vector_store import write_store
+
+
+def test_default_outputs_are_not_the_app_index():
+    outputs = {os.path.normpath(prepare_rag_data.BUILD_INDEX_PATH), os.path.normpath(prepare_rag_data.BUILD_STORE_PATH)}
+    assert not outputs & {os.path.normpath(FAISS_INDEX_PATH), os.path.normpath(VECTOR_STORE_PATH)}
+
+
+def test_refuses_to_overwrite_index_without_manifest(tmp_path):
+    index_path = tmp_path / "faiss"
+    index_path.mkdir()
+    (index_path / "index.pkl").write_bytes(b"kuratorowany indeks")
+    with pytest.raises(FileExistsError):
+        prepare_rag_data.build([], index_path=str(index_path), store_path=str(tmp_path / "store"),
+                               cache_dir=str(tmp_path / "cache"))
+    assert (index_path / "index.pkl").read_bytes() == b"kuratorowany indeks"
+
+
+def test_refuses_to_overwrite_converted_store(tmp_path):
+    store_path = str(tmp_path / "store")
+    write_store(store_path, ["a"], [{}], np.zeros((1, 4), dtype=np.float32))
+    with pytest.raises(FileExistsError):
+        prepare_rag_data.check_overwrite(str(tmp_path / "faiss"), store_path)
+    # Baza zbudowana wcześniej przez skrypt (z manifestem) może być przebudowana
+    with open(os.path.join(store_path, prepare_rag_data.MANIFEST_NAME), "w", encoding="utf-8") as f:
+        json.dump({}, f)
+    prepare_rag_data.check_overwrite(str(tmp_path / "faiss"), store_path)
+
+
+def test_main_reports_refusal(tmp_path, capsys):
+    index_path = tmp_path / "faiss"
+    index_path.mkdir()
+    (index_path / "index.pkl").write_bytes(b"")
+    assert prepare_rag_data.main(["--index-path", str(index_path), "--store-path", str(tmp_path / "store")]) == 1
+    assert "--force" in capsys.readouterr().out
@@ -0,0 +1,48 @@
+"""
+Układ "legacy" (domyślny PROMPT_LAYOUT) musi dawać dokładnie ten prompt odpowiedzi, którego
+używano od początku badania. fixtures/baseline_answering_prompt.json to wiadomości wyrenderowane
+promptem z pierwotnego app.py (setup_rag_system) dla trzech wariantów płci.
+"""
+import json
+import os
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.prompts import ChatPromptTemplate
+
+import rag
+from rag_config import PROMPT_LAYOUT
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "fixtures", "baseline_answering_prompt.json")
+INPUTS = {
+    "context": "Fragment bazy wiedzy.",
+    "input": "Ostatnio nic mi nie wychodzi.",
+    "chat_history": [AIMessage(content="Cześć, jestem Vincent."), HumanMessage(content="Hej")],
+}
+
+
+def render(variant, layout):
+    prompt = ChatPromptTemplate.from_messages(rag.answering_prompt_messages(variant, layout))
+    return [{"type": message.type, "content": message.content} for message in prompt.format_messages(**INPUTS)]
+
+
+def load_baseline():
+    with open(BASELINE_PATH, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def test_default_layout_is_legacy():
+    assert PROMPT_LAYOUT == "legacy"
+
+
+@pytest.mark.parametrize("variant", sorted(rag.GENDER_INSTRUCTIONS))
+def test_legacy_layout_matches_baseline_prompt(variant):
+    assert render(variant, "legacy") == load_baseline()[variant]
+
+
+@pytest.mark.parametrize("variant", sorted(rag.GENDER_INSTRUCTIONS))
+def test_prefix_cache_layout_keeps_inputs(variant):
+    messages = render(variant, "prefix_cache")
+    assert messages[0]["type"] == "system" and rag.GENDER_INSTRUCTIONS[variant] in messages[0]["content"]
+    assert [message["content"] for message in messages[1:3]] == ["Cześć, jestem Vincent.", "Hej"]
+    assert INPUTS["context"] in messages[-1]["content"] and INPUTS["input"] in messages[-1]["content"]
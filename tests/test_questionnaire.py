@@ -0,0 +1,67 @@
+"""Definicje ankiet (questionnaire.py): pola arkusza i sprawdzanie odpowiedzi."""
+from questionnaire import (
+    PLACEHOLDER, POSTTEST_SECTIONS, PRETEST_SECTIONS, columns, flatten, question_order, validate,
+)
+
+
+def complete_answers(sections):
+    answers = {}
+    for section in sections:
+        values = answers.setdefault(section.key, {})
+        for question in section.questions:
+            if question.kind == "select":
+                values[question.key] = question.options[1]
+            elif question.kind == "number":
+                values[question.key] = 30
+            else:
+                values[question.key] = 3
+    return answers
+
+
+def test_flatten_uses_stage_prefix_except_demographics():
+    answers = complete_answers(PRETEST_SECTIONS)
+    answers["self_compassion"]["SCS_item_3"] = 5
+    fields = flatten(PRETEST_SECTIONS, answers, "pre")
+    assert fields["demographics_age"] == 30
+    assert fields["demographics_gender"] == "Kobieta"
+    assert fields["pre_panas_Spokojny/a"] == 3
+    assert fields["pre_self_compassion_SCS_item_3"] == 5
+    assert fields["pre_ai_attitude_ai_1"] == 3
+    # Te same kolumny i w tej samej kolejności co schemat arkusza
+    assert list(fields) == columns(PRETEST_SECTIONS, "pre")
+
+
+def test_flatten_skips_unanswered_questions():
+    fields = flatten(POSTTEST_SECTIONS, {"panas": {"Spokojny/a": 4, "nieznane": 1}}, "post")
+    assert fields == {"post_panas_Spokojny/a": 4}
+
+
+def test_validate_accepts_complete_answers():
+    assert validate(PRETEST_SECTIONS, complete_answers(PRETEST_SECTIONS)) is None
+    assert validate(POSTTEST_SECTIONS, complete_answers(POSTTEST_SECTIONS)) is None
+
+
+def test_validate_reports_first_incomplete_section():
+    answers = complete_answers(PRETEST_SECTIONS)
+    answers["panas"]["Spokojny/a"] = None
+    answers["ai_attitude"].pop("ai_1")
+    assert validate(PRETEST_SECTIONS, answers) == "Proszę wypełnić wszystkie pytania dotyczące samopoczucia."
+    assert validate(PRETEST_SECTIONS[2:], answers) == "Proszę wypełnić wszystkie pytania dotyczące postawy wobec AI."
+
+
+def test_validate_demographics_rules():
+    missing = "Proszę wypełnić wszystkie pola danych demograficznych."
+    for key, value in (("gender", PLACEHOLDER), ("education", PLACEHOLDER), ("age", 0), ("age", 100), ("age", None)):
+        answers = complete_answers(PRETEST_SECTIONS)
+        answers["demographics"][key] = value
+        assert validate(PRETEST_SECTIONS, answers) == missing, (key, value)
+
+
+def test_question_order_is_saved_for_shuffled_sections():
+    panas, ai_attitude = PRETEST_SECTIONS[1], PRETEST_SECTIONS[3]
+    saved = {}
+    order = question_order(panas, saved)
+    assert sorted(order) == sorted(question.key for question in panas.questions)
+    assert question_order(panas, saved) == order == saved["panas"]
+    assert question_order(ai_attitude, saved) == [question.key for question in ai_attitude.questions]
+    assert "ai_attitude" not in saved
@@ -0,0 +1,91 @@
+"""Zapis paczek do arkusza (sheets_writer.py) na atrapie arkusza z devtools/fake_sheets.py."""
+import pytest
+
+pytest.importorskip("gspread")
+
+from devtools.fake_sheets import FakeWorksheet
+from sheets_writer import RowIndex, _row_ranges, write_batch
+
+COLUMNS = ["user_id", "group", "status", "age"]
+
+
+def make_sheet():
+    return FakeWorksheet(latency_s=0, jitter_s=0, quota_per_minute=0)
+
+
+def test_row_ranges_merge_adjacent_columns():
+    headers = ["user_id", "group", "status", "age", "comment"]
+    record = {"group": 1, "status": "ok", "comment": "x", "unknown": "pominięte"}
+    assert _row_ranges(7, headers, record) == [
+        {"range": "B7:C7", "values": [["1", "ok"]]},
+        {"range": "E7:E7", "values": [["x"]]},
+    ]
+
+
+def test_write_batch_appends_new_users_with_declared_columns():
+    sheet = make_sheet()
+    batch = {"u1": {"user_id": "u1", "group": 2}, "u2": {"user_id": "u2", "status": "start"}}
+    assert write_batch(sheet, batch, COLUMNS) == (0, 2)
+    assert sheet.row_values(1) == COLUMNS
+    assert sheet.records() == {
+        "u1": {"user_id": "u1", "group": "2", "status": "", "age": ""},
+        "u2": {"user_id": "u2", "group": "", "status": "start", "age": ""},
+    }
+
+
+def test_write_batch_updates_only_sent_fields():
+    sheet = make_sheet()
+    write_batch(sheet, {"u1": {"user_id": "u1", "group": 1, "status": "start"}}, COLUMNS)
+    # Nowe wywołanie bez indeksu - wiersz uczestnika znajduje się po kolumnie user_id
+    assert write_batch(sheet, {"u1": {"user_id": "u1", "status": "koniec", "extra": "x"}}, COLUMNS) == (1, 0)
+    assert sheet.row_values(1) == COLUMNS + ["extra"]
+    assert sheet.records()["u1"] == {"user_id": "u1", "group": "1", "status": "koniec", "age": "", "extra": "x"}
+    assert len(sheet.records()) == 1
+
+
+def test_record_append_tracks_rows():
+    index = RowIndex()
+    index.headers, index.next_row = list(COLUMNS), 5
+    index.record_append(["u1", "u2"], {"updates": {"updatedRange": "Arkusz1!A5:D6"}})
+    assert index.loaded
+    assert index.rows == {"u1": 5, "u2": 6}
+    assert index.next_row == 7
+
+
+@pytest.mark.parametrize("response", [
+    {"updates": {"updatedRange": "Arkusz1!A8:D8"}},  # dopisał ktoś inny
+    {"updates": {}},
+    None,
+])
+def test_record_append_invalidates_on_unexpected_response(response):
+    index = RowIndex()
+    index.headers, index.next_row = list(COLUMNS), 5
+    index.record_append(["u1"], response)
+    assert not index.loaded
+    assert index.rows == {} and index.next_row is None
+
+
+def test_write_batch_reuses_shared_index():
+    sheet = make_sheet()
+    index = RowIndex()
+    write_batch(sheet, {"u1": {"user_id": "u1"}}, COLUMNS, index=index)
+    write_batch(sheet, {"u2": {"user_id": "u2"}}, COLUMNS, index=index)
+    assert write_batch(sheet, {"u1": {"status": "koniec"}, "u2": {"age": 30}}, COLUMNS, index=index) == (2, 0)
+    assert index.rows == {"u1": 2, "u2": 3}
+    # Arkusz czytany tylko przy pierwszym wczytaniu indeksu, potem same zapisy
+    assert sheet.stats["calls"]["row_values"] == 1
+    assert "col_values" not in sheet.stats["calls"]
+    assert sheet.records()["u1"]["status"] == "koniec"
+    assert sheet.records()["u2"]["age"] == "30"
+
+
+def test_write_batch_reloads_index_after_foreign_append():
+    sheet = make_sheet()
+    index = RowIndex()
+    write_batch(sheet, {"u1": {"user_id": "u1"}}, COLUMNS, index=index)
+    sheet.append_rows([["obcy", "", "", ""]])  # inny proces dopisuje wiersz
+    write_batch(sheet, {"u2": {"user_id": "u2"}}, COLUMNS, index=index)
+    assert not index.loaded
+    assert write_batch(sheet, {"u2": {"status": "start"}}, COLUMNS, index=index) == (1, 0)
+    assert index.rows == {"u1": 2, "obcy": 3, "u2": 4}
+    assert len(sheet.records()) == 3
@@ -0,0 +1,70 @@
+"""Baza wiedzy mapowana do pamięci (vector_store.py) w porównaniu z wyszukiwaniem brute-force L2."""
+import numpy as np
+import pytest
+
+from vector_store import MmapVectorStore, write_store
+
+DIM = 16
+
+
+class TableEmbeddings:
+    """Embeddingi z tabeli: zapytanie to numer wiersza w macierzy zapytań."""
+
+    def __init__(self, queries):
+        self.queries = queries
+
+    def embed_query(self, text):
+        return self.queries[int(text)].tolist()
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(200, DIM)).astype(np.float32)
+    texts = [f"Fragment {i} – zażółć gęślą jaźń" for i in range(len(vectors))]
+    metadatas = [{"source": f"plik{i % 3}.pdf", "page": i} if i % 5 else {"source": "notatki"} for i in range(len(vectors))]
+    write_store(str(tmp_path), texts, metadatas, vectors)
+    return str(tmp_path), texts, metadatas, vectors
+
+
+def brute_force(vectors, query, k):
+    distances = ((vectors - query) ** 2).sum(axis=1)
+    order = np.argsort(distances, kind="stable")[:k]
+    return order, distances[order]
+
+
+def test_similarity_search_matches_brute_force_l2(corpus):
+    path, texts, metadatas, vectors = corpus
+    queries = np.random.default_rng(1).normal(size=(10, DIM)).astype(np.float32)
+    store = MmapVectorStore.load(path, TableEmbeddings(queries))
+    assert len(store) == len(vectors)
+    for q, query in enumerate(queries):
+        expected, expected_distances = brute_force(vectors, query, k=5)
+        results = store.similarity_search_with_score(str(q), k=5)
+        assert [doc.page_content for doc, _ in results] == [texts[i] for i in expected]
+        assert [doc.metadata for doc, _ in results] == [metadatas[i] for i in expected]
+        np.testing.assert_allclose([score for _, score in results], expected_distances, rtol=1e-4, atol=1e-4)
+        assert [doc.page_content for doc in store.similarity_search(str(q), k=5)] == [texts[i] for i in expected]
+
+
+def test_search_batch_matches_single_queries(corpus):
+    path, _, _, vectors = corpus
+    queries = vectors[[3, 50, 199]] + 0.01
+    store = MmapVectorStore.load(path, TableEmbeddings(queries))
+    batch = store.search_batch(queries, k=3)
+    assert [results[0][0].page_content for results in batch] == [
+        "Fragment 3 – zażółć gęślą jaźń", "Fragment 50 – zażółć gęślą jaźń", "Fragment 199 – zażółć gęślą jaźń",
+    ]
+    for q, results in enumerate(batch):
+        single = store.similarity_search_with_score(str(q), k=3)
+        assert [doc for doc, _ in results] == [doc for doc, _ in single]
+        np.testing.assert_allclose([score for _, score in results], [score for _, score in single], rtol=1e-4, atol=1e-4)
+
+
+def test_k_larger_than_store(tmp_path):
+    write_store(str(tmp_path), ["a", "b"], [{}, {}], np.eye(2, DIM, dtype=np.float32))
+    store = MmapVectorStore.load(str(tmp_path), TableEmbeddings(np.zeros((1, DIM), dtype=np.float32)))
+    assert [doc.page_content for doc in store.similarity_search("0", k=10)] == ["a", "b"]
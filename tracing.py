@@ -0,0 +1,138 @@
+"""
+Lekkie śledzenie czasu etapów tury rozmowy i zapisu danych.
+
+Każdy pomiar (span) to jedna linia JSON w rotowanym pliku TRACE_PATH:
+    {"ts": ..., "span": "llm_answer", "duration_ms": 812.4, "user_id": ..., "group": ..., ...}
+
+Źródła pomiarów:
+- rag.TracingCallbackHandler - callbacki LangChain: przepisanie zapytania (llm_rewrite),
+  wyszukiwanie w bazie wiedzy (retrieval), generowanie odpowiedzi (llm_answer)
+  wraz z liczbą tokenów,
+- rag.TracedEmbeddings - embedding zapytania (embed_query),
+- span() - dowolny blok kodu, np. get_sheet, save_to_sheets, zapis paczki do arkusza.
+
+Moduł korzysta tylko z biblioteki standardowej, więc można go importować bez
+ładowania LangChain (np. na ekranach ankiet).
+
+Identyfikator uczestnika i grupa są dołączane z kontekstu ustawionego przez trace_context().
+"""
+import contextvars
+import glob
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+from logging.handlers import RotatingFileHandler
+
+TRACE_PATH = os.environ.get("VINCENT_TRACE_PATH", "data/traces.jsonl")
+TRACE_MAX_BYTES = 10 * 1024 * 1024
+TRACE_BACKUP_COUNT = 5
+
+_context = contextvars.ContextVar("trace_context", default={})
+_logger = None
+
+
+def _get_logger():
+    global _logger
+    if _logger is None:
+        logger = logging.getLogger("vincent.trace")
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+        if not logger.handlers:
+            directory = os.path.dirname(TRACE_PATH)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            handler = RotatingFileHandler(TRACE_PATH, maxBytes=TRACE_MAX_BYTES, backupCount=TRACE_BACKUP_COUNT, encoding="utf-8")
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            logger.addHandler(handler)
+        _logger = logger
+    return _logger
+
+
+@contextmanager
+def trace_context(**attrs):
+    """Dołącza atrybuty (np. user_id, group) do wszystkich pomiarów w tym bloku."""
+    token = _context.set({**_context.get(), **attrs})
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+
+def record_span(name, duration_s, **attrs):
+    """Zapisuje jeden pomiar do pliku śladów."""
+    record = {"ts": time.time(), "span": name, "duration_ms": round(duration_s * 1000, 2), **_context.get(), **attrs}
+    try:
+        _get_logger().info(json.dumps(record, ensure_ascii=False, default=str))
+    except Exception as e:
+        # Śledzenie nie może przerwać badania
+        print(f"Nie udało się zapisać pomiaru {name}: {e}")
+
+
+@contextmanager
+def span(name, **attrs):
+    """
+    Mierzy czas bloku kodu. Zwraca słownik, do którego można dopisać atrybuty pomiaru.
+    Wyjątek jest odnotowywany w atrybucie "error" i przekazywany dalej.
+    """
+    extra = dict(attrs)
+    start = time.perf_counter()
+    try:
+        yield extra
+    except BaseException as e:
+        extra["error"] = type(e).__name__
+        raise
+    finally:
+        record_span(name, time.perf_counter() - start, **extra)
+
+
+def percentile(values, q):
+    """Kwantyl `q` (0-1) z interpolacją liniową; None dla pustej listy. Wspólny dla raportów i benchmarków."""
+    sorted_values = sorted(values)
+    if not sorted_values:
+        return None
+    position = q * (len(sorted_values) - 1)
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def load_spans(window_s, path=TRACE_PATH):
+    """Wczytuje pomiary z ostatnich `window_s` sekund (z pliku bieżącego i rotowanych)."""
+    since = time.time() - window_s
+    spans = []
+    for file_path in sorted(glob.glob(path + "*")):
+        if os.path.getmtime(file_path) < since:
+            continue
+        with open(file_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if record.get("ts", 0) >= since:
+                    spans.append(record)
+    return spans
+
+
+def summarize(spans):
+    """Zwraca listę {span, count, p50_ms, p95_ms, p99_ms, mean_ms, errors} posortowaną po nazwie."""
+    by_name = {}
+    for record in spans:
+        by_name.setdefault(record["span"], []).append(record)
+
+    summary = []
+    for name in sorted(by_name):
+        records = by_name[name]
+        durations = sorted(r["duration_ms"] for r in records)
+        summary.append({
+            "span": name,
+            "count": len(records),
+            "p50_ms": percentile(durations, 0.50),
+            "p95_ms": percentile(durations, 0.95),
+            "p99_ms": percentile(durations, 0.99),
+            "mean_ms": sum(durations) / len(durations),
+            "errors": sum(1 for r in records if r.get("error")),
+        })
+    return summary
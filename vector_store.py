@@ -0,0 +1,198 @@
+"""
+Format bazy wiedzy RAG bez pickle, wczytywany przez mapowanie pamięci (mmap).
+
+Katalog VECTOR_STORE_PATH zawiera:
+    vectors.npy   - macierz embeddingów float32 (n x d), mapowana do pamięci
+    norms.npy     - kwadraty norm wektorów (do odległości L2), mapowane do pamięci
+    texts.bin     - treści fragmentów (UTF-8) sklejone jeden za drugim
+    offsets.npy   - przesunięcia fragmentów w texts.bin (n + 1 liczb int64)
+    metadata.json - metadane jako kolumny kodowane słownikowo (źródło, strona itd.)
+
+Wczytanie nie kopiuje danych: strony plików są współdzielone w page cache przez
+wszystkie procesy serwera, a treść fragmentu jest odczytywana dopiero wtedy,
+gdy trafi do top-k wyników. Wyszukiwanie to dokładne L2, jak w IndexFlatL2 z FAISS.
+
+Konwersja istniejącego indeksu FAISS (jednorazowo, wymaga zaufanego index.pkl):
+    python vector_store.py convert [FAISS_INDEX_PATH] [VECTOR_STORE_PATH]
+"""
+import json
+import mmap
+import os
+import sys
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+
+from rag_config import FAISS_INDEX_PATH, VECTOR_STORE_PATH
+
+
+def store_exists(path):
+    return all(
+        os.path.exists(os.path.join(path, name))
+        for name in ("vectors.npy", "norms.npy", "texts.bin", "offsets.npy", "metadata.json")
+    )
+
+
+def _encode_metadata(metadatas):
+    """Zamienia listę słowników metadanych na kolumny {klucz: {"values": unikalne, "codes": indeksy}}."""
+    keys = []
+    for metadata in metadatas:
+        for key in metadata:
+            if key not in keys:
+                keys.append(key)
+
+    columns = {}
+    for key in keys:
+        values = []
+        positions = {}
+        codes = []
+        for metadata in metadatas:
+            if key not in metadata:
+                codes.append(-1)
+                continue
+            value = metadata[key]
+            marker = json.dumps(value, sort_keys=True, ensure_ascii=False, default=str)
+            if marker not in positions:
+                positions[marker] = len(values)
+                values.append(value)
+            codes.append(positions[marker])
+        columns[key] = {"values": values, "codes": codes}
+    return {"count": len(metadatas), "columns": columns}
+
+
+def write_store(path, texts, metadatas, vectors):
+    """Zapisuje fragmenty, metadane i embeddingi w formacie MmapVectorStore."""
+    os.makedirs(path, exist_ok=True)
+    vectors = np.ascontiguousarray(np.asarray(vectors, dtype=np.float32))
+    if vectors.shape[0] != len(texts) or len(texts) != len(metadatas):
+        raise ValueError("Liczba wektorów, tekstów i metadanych musi być taka sama.")
+
+    np.save(os.path.join(path, "vectors.npy"), vectors)
+    np.save(os.path.join(path, "norms.npy"), np.einsum("ij,ij->i", vectors, vectors).astype(np.float32))
+
+    offsets = np.zeros(len(texts) + 1, dtype=np.int64)
+    with open(os.path.join(path, "texts.bin"), "wb") as f:
+        for i, text in enumerate(texts):
+            data = text.encode("utf-8")
+            f.write(data)
+            offsets[i + 1] = offsets[i] + len(data)
+    np.save(os.path.join(path, "offsets.npy"), offsets)
+
+    with open(os.path.join(path, "metadata.json"), "w", encoding="utf-8") as f:
+        json.dump(_encode_metadata(metadatas), f, ensure_ascii=False, separators=(",", ":"))
+
+
+class MmapVectorStore(VectorStore):
+    """
+    Tylko do odczytu: wektory i teksty pozostają w plikach mapowanych do pamięci.
+    Zgodny z interfejsem VectorStore z LangChain, więc działa z `as_retriever()`.
+    """
+
+    def __init__(self, path, embedding):
+        self.path = path
+        self.embedding = embedding
+        self._vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+        self._norms = np.load(os.path.join(path, "norms.npy"), mmap_mode="r")
+        self._offsets = np.load(os.path.join(path, "offsets.npy"), mmap_mode="r")
+        with open(os.path.join(path, "texts.bin"), "rb") as f:
+            # Pusty plik nie może być zmapowany
+            self._texts = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size else b""
+        with open(os.path.join(path, "metadata.json"), encoding="utf-8") as f:
+            self._metadata = json.load(f)["columns"]
+
+    @classmethod
+    def load(cls, path, embedding):
+        return cls(path, embedding)
+
+    @property
+    def embeddings(self):
+        return self.embedding
+
+    def __len__(self):
+        return self._vectors.shape[0]
+
+    def _document(self, i):
+        start, end = int(self._offsets[i]), int(self._offsets[i + 1])
+        text = bytes(self._texts[start:end]).decode("utf-8")
+        metadata = {}
+        for key, column in self._metadata.items():
+            code = column["codes"][i]
+            if code >= 0:
+                metadata[key] = column["values"][code]
+        return Document(page_content=text, metadata=metadata)
+
+    def search_vectors(self, query_vectors, k=4):
+        """
+        Wyszukuje k najbliższych (L2) fragmentów dla każdego wektora zapytania.
+        Zwraca (odległości, indeksy), jak `faiss.Index.search`.
+        """
+        queries = np.atleast_2d(np.asarray(query_vectors, dtype=np.float32))
+        k = min(k, len(self))
+        if k == 0:
+            return np.empty((len(queries), 0), dtype=np.float32), np.empty((len(queries), 0), dtype=np.int64)
+        # ||q - x||^2 = ||q||^2 - 2 q.x + ||x||^2, w jednym mnożeniu macierzy
+        distances = self._norms[None, :] - 2.0 * (queries @ self._vectors.T)
+        distances += np.einsum("ij,ij->i", queries, queries)[:, None]
+        top = np.argpartition(distances, k - 1, axis=1)[:, :k]
+        top_distances = np.take_along_axis(distances, top, axis=1)
+        order = np.argsort(top_distances, axis=1)
+        return np.take_along_axis(top_distances, order, axis=1), np.take_along_axis(top, order, axis=1)
+
+    def search_batch(self, query_vectors, k=4):
+        """Wyszukiwanie dla wielu zapytań naraz: lista list (dokument, odległość), po jednej na zapytanie."""
+        distances, indices = self.search_vectors(query_vectors, k)
+        return [
+            [(self._document(int(i)), float(d)) for d, i in zip(row_distances, row_indices)]
+            for row_distances, row_indices in zip(distances, indices)
+        ]
+
+    def similarity_search_with_score_by_vector(self, embedding, k=4, **kwargs):
+        return self.search_batch(embedding, k)[0]
+
+    def similarity_search_by_vector(self, embedding, k=4, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k, **kwargs)]
+
+    def similarity_search_with_score(self, query, k=4, **kwargs):
+        return self.similarity_search_with_score_by_vector(self.embedding.embed_query(query), k, **kwargs)
+
+    def similarity_search(self, query, k=4, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, **kwargs)]
+
+    def _select_relevance_score_fn(self):
+        # Ta sama funkcja co w FAISS dla odległości euklidesowej
+        return self._euclidean_relevance_score_fn
+
+    def add_texts(self, texts, metadatas=None, **kwargs):
+        raise NotImplementedError("MmapVectorStore jest tylko do odczytu - użyj prepare_rag_data.py.")
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, **kwargs):
+        raise NotImplementedError("MmapVectorStore jest tylko do odczytu - użyj write_store().")
+
+
+def convert_faiss_index(faiss_path=FAISS_INDEX_PATH, out_path=VECTOR_STORE_PATH):
+    """Przepisuje indeks zapisany przez FAISS.save_local do formatu MmapVectorStore."""
+    from langchain_community.vectorstores import FAISS
+
+    # Embeddingi nie są potrzebne do odczytu zapisanych wektorów
+    vector_store = FAISS.load_local(faiss_path, None, allow_dangerous_deserialization=True)
+    count = vector_store.index.ntotal
+    vectors = vector_store.index.reconstruct_n(0, count)
+    documents = [vector_store.docstore.search(vector_store.index_to_docstore_id[i]) for i in range(count)]
+    write_store(
+        out_path,
+        [doc.page_content for doc in documents],
+        [doc.metadata for doc in documents],
+        vectors,
+    )
+    print(f"Zapisano {count} fragmentów w {out_path}.")
+    return count
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2 and sys.argv[1] == "convert":
+        convert_faiss_index(*sys.argv[2:4])
+    else:
+        print(__doc__)
+        sys.exit(1)
@@ -0,0 +1,169 @@
+"""
+Rozgrzewanie zasobów RAG przy starcie serwera, zanim pojawi się pierwszy uczestnik.
+
+Warmup wykonuje po kolei etapy (np. wczytanie modelu embeddingów, bazy wiedzy,
+zbudowanie łańcuchów, próbne wyszukiwanie) w wątku w tle i zapisuje stan
+("cold", "warming", "warm", "failed") oraz czas każdego etapu w pliku
+WARMUP_STATUS_PATH. Streamlit nie ma punktu startu serwera, więc app.py uruchamia
+go przy pierwszym przebiegu skryptu w procesie (pierwsze wejście na dowolną
+stronę, także sonda ?health); dyskowe cache można rozgrzać wcześniej poleceniem
+poniżej. Stan jest widoczny pod adresem aplikacji z parametrem ?health.
+
+Użycie z wiersza poleceń:
+    python warmup.py            - rozgrzewa dyskowe cache (pobranie modelu, strony indeksu) przed startem aplikacji
+    python warmup.py --status   - wypisuje stan; kod wyjścia 0 tylko przy "warm" (sonda gotowości)
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+WARMUP_STATUS_PATH = os.environ.get("VINCENT_WARMUP_STATUS", "data/warmup_status.json")
+
+# Zapytanie do próbnego embeddingu i wyszukiwania
+WARMUP_QUERY = "Jak radzić sobie z porażką i krytyką wobec siebie?"
+
+
+class Warmup:
+    """Wykonuje etapy rozgrzewania po kolei i udostępnia ich stan. `stages` to lista (nazwa, funkcja)."""
+
+    def __init__(self, stages, status_path=WARMUP_STATUS_PATH):
+        self.stages = list(stages)
+        self.status_path = status_path
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._thread = None
+        self._status = {
+            "state": "cold",
+            "pid": os.getpid(),
+            "started_at": None,
+            "finished_at": None,
+            "total_s": None,
+            "stages": {name: None for name, _ in self.stages},
+            "error": None,
+        }
+
+    def status(self):
+        with self._lock:
+            return json.loads(json.dumps(self._status))
+
+    def is_ready(self):
+        return self.status()["state"] == "warm"
+
+    def wait(self, timeout=None, stages=None):
+        """
+        Czeka na koniec rozgrzewania albo tylko etapów `stages` (nazwy), najdłużej `timeout` s.
+        Zwraca True, jeśli wszystkie oczekiwane etapy się udały.
+        """
+        names = [name for name, _ in self.stages] if stages is None else list(stages)
+
+        def finished():
+            return self._status["state"] in ("warm", "failed") or all(self._status["stages"].get(name) for name in names)
+
+        with self._changed:
+            self._changed.wait_for(finished, timeout)
+            return all((self._status["stages"].get(name) or {}).get("ok") for name in names)
+
+    def _update(self, **changes):
+        with self._changed:
+            self._status.update(changes)
+            self._changed.notify_all()
+            snapshot = json.loads(json.dumps(self._status))
+        self._write(snapshot)
+
+    def _write(self, snapshot):
+        if not self.status_path:
+            return
+        try:
+            directory = os.path.dirname(self.status_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{self.status_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(snapshot, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.status_path)
+        except OSError as e:
+            print(f"Nie udało się zapisać stanu rozgrzewania: {e}")
+
+    def run(self):
+        start = time.perf_counter()
+        self._update(state="warming", started_at=time.strftime("%Y-%m-%d %H:%M:%S"))
+        for name, stage in self.stages:
+            stage_start = time.perf_counter()
+            try:
+                stage()
+            except Exception as e:
+                print(f"Rozgrzewanie: etap {name} nie powiódł się: {e}")
+                stages = {**self.status()["stages"], name: {"duration_s": round(time.perf_counter() - stage_start, 3), "ok": False}}
+                self._update(state="failed", stages=stages, error=f"{name}: {type(e).__name__}: {e}",
+                             finished_at=time.strftime("%Y-%m-%d %H:%M:%S"), total_s=round(time.perf_counter() - start, 3))
+                return False
+            duration = time.perf_counter() - stage_start
+            print(f"Rozgrzewanie: {name} w {duration:.2f} s.")
+            self._update(stages={**self.status()["stages"], name: {"duration_s": round(duration, 3), "ok": True}})
+
+        self._update(state="warm", finished_at=time.strftime("%Y-%m-%d %H:%M:%S"), total_s=round(time.perf_counter() - start, 3))
+        return True
+
+    def start(self):
+        """Uruchamia rozgrzewanie w wątku w tle (tylko raz)."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.run, name="rag-warmup", daemon=True)
+            self._thread.start()
+        return self
+
+
+def default_stages():
+    """Etapy bez Streamlit: ładują to, co trafia do dyskowych cache (model, strony indeksu)."""
+    resources = {}
+
+    def import_rag():
+        import rag
+
+        resources["rag"] = rag
+
+    def embedding_model():
+        resources["embedding_model"] = resources["rag"].load_embedding_model()
+
+    def vector_store():
+        resources["vector_store"] = resources["rag"].load_vector_store(resources["embedding_model"])
+        if resources["vector_store"] is None:
+            raise RuntimeError("Indeks FAISS nie został znaleziony - uruchom najpierw prepare_rag_data.py.")
+
+    def embed_search():
+        resources["vector_store"].similarity_search(WARMUP_QUERY, k=4)
+
+    return [
+        ("rag_import", import_rag),
+        ("embedding_model", embedding_model),
+        ("vector_store", vector_store),
+        ("embed_search", embed_search),
+    ]
+
+
+def read_status(path=WARMUP_STATUS_PATH):
+    if not os.path.exists(path):
+        return {"state": "cold"}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rozgrzewanie zasobów RAG i sonda gotowości.")
+    parser.add_argument("--status", action="store_true", help="Tylko wypisz stan rozgrzewania aplikacji.")
+    args = parser.parse_args(argv)
+
+    if args.status:
+        status = read_status()
+        print(json.dumps(status, ensure_ascii=False, indent=2))
+        return 0 if status.get("state") == "warm" else 1
+
+    # Bez zapisu stanu - plik opisuje rozgrzewanie działającej aplikacji
+    ok = Warmup(default_stages(), status_path=None).run()
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())